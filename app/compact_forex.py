@@ -0,0 +1,23 @@
+"""
+Remove duplicate forex rates stored before the unique (pair, date) index and
+create the index, once per database:
+
+    python compact_forex.py
+"""
+
+from db import Base, SessionLocal, engine
+from services.market_data_services import compact_forex
+
+
+def main():
+    Base.metadata.create_all(bind=engine)
+    db = SessionLocal()
+    try:
+        removed = compact_forex(db)
+    finally:
+        db.close()
+    print(f"Removed {removed} duplicate forex rates")
+
+
+if __name__ == "__main__":
+    main()
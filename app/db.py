@@ -1,5 +1,7 @@
-from sqlalchemy import create_engine, text
+from sqlalchemy import create_engine, insert, text
+from sqlalchemy.dialects import postgresql, sqlite
 from sqlalchemy.orm import sessionmaker, declarative_base
+import io
 import os
 import time
 from dotenv import load_dotenv
@@ -33,3 +35,47 @@ def wait_for_db(engine, retries=10):
         except Exception:
             time.sleep(1)
     raise RuntimeError("Database not ready")
+
+
+def upsert_insert(db, table):
+    """
+    INSERT of the database dialect (PostgreSQL or SQLite), it has
+    on_conflict_do_update and on_conflict_do_nothing.
+    """
+    if db.get_bind().dialect.name == "postgresql":
+        return postgresql.insert(table)
+    return sqlite.insert(table)
+
+
+def bulk_insert(db, table, rows, batch_rows=10000):
+    """
+    Insert the rows of a DataFrame (columns named like the table's) in the
+    session's transaction: COPY FROM STDIN on PostgreSQL, batches of
+    `batch_rows` Core inserts (executemany) otherwise. Missing values are NULL,
+    columns without any value are left out of the insert.
+    """
+    rows = rows.loc[:, rows.notna().any()]
+    if rows.empty:
+        return
+    if db.get_bind().dialect.name == "postgresql":
+        buffer = io.StringIO()
+        rows.to_csv(buffer, index=False, header=False)
+        buffer.seek(0)
+        cursor = db.connection().connection.cursor()
+        try:
+            cursor.copy_expert(
+                f"COPY {table.name} ({', '.join(rows.columns)}) "
+                "FROM STDIN WITH (FORMAT csv)",
+                buffer,
+            )
+        finally:
+            cursor.close()
+        return
+
+    columns = rows.columns.tolist()
+    rows = rows.astype(object).where(rows.notna(), None)
+    records = [
+        dict(zip(columns, row)) for row in rows.itertuples(index=False, name=None)
+    ]
+    for start in range(0, len(records), batch_rows):
+        db.execute(insert(table), records[start : start + batch_rows])
@@ -1,14 +1,12 @@
 from fastapi import FastAPI
 from db import engine, Base, get_db, wait_for_db
-from routes import portfolio, inflation, equities, forex, reference_rate
+from routes import portfolio, inflation, equities, forex, reference_rate, health
 from contextlib import asynccontextmanager
 from sqlalchemy.orm import Session
-from services.inflation_service import load_inflation_from_custom_csv
-from services.reference_rate_service import load_reference_rate_from_custom_csv
-from services.market_data_services import (
-    import_all_equities_once,
-    import_all_forex_once,
-)
+from services.bond_pricing_service import shutdown_process_pool
+from services.portfolio_upload_service import upgrade_asset_merge_key
+from services.import_job_service import resume_import_jobs, shutdown_import_workers
+from services.bootstrap_service import start_bootstrap
 
 
 @asynccontextmanager
@@ -17,13 +15,15 @@ async def lifespan(app: FastAPI):
     Base.metadata.create_all(bind=engine)
 
     db: Session = next(get_db())
-    load_inflation_from_custom_csv(db, "data/inflation.csv")
-    load_reference_rate_from_custom_csv(db, "data/reference_rate_NBP.csv")
-    import_all_equities_once(db)
-    import_all_forex_once(db)
-
+    upgrade_asset_merge_key(db)
+    resume_import_jobs(db)
     db.close()
+
+    # market data is loaded in the background, see /health/ready
+    start_bootstrap()
     yield
+    shutdown_process_pool()
+    shutdown_import_workers()
 
 
 app = FastAPI(title="Financial Markets API", docs_url="/", lifespan=lifespan)
@@ -33,3 +33,4 @@ app.include_router(equities.router)
 app.include_router(inflation.router)
 app.include_router(reference_rate.router)
 app.include_router(forex.router)
+app.include_router(health.router)
@@ -1,7 +1,24 @@
-from sqlalchemy import Column, Integer, String, Float, DateTime, Text
+from sqlalchemy import (
+    Column,
+    Integer,
+    String,
+    Float,
+    Date,
+    DateTime,
+    Text,
+    Index,
+    func,
+    literal_column,
+    UniqueConstraint,
+)
 from db import Base
 
 
+def _trade_day(context):
+    date = context.get_current_parameters().get("date")
+    return date.date() if date is not None else None
+
+
 class Asset(Base):
     __tablename__ = "assets"
     id = Column(Integer, primary_key=True, index=True)
@@ -15,6 +32,25 @@ class Asset(Base):
     type_ = Column(String)
     coupon_rate = Column(Float)
     inflation_first_year = Column(Float)
+    # day of `date`, transactions of one day are merged into one asset
+    trade_day = Column(Date, default=_trade_day)
+
+
+# merge key of assets, empty values are coalesced so they conflict like equal ones
+# (literal values, ON CONFLICT has to match the expressions of the index)
+_NO_TEXT = literal_column("''")
+_NO_RATE = literal_column("-1.0")
+ASSET_MERGE_KEY = (
+    Asset.isin,
+    func.coalesce(Asset.name, _NO_TEXT),
+    func.coalesce(Asset.currency, _NO_TEXT),
+    func.coalesce(Asset.currency_transaction, _NO_TEXT),
+    Asset.type_,
+    func.coalesce(Asset.coupon_rate, _NO_RATE),
+    func.coalesce(Asset.inflation_first_year, _NO_RATE),
+    Asset.trade_day,
+)
+asset_merge_key_index = Index("uq_assets_merge_key", *ASSET_MERGE_KEY, unique=True)
 
 
 class Inflation(Base):
@@ -72,3 +108,68 @@ class Forex(Base):
     second_currency = Column(String, index=True)
     value = Column(Float, index=True)
     date = Column(DateTime, index=True)
+
+
+# one rate of a pair per date, tables created without it get it from compact_forex
+forex_pair_date_index = Index(
+    "uq_forex_pair_date",
+    Forex.first_currency,
+    Forex.second_currency,
+    Forex.date,
+    unique=True,
+)
+
+
+class Price(Base):
+    __tablename__ = "prices"
+    __table_args__ = (UniqueConstraint("symbol", "date", name="uq_prices_symbol_date"),)
+    id = Column(Integer, primary_key=True, index=True)
+    symbol = Column(String, nullable=False)
+    date = Column(Date, nullable=False)
+    close = Column(Float)
+    currency = Column(String)
+
+
+class SymbolCurrency(Base):
+    __tablename__ = "symbol_currencies"
+    id = Column(Integer, primary_key=True, index=True)
+    symbol = Column(String, unique=True, nullable=False)
+    currency = Column(String)
+
+
+class BondSchedule(Base):
+    __tablename__ = "bond_schedule"
+    id = Column(Integer, primary_key=True, index=True)
+    asset_id = Column(Integer, index=True)
+    period = Column(Integer)
+    start_date = Column(DateTime)
+    end_date = Column(DateTime)
+    days = Column(Integer)
+    # month of inflation used by the period, empty for the first year and fixed rate bonds
+    inflation_year = Column(Integer)
+    inflation_month = Column(Integer)
+
+
+class ImportJob(Base):
+    __tablename__ = "import_jobs"
+    id = Column(Integer, primary_key=True, index=True)
+    filename = Column(String)
+    # stored copy of the uploaded file, removed when the job ends
+    path = Column(String)
+    size = Column(Integer)
+    chunk_rows = Column(Integer)
+    # queued, running, done or failed
+    status = Column(String, index=True)
+    message = Column(Text)
+    created_at = Column(DateTime)
+    started_at = Column(DateTime)
+    finished_at = Column(DateTime)
+    # progress, committed together with every chunk
+    bytes_read = Column(Integer)
+    processing_seconds = Column(Float, default=0)
+    rows = Column(Integer, default=0)
+    inserted = Column(Integer, default=0)
+    updated = Column(Integer, default=0)
+    error_count = Column(Integer, default=0)
+    # JSON list of reported row errors
+    errors = Column(Text)
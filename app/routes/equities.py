@@ -3,11 +3,13 @@ from sqlalchemy.orm import Session
 from typing import Optional
 from db import get_db
 from models import Equity
+from services.bootstrap_service import require_datasets
+from services.isin_resolver import isin_resolver
 
 router = APIRouter(prefix="/equities", tags=["Equities"])
 
 
-@router.get("/list")
+@router.get("/list", dependencies=[Depends(require_datasets("equities"))])
 def list_equities(limit: int = 100, offset: int = 0, db: Session = Depends(get_db)):
     """
     List equities with limit and offset.
@@ -99,6 +101,7 @@ def add_equity(
     db.add(equity)
     db.commit()
     db.refresh(equity)
+    isin_resolver.invalidate(equity.isin)
 
     return {
         "status": "success",
@@ -135,6 +138,7 @@ def delete_equity(
 
     db.delete(equity)
     db.commit()
+    isin_resolver.invalidate(equity.isin)
 
     return {
         "status": "success",
@@ -144,7 +148,7 @@ def delete_equity(
     }
 
 
-@router.get("/get_symbol")
+@router.get("/get_symbol", dependencies=[Depends(require_datasets("equities"))])
 def get_symbol_from_isin(isin: str, db: Session = Depends(get_db)):
     """
     Return symbol for isin in db equities.
@@ -152,9 +156,4 @@ def get_symbol_from_isin(isin: str, db: Session = Depends(get_db)):
     if isin is None:
         raise HTTPException(status_code=400, detail="Need isin input")
 
-    records = db.query(Equity).filter_by(isin=isin).all()
-
-    if not records:
-        return []
-
-    return [r.symbol for r in records]
+    return [symbol for symbol, _ in isin_resolver.resolve(db, isin)]
@@ -1,29 +1,71 @@
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Depends, HTTPException, Query
 from sqlalchemy.orm import Session
 from db import get_db
 from models import Forex
 from datetime import timedelta
-import math
+import numpy as np
+import pandas as pd
+from services.bootstrap_service import require_datasets
 from utils.date_utils import parse_date
 
 router = APIRouter(prefix="/forex", tags=["Forex"])
 
+# pandas period of every resampling interval
+INTERVALS = {"week": "W", "month": "M"}
+AGGREGATIONS = ("last", "mean", "ohlc")
+FORMATS = ("rows", "columnar")
 
-@router.get("/list")
+
+def _resample(rates: pd.Series, interval: str, agg: str) -> pd.DataFrame:
+    """
+    One row per week or month (labelled with its first day), periods without
+    rates are left out.
+    """
+    periods = rates.index.to_period(INTERVALS[interval])
+    grouped = rates.groupby(periods)
+    if agg == "ohlc":
+        frame = grouped.agg(["first", "max", "min", "last"])
+        frame.columns = ["open", "high", "low", "close"]
+    else:
+        frame = grouped.agg(agg).to_frame("value")
+    frame.index = frame.index.start_time
+    return frame
+
+
+@router.get("/list", dependencies=[Depends(require_datasets("forex"))])
 def list_forex(
     first_currency: str,
     second_currency: str,
     start_date: str = None,
     end_date: str = None,
+    interval: str | None = None,
+    agg: str = "last",
+    format_: str = Query("rows", alias="format"),
     db: Session = Depends(get_db),
 ):
     """
     List all forex records in the database for the given currency pair.
     Optional: start_date, end_date
+    With `interval=week|month` rates are resampled to one per period with
+    `agg=last|mean|ohlc` (open, high, low and close instead of value).
+    With `format=columnar` the result is one array per field
+    (`{"dates": [...], "values": [...]}`) instead of a list of rows.
     """
+    if interval is not None and interval not in INTERVALS:
+        raise HTTPException(
+            status_code=400, detail="interval must be 'week' or 'month'"
+        )
+    if agg not in AGGREGATIONS:
+        raise HTTPException(
+            status_code=400, detail="agg must be 'last', 'mean' or 'ohlc'"
+        )
+    if format_ not in FORMATS:
+        raise HTTPException(
+            status_code=400, detail="format must be 'rows' or 'columnar'"
+        )
 
     query = (
-        db.query(Forex)
+        db.query(Forex.date, Forex.value)
         .filter(Forex.first_currency == first_currency.upper())
         .filter(Forex.second_currency == second_currency.upper())
     )
@@ -41,9 +83,26 @@ def list_forex(
     if not records:
         raise HTTPException(status_code=404, detail="No records for this currency pair")
 
-    result = []
-    for r in records:
-        if r.value is None or math.isnan(r.value) or math.isinf(r.value):
-            continue
-        result.append({"date": r.date.date().isoformat(), "value": r.value})
-    return result
+    dates, values = zip(*records)
+    values = np.array(values, dtype=float)
+    finite = np.isfinite(values)
+    rates = pd.Series(values[finite], index=pd.DatetimeIndex(np.array(dates)[finite]))
+
+    if interval is None:
+        frame = rates.to_frame("value")
+    else:
+        frame = _resample(rates, interval, agg)
+
+    days = frame.index.strftime("%Y-%m-%d").tolist()
+    if format_ == "columnar":
+        columns = {"dates": days}
+        for column in frame.columns:
+            key = "values" if column == "value" else column
+            columns[key] = frame[column].tolist()
+        return columns
+
+    fields = frame.columns.tolist()
+    return [
+        {"date": day, **dict(zip(fields, row))}
+        for day, row in zip(days, frame.itertuples(index=False, name=None))
+    ]
@@ -0,0 +1,23 @@
+from typing import Annotated
+
+from db import get_db
+from fastapi import APIRouter, Depends
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse
+from services.bootstrap_service import readiness
+from sqlalchemy.orm import Session
+
+router = APIRouter(prefix="/health", tags=["Health"])
+
+
+@router.get("/ready")
+def ready(db: Annotated[Session, Depends(get_db)]):
+    """
+    Readiness of the app: 200 when every dataset (inflation, reference rates,
+    equities, forex) is loaded, 503 otherwise. Lists the bootstrap status of
+    every dataset.
+    """
+    state = readiness(db)
+    return JSONResponse(
+        content=jsonable_encoder(state), status_code=200 if state["ready"] else 503
+    )
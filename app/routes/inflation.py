@@ -3,14 +3,16 @@ from sqlalchemy.orm import Session
 from typing import Optional
 from db import get_db
 from models import Inflation
-from services.inflation_service import get_inflation_for_month
+from services.bootstrap_service import require_datasets
+from services.inflation_service import get_inflation_for_month, inflation_index
+from services.valuation_cache import bond_value_cache
 import time
 import math
 
 router = APIRouter(prefix="/inflation", tags=["Inflation"])
 
 
-@router.get("/list")
+@router.get("/list", dependencies=[Depends(require_datasets("inflation"))])
 def list_inflation(db: Session = Depends(get_db)):
     """
     List all inflation records in the database.
@@ -75,6 +77,8 @@ def add_inflation(
     db.add(inflation)
     db.commit()
     db.refresh(inflation)
+    inflation_index.invalidate()
+    bond_value_cache.invalidate_month(year, month)
 
     return {
         "message": "Inflation added successfully",
@@ -95,6 +99,8 @@ def delete_inflation(inflation_id: int, db: Session = Depends(get_db)):
 
     db.delete(inflation)
     db.commit()
+    inflation_index.invalidate()
+    bond_value_cache.invalidate_month(inflation.year, inflation.month)
     return {
         "status": "success",
         "message": f"Inflation with id {inflation_id} deleted year: {inflation.year}, month: {inflation.month}, value: {inflation.value}",
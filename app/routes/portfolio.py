@@ -1,34 +1,105 @@
-from fastapi import APIRouter, Depends, HTTPException, UploadFile, File
+from fastapi import (
+    APIRouter,
+    Depends,
+    HTTPException,
+    UploadFile,
+    File,
+    Query,
+    Response,
+)
+from fastapi.responses import StreamingResponse
+from sqlalchemy import select
 from sqlalchemy.orm import Session
-from db import get_db
-from models import Asset
-from datetime import datetime, timedelta
-from typing import Optional
-from services.bond_pricing_service import calculate_value_of_bond
+from db import get_db, SessionLocal
+from models import Asset, ImportJob
+from datetime import UTC, datetime, timedelta
+from typing import Annotated, Optional
+from services.bond_pricing_service import (
+    VALUATION_WORKERS,
+    calculate_value_of_bond,
+    calculate_value_of_bonds,
+    calculate_bond_value_series,
+    calculate_bond_scenarios,
+)
+from services.inflation_service import (
+    GusRateLimited,
+    last_published_month,
+    simulate_inflation_paths,
+)
 from services.market_data_services import (
-    get_current_price_from_yfinance,
     get_forex_rate,
 )
-from routes.equities import get_symbol_from_isin
-from utils.date_utils import parse_date
-from utils.bond_utils import validate_bond_fields
+from services.price_service import get_price
+from services.portfolio_valuation_service import calculate_portfolio_value
+from services.valuation_cache import bond_value_cache
+from services.bond_schedule_service import (
+    save_bond_schedules,
+    delete_bond_schedule,
+    get_bond_schedules,
+)
+from services.portfolio_upload_service import (
+    UPLOAD_CHUNK_ROWS,
+    normalize_portfolio,
+    save_portfolio,
+    upsert_assets,
+    iter_portfolio_chunks,
+    import_portfolio,
+)
+from services.import_job_service import create_import_job, import_job_status
+from services.isin_resolver import isin_resolver
+from services.bootstrap_service import ensure_asset_datasets, require_datasets
+from utils.date_utils import parse_date, month_index
+from utils.bond_utils import validate_bond_fields, FLOATING_RATE_BONDS
+import json
 import pandas as pd
-from math import isfinite
+import numpy as np
+from math import isfinite, isnan
 
 router = APIRouter(prefix="/assets", tags=["Portfolio"])
 
 
 @router.post("/upload")
-def upload_portfolio(file: UploadFile = File(...), db: Session = Depends(get_db)):
+def upload_portfolio(
+    file: Annotated[UploadFile, File()],
+    db: Annotated[Session, Depends(get_db)],
+    stream: bool = False,
+    async_: Annotated[bool, Query(alias="async")] = False,
+    chunk_rows: int = UPLOAD_CHUNK_ROWS,
+):
     """
     Upload a portfolio file (Excel or CSV) to the database.
     Transactions on the same day with the same attributes (ISIN, currency, type, coupon_rate)
     are merged into a single record to save space.
+
+    With `stream=true` the file is read, merged and committed in chunks of `chunk_rows`
+    rows, invalid rows are reported and the valid ones are kept.
+
+    With `async=true` the file is stored and imported like with `stream=true` by a
+    background job, its id is returned at once and the job is polled with
+    `/assets/jobs/{id}`.
     """
     if not (file.filename.endswith(".xlsx") or file.filename.endswith(".csv")):
         raise HTTPException(
             status_code=400, detail="Unsupported file type. Use Excel or CSV."
         )
+    if chunk_rows < 1:
+        raise HTTPException(status_code=400, detail="chunk_rows must be at least 1")
+
+    if async_:
+        job = create_import_job(db, file.file, file.filename, chunk_rows)
+        return {"status": job.status, "job_id": job.id}
+
+    if stream:
+        result = import_portfolio(
+            db, iter_portfolio_chunks(file.file, file.filename, chunk_rows)
+        )
+        failed = result["error_count"] or "read_error" in result
+        return {
+            "status": "partial" if failed else "success",
+            "message": f"{result['rows'] - result['error_count']} of {result['rows']} assets uploaded",
+            **result,
+        }
+
     try:
         if file.filename.endswith(".xlsx"):
             df = pd.read_excel(file.file)
@@ -37,85 +108,32 @@ def upload_portfolio(file: UploadFile = File(...), db: Session = Depends(get_db)
     except Exception as e:
         raise HTTPException(status_code=400, detail=f"Error reading file: {e}")
 
-    for _, row in df.iterrows():
-        isin = row["ISIN"].upper()
-        name = row["NAME"]
-        amount = row["QUANTITY"]
-        date = row["DATE"]
-        transaction_price = row["TRANSACTION PRICE"]
-        currency = row.get("CURRENCY", None)
-        currency_transaction = row.get("CURRENCY TRANSACTION")
-        type_ = row.get("TYPE", None)
-        coupon_rate = row.get("COUPON RATE (%)", None)
-        inflation_first_year = row.get("INFLATION_FIRST_YEAR", None)
-
-        coupon_rate, inflation_first_year = validate_bond_fields(
-            type_=type_,
-            isin=isin,
-            coupon_rate=coupon_rate,
-            inflation_first_year=inflation_first_year,
-        )
-
-        transaction_date = parse_date(date)
-        start_of_day = datetime(
-            transaction_date.year, transaction_date.month, transaction_date.day
-        )
-        end_of_day = start_of_day + timedelta(days=1)
-        coupon_rate = (
-            (
-                round(coupon_rate / 100, 4)
-                if coupon_rate and coupon_rate >= 1
-                else coupon_rate
-            )
-            if coupon_rate is not None
-            else None
-        )
-        inflation_first_year = (
-            (
-                round(inflation_first_year / 100, 4)
-                if inflation_first_year and inflation_first_year >= 1
-                else inflation_first_year
-            )
-            if inflation_first_year is not None
-            else None
+    assets, errors = normalize_portfolio(df)
+    if errors:
+        error = errors[0]
+        raise HTTPException(
+            status_code=400,
+            detail=f"{error['error']} ({error['isin']}, row {error['row']})",
         )
-        type_ = type_.upper()
+    inserted, updated = save_portfolio(db, assets)
+    return {
+        "status": "success",
+        "message": f"{len(df)} assets uploaded",
+        "inserted": inserted,
+        "updated": updated,
+    }
 
-        asset = (
-            db.query(Asset)
-            .filter(
-                Asset.isin == isin.upper(),
-                Asset.name == name,
-                Asset.currency == currency,
-                Asset.currency_transaction == currency_transaction,
-                Asset.type_ == type_,
-                Asset.coupon_rate == coupon_rate,
-                Asset.inflation_first_year == inflation_first_year,
-                Asset.date >= start_of_day,
-                Asset.date < end_of_day,
-            )
-            .first()
-        )
 
-        if asset:
-            asset.amount += amount
-            asset.transaction_price += transaction_price
-        else:
-            asset = Asset(
-                isin=isin.upper(),
-                name=name,
-                date=transaction_date,
-                amount=amount,
-                transaction_price=transaction_price,
-                currency=currency,
-                currency_transaction=currency_transaction,
-                type_=type_,
-                coupon_rate=coupon_rate,
-                inflation_first_year=inflation_first_year,
-            )
-            db.add(asset)
-    db.commit()
-    return {"status": "success", "message": f"{len(df)} assets uploaded"}
+@router.get("/jobs/{job_id}")
+def get_import_job(job_id: int, db: Annotated[Session, Depends(get_db)]):
+    """
+    State of a background upload (`/assets/upload?async=true`): status, progress,
+    processed rows, rows per second and errors of invalid rows.
+    """
+    job = db.get(ImportJob, job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Import job not found")
+    return import_job_status(job)
 
 
 @router.post("/add")
@@ -149,10 +167,6 @@ def add_asset(
         inflation_first_year=inflation_first_year,
     )
 
-    start_of_day = datetime(
-        transaction_date.year, transaction_date.month, transaction_date.day
-    )
-    end_of_day = start_of_day + timedelta(days=1)
     coupon_rate = (
         (
             round(coupon_rate / 100, 4)
@@ -171,43 +185,35 @@ def add_asset(
         if inflation_first_year is not None
         else None
     )
-    type_ = type_.upper()
 
-    asset = (
-        db.query(Asset)
-        .filter(
-            Asset.isin == isin.upper(),
-            Asset.name == name,
-            Asset.type_ == type_,
-            Asset.currency == currency,
-            Asset.currency_transaction == currency_transaction,
-            Asset.coupon_rate == coupon_rate,
-            Asset.inflation_first_year == inflation_first_year,
-            Asset.date >= start_of_day,
-            Asset.date < end_of_day,
-        )
-        .first()
+    inserted, updated = upsert_assets(
+        db,
+        [
+            {
+                "isin": isin.upper(),
+                "name": name,
+                "amount": amount,
+                "date": transaction_date,
+                "trade_day": transaction_date.date(),
+                "transaction_price": transaction_price,
+                "currency": currency,
+                "currency_transaction": currency_transaction,
+                "type_": type_.upper(),
+                "coupon_rate": coupon_rate,
+                "inflation_first_year": inflation_first_year,
+            }
+        ],
+    )
+    save_bond_schedules(
+        db,
+        [
+            Asset(id=row.id, isin=row.isin, type_=row.type_, date=row.date)
+            for row in inserted
+        ],
     )
-
-    if asset:
-        asset.amount += amount
-        asset.transaction_price += transaction_price
-    else:
-        asset = Asset(
-            isin=isin.upper(),
-            name=name,
-            amount=amount,
-            date=transaction_date,
-            transaction_price=transaction_price,
-            currency=currency,
-            currency_transaction=currency_transaction,
-            type_=type_,
-            coupon_rate=coupon_rate,
-            inflation_first_year=inflation_first_year,
-        )
-        db.add(asset)
-
     db.commit()
+    for asset_id in updated:
+        bond_value_cache.invalidate_asset(asset_id)
     return {"status": "success", "message": "Asset added or updated"}
 
 
@@ -221,44 +227,120 @@ def delete_asset(asset_id: int, db: Session = Depends(get_db)):
         raise HTTPException(status_code=404, detail="Asset not found")
 
     db.delete(asset)
+    delete_bond_schedule(db, asset_id)
     db.commit()
+    bond_value_cache.invalidate_asset(asset_id)
     return {"status": "success", "message": f"Asset with id {asset_id} deleted"}
 
 
+# columns of /assets/list in the order of _asset_row
+LIST_COLUMNS = (
+    Asset.id,
+    Asset.isin,
+    Asset.name,
+    Asset.date,
+    Asset.amount,
+    Asset.transaction_price,
+    Asset.currency,
+    Asset.currency_transaction,
+    Asset.type_,
+    Asset.coupon_rate,
+    Asset.inflation_first_year,
+)
+LIST_MAX_LIMIT = 10000
+# rows fetched at once from the server-side cursor of a streamed list
+LIST_STREAM_BATCH = 1000
+
+
+def _float_or(value, default):
+    return default if value is None or isnan(value) else float(value)
+
+
+def _asset_row(row) -> dict:
+    return {
+        "id": row[0],
+        "symbol": row[1],
+        "name": row[2],
+        "date": row[3].isoformat() if row[3] else None,
+        "amount": _float_or(row[4], 0),
+        "transaction_price": _float_or(row[5], 0),
+        "currency": row[6],
+        "currency_transaction": row[7],
+        "type": row[8],
+        "coupon_rate": _float_or(row[9], None),
+        "inflation_first_year": _float_or(row[10], None),
+    }
+
+
+def _stream_assets(after_id: int | None, format_: str):
+    """
+    All assets after `after_id` as NDJSON lines or one JSON array, read from
+    a server-side cursor and sent in chunks of LIST_STREAM_BATCH rows, with own
+    session (the request session may be closed before the response ends).
+    """
+    db = SessionLocal()
+    try:
+        query = select(*LIST_COLUMNS).order_by(Asset.id)
+        if after_id is not None:
+            query = query.where(Asset.id > after_id)
+        batches = db.execute(
+            query.execution_options(yield_per=LIST_STREAM_BATCH)
+        ).partitions()
+        if format_ == "ndjson":
+            for rows in batches:
+                yield "".join(json.dumps(_asset_row(row)) + "\n" for row in rows)
+            return
+
+        yield "["
+        separator = ""
+        for rows in batches:
+            yield separator + ",".join(json.dumps(_asset_row(row)) for row in rows)
+            separator = ","
+        yield "]"
+    finally:
+        db.close()
+
+
 @router.get("/list")
-def list_assets(db: Session = Depends(get_db)):
+def list_assets(
+    response: Response,
+    db: Annotated[Session, Depends(get_db)],
+    after_id: int | None = None,
+    limit: int = 300,
+    stream: str | None = None,
+):
     """
-    List all assets in the database.
+    List assets in the database ordered by id, `limit` assets after `after_id`.
+    When more assets follow, header `X-Next-Cursor` holds `after_id` of the next page.
+
+    With `stream=ndjson` (one asset per line) or `stream=json` (one array) all assets
+    after `after_id` are streamed from a server-side cursor.
     """
-    assets = db.query(Asset).limit(300).all()
-    result = []
-    for a in assets:
-        result.append(
-            {
-                "id": a.id,
-                "symbol": a.isin,
-                "name": a.name,
-                "date": a.date.isoformat() if a.date else None,
-                "amount": float(a.amount)
-                if a.amount is not None and pd.notna(a.amount)
-                else 0,
-                "transaction_price": float(a.transaction_price)
-                if a.transaction_price is not None and pd.notna(a.transaction_price)
-                else 0,
-                "currency": a.currency,
-                "currency_transaction": a.currency_transaction,
-                "type": a.type_,
-                "coupon_rate": float(a.coupon_rate)
-                if a.coupon_rate is not None and pd.notna(a.coupon_rate)
-                else None,
-                "inflation_first_year": float(a.inflation_first_year)
-                if a.inflation_first_year is not None
-                and pd.notna(a.inflation_first_year)
-                else None,
-            }
+    if stream is not None:
+        if stream not in ("ndjson", "json"):
+            raise HTTPException(
+                status_code=400, detail="stream must be 'ndjson' or 'json'"
+            )
+        return StreamingResponse(
+            _stream_assets(after_id, stream),
+            media_type="application/x-ndjson"
+            if stream == "ndjson"
+            else "application/json",
         )
 
-    return result
+    if not 1 <= limit <= LIST_MAX_LIMIT:
+        raise HTTPException(
+            status_code=400, detail=f"limit must be between 1 and {LIST_MAX_LIMIT}"
+        )
+    query = db.query(*LIST_COLUMNS).order_by(Asset.id)
+    if after_id is not None:
+        query = query.filter(Asset.id > after_id)
+    # one more row tells whether a next page exists
+    rows = query.limit(limit + 1).all()
+    if len(rows) > limit:
+        rows = rows[:limit]
+        response.headers["X-Next-Cursor"] = str(rows[-1][0])
+    return [_asset_row(row) for row in rows]
 
 
 @router.get("/choices")
@@ -350,6 +432,7 @@ def calculate_asset_value(
             ),
         )
 
+    ensure_asset_datasets(db, [asset])
     try:
         if asset.type_.upper() == "BOND":
             value = calculate_value_of_bond(asset=asset, db=db, date=date_to_calculate)
@@ -365,11 +448,9 @@ def calculate_asset_value(
             currency = None
             value_per_unit = round(value / asset.amount, 4)
         elif asset.type_.upper() == "EQUITIES":
-            symbols = get_symbol_from_isin(asset.isin, db=db)
+            symbols = [symbol for symbol, _ in isin_resolver.resolve(db, asset.isin)]
             if len(symbols) == 1:
-                price_data = get_current_price_from_yfinance(
-                    symbols[0], target_date=date_to_calculate
-                )
+                price_data = get_price(db, symbols[0], target_date=date_to_calculate)
                 value_per_unit = price_data["price"]
                 currency = price_data["currency"]
                 if str(currency) != str(asset.currency):
@@ -391,6 +472,8 @@ def calculate_asset_value(
             value = asset.transaction_price or 0
             value_per_unit = value
             currency = asset.currency_transaction
+    except GusRateLimited:
+        raise
     except Exception as e:
         raise HTTPException(
             status_code=500,
@@ -412,3 +495,291 @@ def calculate_asset_value(
             "value_in_currency_per_unit": value_per_unit,
         }
     ]
+
+
+def _calculation_date(date_to_calculate: str):
+    """
+    Parsed date_to_calculate ('today' or a date, not in the future).
+    """
+    if date_to_calculate == "today":
+        return datetime.now(UTC).date()
+    try:
+        calc_date = parse_date(date_to_calculate).date()
+    except ValueError:
+        raise HTTPException(
+            status_code=400,
+            detail="date_to_calculate format should be YYYY-MM-DD or 'today'",
+        )
+    if calc_date > datetime.now(UTC).date():
+        raise HTTPException(
+            status_code=400,
+            detail=(
+                f"Cannot calculate value for {calc_date}. "
+                f"Today is: {datetime.now(UTC).date()}."
+            ),
+        )
+    return calc_date
+
+
+@router.get(
+    "/calc_bonds_value",
+    dependencies=[Depends(require_datasets("inflation", "reference_rate"))],
+)
+def calculate_bonds_value(
+    db: Annotated[Session, Depends(get_db)],
+    date_to_calculate: str | None = "today",
+):
+    """
+    Calculate value of all bonds for date=date_to_calculate if not entered date=today.
+
+    Large portfolios are split into chunks valued on VALUATION_WORKERS processes.
+    """
+    _calculation_date(date_to_calculate)
+
+    assets = db.query(Asset).filter(Asset.type_ == "BOND").order_by(Asset.id).all()
+    values = calculate_value_of_bonds(
+        assets, db=db, date=date_to_calculate, workers=VALUATION_WORKERS
+    )
+
+    for asset, value in zip(assets, values):
+        if value is None or not isfinite(value):
+            raise HTTPException(
+                status_code=500,
+                detail=f"Calculated bond value is not finite for {asset.isin}: {value}",
+            )
+
+    return {
+        "date_calc": date_to_calculate,
+        "total": round(sum(values), 4),
+        "assets": [
+            {
+                "id": asset.id,
+                "isin": asset.isin,
+                "name": asset.name,
+                "date_buy": asset.date,
+                "currency": asset.currency_transaction,
+                "amount": asset.amount,
+                "value_before": asset.transaction_price,
+                "value": value,
+            }
+            for asset, value in zip(assets, values)
+        ],
+    }
+
+
+@router.get("/calc_portfolio_value")
+def calculate_portfolio_value_endpoint(
+    db: Annotated[Session, Depends(get_db)],
+    date_to_calculate: str | None = "today",
+):
+    """
+    Calculate value of the whole portfolio for date=date_to_calculate if not entered date=today.
+
+    Market data is fetched in batches: symbols of all ISINs with one query, prices of
+    all symbols with one yfinance request and forex rates with one query. Returns
+    values of assets bought until the date and totals by currency and by type.
+    """
+    calc_date = _calculation_date(date_to_calculate)
+    assets = (
+        db.query(Asset)
+        .filter(
+            Asset.date
+            < datetime.combine(calc_date, datetime.min.time()) + timedelta(days=1)
+        )
+        .order_by(Asset.id)
+        .all()
+    )
+    ensure_asset_datasets(db, assets)
+    return calculate_portfolio_value(assets, db, date_to_calculate, calc_date)
+
+
+@router.get("/valuation_cache")
+def valuation_cache_stats():
+    """
+    Size and hit/miss counters of the bond valuation cache.
+    """
+    return bond_value_cache.stats()
+
+
+@router.get(
+    "/calc_value_series",
+    dependencies=[Depends(require_datasets("inflation", "reference_rate"))],
+)
+def calculate_asset_value_series(
+    start_date: str,
+    db: Annotated[Session, Depends(get_db)],
+    end_date: str | None = "today",
+    id: int | None = None,
+):
+    """
+    Calculate daily value of a bond for every day between start_date and end_date
+    (default today). Without `id` the series is calculated for all bonds.
+
+    Days before the bond was bought are skipped.
+    """
+    try:
+        start = parse_date(start_date).date()
+        end = (
+            datetime.now(UTC).date()
+            if end_date == "today"
+            else parse_date(end_date).date()
+        )
+    except ValueError:
+        raise HTTPException(
+            status_code=400,
+            detail="start_date and end_date format should be YYYY-MM-DD or 'today'",
+        )
+
+    if start > end:
+        raise HTTPException(
+            status_code=400, detail=f"start_date {start} is after end_date {end}"
+        )
+    if end > datetime.now(UTC).date():
+        raise HTTPException(
+            status_code=400,
+            detail=(
+                f"Cannot calculate value for {end}. "
+                f"Today is: {datetime.now(UTC).date()}."
+            ),
+        )
+
+    query = db.query(Asset).filter(Asset.type_ == "BOND")
+    if id:
+        query = query.filter(Asset.id == id)
+    assets = query.order_by(Asset.id).all()
+    if id and not assets:
+        raise HTTPException(status_code=404, detail=f"Bond with id {id} not found")
+
+    result = []
+    for asset in assets:
+        dates, values = calculate_bond_value_series(
+            asset, db=db, start_date=max(start, asset.date.date()), end_date=end
+        )
+        if not all(isfinite(value) for value in values):
+            raise HTTPException(
+                status_code=500,
+                detail=f"Calculated bond value is not finite for {asset.isin}",
+            )
+        result.append(
+            {
+                "id": asset.id,
+                "isin": asset.isin,
+                "name": asset.name,
+                "currency": asset.currency_transaction,
+                "amount": asset.amount,
+                "values": [
+                    {"date": date.isoformat(), "value": value}
+                    for date, value in zip(dates.tolist(), values.tolist())
+                ],
+            }
+        )
+
+    return result
+
+
+@router.post(
+    "/calc_bonds_scenarios",
+    dependencies=[Depends(require_datasets("inflation", "reference_rate"))],
+)
+def calculate_bonds_scenarios(
+    db: Annotated[Session, Depends(get_db)],
+    file: Annotated[UploadFile | None, File()] = None,
+    date_to_calculate: str = "maturity",
+    paths: int = 1000,
+    seed: int | None = None,
+    percentiles: str = "5,50,95",
+    id: int | None = None,
+):
+    """
+    Value bonds under many monthly inflation paths and return mean and percentiles
+    of values, per bond and for the whole portfolio. By default every bond is valued
+    at its maturity (date_to_calculate="maturity").
+
+    Without a file `paths` paths are simulated from the inflation table.
+    An uploaded CSV (no header) holds one path per row and one month per column
+    (0.035 = 3.5%), the first column is the month after the last published one.
+    """
+    try:
+        levels = [float(level) for level in percentiles.split(",")]
+    except ValueError:
+        raise HTTPException(
+            status_code=400, detail="percentiles should be numbers like 5,50,95"
+        )
+    if not all(0 <= level <= 100 for level in levels):
+        raise HTTPException(
+            status_code=400, detail="percentiles should be between 0 and 100"
+        )
+
+    query = db.query(Asset).filter(Asset.type_ == "BOND")
+    if id:
+        query = query.filter(Asset.id == id)
+    assets = query.order_by(Asset.id).all()
+    if id and not assets:
+        raise HTTPException(status_code=404, detail=f"Bond with id {id} not found")
+
+    first_month = last_published_month(db) + 1
+    if file is not None:
+        try:
+            scenarios = pd.read_csv(file.file, header=None).to_numpy(dtype=float)
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=f"Error reading file: {e}")
+        if scenarios.size == 0 or np.isnan(scenarios).any():
+            raise HTTPException(
+                status_code=400, detail="Inflation paths must be a full numeric matrix"
+            )
+    else:
+        if not 1 <= paths <= 100000:
+            raise HTTPException(
+                status_code=400, detail="paths should be between 1 and 100000"
+            )
+        yearly = [
+            asset for asset in assets if asset.isin[:3] not in FLOATING_RATE_BONDS
+        ]
+        if date_to_calculate == "maturity":
+            horizon = get_bond_schedules(db, yearly)[1].max() if yearly else None
+        elif date_to_calculate == "today":
+            horizon = np.datetime64(datetime.now(), "us")
+        else:
+            horizon = np.datetime64(parse_date(date_to_calculate), "us")
+        months = 1 if horizon is None else int(month_index(horizon)) - first_month + 1
+        first_month, scenarios = simulate_inflation_paths(
+            db, n_paths=paths, months=max(months, 1), seed=seed
+        )
+
+    values = calculate_bond_scenarios(
+        assets, db=db, paths=scenarios, first_month=first_month, date=date_to_calculate
+    )
+    if not np.isfinite(values).all():
+        raise HTTPException(
+            status_code=500, detail="Calculated bond values are not finite"
+        )
+
+    def summary(column: np.ndarray) -> dict:
+        return {
+            "mean": round(float(column.mean()), 4),
+            "percentiles": {
+                f"{level:g}": round(float(value), 4)
+                for level, value in zip(levels, np.percentile(column, levels))
+            },
+        }
+
+    year, month = divmod(first_month, 12)
+    return {
+        "date_calc": date_to_calculate,
+        "paths": len(scenarios),
+        "paths_start": f"{month + 1:02d}.{year}",
+        "total": summary(values.sum(axis=1)),
+        "assets": [
+            {
+                "id": asset.id,
+                "isin": asset.isin,
+                "name": asset.name,
+                "date_buy": asset.date,
+                "currency": asset.currency_transaction,
+                "amount": asset.amount,
+                "value_before": asset.transaction_price,
+                **summary(values[:, i]),
+            }
+            for i, asset in enumerate(assets)
+        ],
+    }
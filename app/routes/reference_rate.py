@@ -3,12 +3,15 @@ from sqlalchemy.orm import Session
 from typing import Optional
 from db import get_db
 from models import Reference_Rate
+from services.bootstrap_service import require_datasets
+from services.reference_rate_service import reference_rate_index
+from services.valuation_cache import bond_value_cache, REFERENCE_RATE
 import math
 
 router = APIRouter(prefix="/reference_rate", tags=["Reference_Rate"])
 
 
-@router.get("/list")
+@router.get("/list", dependencies=[Depends(require_datasets("reference_rate"))])
 def list_reference_rate(db: Session = Depends(get_db)):
     """
     List all reference rate records in the database.
@@ -59,6 +62,8 @@ def add_reference_rate(
     db.add(reference_rate)
     db.commit()
     db.refresh(reference_rate)
+    reference_rate_index.invalidate()
+    bond_value_cache.invalidate_dependency(REFERENCE_RATE)
 
     return {
         "message": "Reference Rate added successfully",
@@ -81,6 +86,8 @@ def delete_reference_rate(reference_rate_id: int, db: Session = Depends(get_db))
 
     db.delete(reference_rate)
     db.commit()
+    reference_rate_index.invalidate()
+    bond_value_cache.invalidate_dependency(REFERENCE_RATE)
     return {
         "status": "success",
         "message": f"Inflation with id {reference_rate.id} deleted year: {reference_rate.year}, month: {reference_rate.month}, value: {reference_rate.value}",
@@ -2,67 +2,50 @@ from fastapi import HTTPException
 from sqlalchemy.orm import Session
 from models import Asset
 import datetime
-from dateutil.relativedelta import relativedelta
-from services.inflation_service import get_inflation
+import logging
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+import numpy as np
+from services.inflation_service import (
+    GusApiError,
+    get_inflation,
+    inflation_index,
+    prefetch_inflation,
+)
+from services.reference_rate_service import reference_rate_index
+from services.monthly_index import MonthlySeries
+from services.valuation_cache import bond_value_cache, REFERENCE_RATE
+from services.bond_schedule_service import get_bond_schedules
 from requests.exceptions import HTTPError
-from utils.date_utils import parse_date
+from utils.date_utils import parse_date, add_months, days_between, month_index
+from utils.bond_utils import (
+    TAX,
+    DAYS_IN_YEAR,
+    INFLATION_LINKED_BONDS,
+    FIXED_RATE_BONDS,
+    FLOATING_RATE_BONDS,
+    FLOATING_MONTHS,
+    SUPPORTED_BONDS,
+    COMPOUNDING_BONDS,
+    MAX_PERIODS,
+)
 import math
 
+logger = logging.getLogger(__name__)
 
-def get_ots_days(date_start, valuation_date):
-    end_of_period = date_start + relativedelta(months=3)
-    if valuation_date < end_of_period:
-        return (valuation_date - date_start).days
-    else:
-        return (end_of_period - date_start).days
-
-
-def value_coi(
-    inflation: float, margin: float, days: float, value: int = 100, tax: float = 0.19
-) -> float:
-    if inflation < 0:
-        inflation = 0
-    rate = inflation + margin
-    interest = value * rate * days / 365.25
-    return interest * (1 - tax)
-
-
-def value_edo(inflation: float, margin: float, days: float, value: int = 100) -> float:
-    if inflation < 0:
-        inflation = 0
-    rate = inflation + margin
-    interest = value * rate * days / 365.25
-    return interest
-
-
-def value_ros(inflation: float, margin: float, days: float, value: int = 100) -> float:
-    if inflation < 0:
-        inflation = 0
-    rate = inflation + margin
-    interest = value * rate * days / 365.25
-    return interest
-
+VALUATION_WORKERS = int(os.getenv("VALUATION_WORKERS", str(os.cpu_count() or 1)))
+# smaller portfolios are valued in the request process
+VALUATION_MIN_CHUNK = int(os.getenv("VALUATION_MIN_CHUNK", "2000"))
+# inflation scenarios valued at once (memory grows with paths * bonds)
+SCENARIO_CHUNK_PATHS = int(os.getenv("SCENARIO_CHUNK_PATHS", "256"))
+# months searched back for inflation of the last, unfinished year
+FALLBACK_MONTHS = 12
 
-def value_rod(inflation: float, margin: float, days: float, value: int = 100) -> float:
-    if inflation < 0:
-        inflation = 0
-    rate = inflation + margin
-    interest = value * rate * days / 365.25
-    return interest
-
-
-def value_ots(margin: float, days: float, value: int = 100, tax: float = 0.19) -> float:
-    interest = value * margin * days / 365.25
-    return interest * (1 - tax)
-
-
-def value_tos(margin: float, days: float, value: int = 100) -> float:
-    interest = value * margin * days / 365.25
-    return interest
-
-
-def calculate_value_of_bond(asset: Asset, db: Session, date: str = "today"):
 
+def validate_bond_asset(asset: Asset):
     type_of_bond = asset.isin[:3]
 
     if asset.type_.upper() != "BOND":
@@ -71,7 +54,7 @@ def calculate_value_of_bond(asset: Asset, db: Session, date: str = "today"):
             detail=f"Wrong asset type for calculating bond value: {asset.isin}, {asset.name}, {asset.date}",
         )
 
-    if type_of_bond in ["COI", "EDO", "ROS", "ROD"] and (
+    if type_of_bond in INFLATION_LINKED_BONDS and (
         asset.coupon_rate is None or asset.inflation_first_year is None
     ):
         raise HTTPException(
@@ -79,314 +62,764 @@ def calculate_value_of_bond(asset: Asset, db: Session, date: str = "today"):
             detail=f"coupon_rate and inflation_first_year are required for {type_of_bond} bond {asset.isin}, {asset.name}",
         )
 
-    if type_of_bond in ["OTS", "TOS"] and asset.coupon_rate is None:
+    if type_of_bond in FLOATING_RATE_BONDS and (
+        asset.coupon_rate is None or asset.inflation_first_year is None
+    ):
         raise HTTPException(
             status_code=400,
-            detail=f"coupon_rate is required for {type_of_bond} bond {asset.isin}, {asset.name}",
+            detail=f"coupon_rate (margin) and inflation_first_year (fixed rate of the first month) are required for {type_of_bond} bond {asset.isin}, {asset.name}",
         )
 
-    date_start = asset.date
-    valuation_date = datetime.datetime.now() if date == "today" else parse_date(date)
-
-    if valuation_date <= date_start:
-        return asset.transaction_price
-
-    value = asset.transaction_price
-    days_since_purchase = (valuation_date - date_start).days
-
-    max_years = None
-    if type_of_bond == "COI":
-        max_years = 4
-    elif type_of_bond == "TOS":
-        max_years = 3
-    elif type_of_bond == "EDO":
-        max_years = 10
-    elif type_of_bond == "ROS":
-        max_years = 6
-    elif type_of_bond == "ROD":
-        max_years = 12
-
-    if max_years is not None:
-        max_end_date = date_start + relativedelta(years=max_years)
-        if valuation_date > max_end_date:
-            valuation_date = max_end_date
-            days_since_purchase = (valuation_date - date_start).days
-
-    if type_of_bond == "COI":
-        # COI term shorter than one year
-        if days_since_purchase <= 365.25:
-            value += value_coi(
-                inflation=asset.inflation_first_year,
-                margin=asset.coupon_rate,
-                value=asset.transaction_price,
-                days=days_since_purchase,
-            )
-            return value
-
-        # COI first year with input coupon_rate
-        value += value_coi(
-            inflation=asset.inflation_first_year,
-            margin=asset.coupon_rate,
-            value=asset.transaction_price,
-            days=365.25,
+    if type_of_bond in FIXED_RATE_BONDS and asset.coupon_rate is None:
+        raise HTTPException(
+            status_code=400,
+            detail=f"coupon_rate is required for {type_of_bond} bond {asset.isin}, {asset.name}",
         )
 
-        # COI after firsty year without last
-        current_date = date_start + relativedelta(years=1)
-        while current_date + relativedelta(years=1) <= valuation_date:
-            inflation = get_inflation(db, current_date.month, current_date.year)
-            value += value_coi(
-                inflation=inflation,
-                margin=asset.coupon_rate,
-                value=asset.transaction_price,
-                days=365.25,
-            )
-            current_date += relativedelta(years=1)
 
-        # COI last year
-        remaining_days = (valuation_date - current_date).days
-        if remaining_days > 0:
-            tmp_date = current_date
+def _month_to_date(key: int) -> str:
+    year, month = divmod(int(key), 12)
+    return f"{month + 1:02d}.{year}"
+
+
+def _resolve_inflation(db: Session, series: MonthlySeries, key: int, known: dict):
+    if key not in known:
+        year, month = divmod(int(key), 12)
+        value = series.get(month + 1, year)
+        # without a session (worker processes) missing months are not fetched
+        if value is None and db is not None:
+            value = get_inflation(db, month + 1, year)
+        known[key] = value
+    return known[key]
+
+
+def _resolve_inflation_with_fallback(
+    db: Session, series: MonthlySeries, key: int, known: dict
+):
+    """
+    Inflation for the last, unfinished year. If the month is not published yet,
+    take the latest known value from the previous 12 months. After a GUS error
+    the earlier months are only read from the index (they were prefetched).
+    """
+    for tries in range(FALLBACK_MONTHS):
+        try:
+            inflation = _resolve_inflation(db, series, key - tries, known)
+        except (GusApiError, HTTPError, ValueError):
+            known[key - tries] = None
             inflation = None
-            tries = 0
-            while (inflation is None or not math.isfinite(inflation)) and tries < 12:
-                try:
-                    inflation = get_inflation(db, tmp_date.month, tmp_date.year)
-                except (HTTPError, ValueError):
-                    inflation = None
-
-                if inflation is None or not math.isfinite(inflation):
-                    tmp_date -= relativedelta(months=1)
-                    tries += 1
-
-            if inflation is None or not math.isfinite(inflation):
-                raise HTTPException(
-                    status_code=500,
-                    detail=f"Inflation data missing for {current_date} and previous 12 months",
-                )
-
-            value += value_coi(
-                inflation=inflation,
-                margin=asset.coupon_rate,
-                value=asset.transaction_price,
-                days=remaining_days,
-            )
-        return value
-
-    elif type_of_bond == "EDO":
-        # EDO term shorter than one year
-        if days_since_purchase <= 365.25:
-            value += value_edo(
-                inflation=asset.inflation_first_year,
-                margin=asset.coupon_rate,
-                value=value,
-                days=days_since_purchase,
+            db = None
+        if inflation is not None and math.isfinite(inflation):
+            return inflation
+    return None
+
+
+def _inflation_for_months(
+    db: Session,
+    series: MonthlySeries,
+    keys: np.ndarray,
+    known: dict,
+    fallback: bool = False,
+) -> np.ndarray:
+    """
+    Inflation for month keys. Months already in the inflation index are read without
+    any SQL query, the missing ones go through get_inflation (GUS API).
+    With `fallback` missing months are replaced by the latest of previous 12 months.
+    """
+    values = series.lookup(keys)
+    for i in np.flatnonzero(np.isnan(values)):
+        if fallback:
+            value = _resolve_inflation_with_fallback(db, series, keys[i], known)
+        else:
+            value = _resolve_inflation(db, series, keys[i], known)
+        if value is None:
+            raise HTTPException(
+                status_code=500,
+                detail=f"Inflation data missing for {_month_to_date(keys[i])}"
+                + (" and previous 12 months" if fallback else ""),
             )
-            return value - ((value - asset.transaction_price) * 0.19)
+        values[i] = value
+    return values
+
+
+def _bond_periods(
+    assets: list[Asset],
+    db: Session,
+    valuation_date,
+) -> dict:
+    """
+    Split bonds into yearly periods (OTS has a single 3 months period): days of
+    interest of every period and inflation months (year * 12 + month - 1) the
+    periods start in. `valuation_date` is one date or an array with a date per bond.
+    """
+    valuation_date = np.asarray(valuation_date, dtype="datetime64[us]")
+
+    types = np.array([asset.isin[:3] for asset in assets])
+    date_start = np.array([asset.date for asset in assets], dtype="datetime64[us]")
+    price = np.array([asset.transaction_price for asset in assets], dtype=float)
+    margin = np.array(
+        [
+            asset.coupon_rate if asset.coupon_rate is not None else np.nan
+            for asset in assets
+        ],
+        dtype=float,
+    )
+    inflation_first_year = np.array(
+        [
+            asset.inflation_first_year
+            if asset.inflation_first_year is not None
+            else np.nan
+            for asset in assets
+        ],
+        dtype=float,
+    )
+
+    held = valuation_date > date_start
+    unsupported = held & ~np.isin(types, SUPPORTED_BONDS)
+    if unsupported.any():
+        raise HTTPException(status_code=400, detail="Bond type not supported.")
 
-        value += value_edo(
-            inflation=asset.inflation_first_year,
-            margin=asset.coupon_rate,
-            value=value,
-            days=365.25,
+    is_ots = types == "OTS"
+    inflation_linked = np.isin(types, INFLATION_LINKED_BONDS)
+    compounding = np.isin(types, COMPOUNDING_BONDS)
+
+    # period starts: purchase and anniversaries a_1..a_12 up to maturity
+    starts, maturity = get_bond_schedules(db, assets)
+    anniversaries = starts[:, 1:]
+    periods = np.arange(MAX_PERIODS - 1)
+
+    # bonds are not valued after maturity (OTS interest just stops after 3 months)
+    end_date = np.where(~is_ots & (valuation_date > maturity), maturity, valuation_date)
+    days_since_purchase = days_between(date_start, end_date)
+    ots_end = np.minimum(end_date, maturity)
+    first_year_only = (days_since_purchase <= DAYS_IN_YEAR) | is_ots
+
+    passed = (anniversaries <= end_date[:, None]).sum(axis=1)
+    last_period = np.where(first_year_only, 0, passed)
+    remaining_days = days_between(
+        anniversaries[np.arange(len(assets)), np.maximum(last_period - 1, 0)],
+        end_date,
+    )
+
+    days = np.zeros((len(assets), MAX_PERIODS))
+    days[:, 0] = np.where(
+        is_ots,
+        days_between(date_start, ots_end),
+        np.where(first_year_only, days_since_purchase, DAYS_IN_YEAR),
+    )
+    days[:, 1:] = np.where(
+        periods[None, :] + 1 < last_period[:, None], DAYS_IN_YEAR, 0.0
+    )
+    days[np.arange(len(assets)), last_period] = np.where(
+        first_year_only, days[:, 0], remaining_days
+    )
+    active = (days > 0) & held[:, None]
+
+    # inflation of the month in which the period starts
+    full_years = active[:, 1:] & inflation_linked[:, None]
+    full_years &= periods[None, :] + 1 < last_period[:, None]
+    last_year = active[:, 1:] & inflation_linked[:, None] & ~full_years
+
+    return {
+        "held": held,
+        "price": price,
+        "margin": margin,
+        "inflation_first_year": inflation_first_year,
+        "inflation_linked": inflation_linked,
+        "compounding": compounding,
+        "days": days,
+        "active": active,
+        "keys": month_index(anniversaries),
+        "full_years": full_years,
+        "last_year": last_year,
+    }
+
+
+def _accumulate_values(bonds: dict, inflation: np.ndarray) -> np.ndarray:
+    """
+    Value of bonds from inflation of their periods. `inflation` has shape
+    (..., bonds, MAX_PERIODS), leading dimensions (e.g. scenarios) are broadcast.
+    COI pays taxed simple interest every period, EDO/ROS/ROD/TOS compound and pay
+    tax on the whole gain, OTS pays taxed interest of its single period.
+    """
+    price = bonds["price"]
+    compounding = bonds["compounding"]
+    days = bonds["days"]
+    active = bonds["active"]
+
+    rate = np.where(
+        bonds["inflation_linked"][:, None],
+        np.maximum(inflation, 0) + bonds["margin"][:, None],
+        bonds["margin"][:, None],
+    )
+
+    value = np.broadcast_to(price, rate.shape[:-1]).copy()
+    for period in range(MAX_PERIODS):
+        base = np.where(compounding, value, price)
+        interest = base * rate[..., period] * days[:, period] / DAYS_IN_YEAR
+        interest = np.where(compounding, interest, interest * (1 - TAX))
+        value = np.where(active[:, period], value + interest, value)
+
+    value = np.where(compounding, value - ((value - price) * TAX), value)
+    return np.where(bonds["held"], value, price)
+
+
+def _value_yearly_bonds(
+    assets: list[Asset],
+    db: Session,
+    valuation_date: datetime.datetime,
+    series: MonthlySeries | None = None,
+) -> tuple[list[float], list[tuple[int, ...]]]:
+    """
+    Value bonds on NumPy arrays. Every bond is split into yearly periods (OTS has a
+    single 3 months period) and all periods of all bonds are valued together.
+    Returns values and inflation months (year * 12 + month - 1) every value depends on.
+    """
+    if series is None:
+        series = inflation_index.snapshot(db)
+
+    bonds = _bond_periods(assets, db, valuation_date)
+    keys = bonds["keys"]
+    full_years = bonds["full_years"]
+    last_year = bonds["last_year"]
+
+    # not published months of the last year depend on the previous 12 months
+    published = ~np.isnan(series.lookup(keys))
+    dependencies = [set() for _ in assets]
+    for row, column in zip(*np.nonzero(full_years | last_year)):
+        key = int(keys[row, column])
+        if full_years[row, column] or published[row, column]:
+            dependencies[row].add(key)
+        else:
+            dependencies[row].update(range(key - FALLBACK_MONTHS + 1, key + 1))
+
+    inflation = np.full((len(assets), MAX_PERIODS), np.nan)
+    inflation[:, 0] = bonds["inflation_first_year"]
+
+    known = {}
+    needed, position = np.unique(keys[full_years], return_inverse=True)
+    values = _inflation_for_months(db, series, needed, known)
+    inflation[:, 1:][full_years] = values[position]
+
+    needed, position = np.unique(keys[last_year], return_inverse=True)
+    values = _inflation_for_months(db, series, needed, known, fallback=True)
+    inflation[:, 1:][last_year] = values[position]
+
+    value = _accumulate_values(bonds, inflation)
+    return [float(v) for v in value], [tuple(months) for months in dependencies]
+
+
+def _floating_periods(
+    assets: list[Asset], valuation_date
+) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Monthly interest periods of ROR/DOR bonds: days of interest in every period up to
+    `valuation_date` (one date or a date per bond), month keys (year * 12 + month - 1)
+    the periods start in and whether the bond is held.
+    """
+    valuation_date = np.asarray(valuation_date, dtype="datetime64[us]")
+    date_start = np.array([asset.date for asset in assets], dtype="datetime64[us]")
+    months = np.array([FLOATING_MONTHS[asset.isin[:3]] for asset in assets])
+
+    # period starts counted from purchase (31.01 -> 28.02 -> 31.03) and maturity
+    starts = add_months(
+        date_start[:, None], np.arange(max(FLOATING_MONTHS.values()) + 1)[None, :]
+    )
+    maturity = starts[np.arange(len(assets)), months]
+    end_date = np.minimum(valuation_date, maturity)
+
+    period_start = starts[:, :-1]
+    period_end = np.minimum(starts[:, 1:], end_date[:, None])
+    in_term = np.arange(starts.shape[1] - 1)[None, :] < months[:, None]
+    days = np.where(
+        in_term & (period_start < period_end),
+        days_between(period_start, period_end),
+        0,
+    )
+    held = valuation_date > date_start
+    days[~held] = 0
+    return days, month_index(period_start), held
+
+
+def _value_floating_bonds(
+    assets: list[Asset],
+    db: Session,
+    valuation_date,
+    rates: MonthlySeries | None = None,
+) -> tuple[list[float], list[tuple]]:
+    """
+    Value ROR/DOR bonds. Interest is paid every month: the first month at the fixed
+    rate stored in inflation_first_year, next months at the NBP reference rate
+    in effect in the month the period starts plus margin (coupon_rate).
+    Interest is taxed when paid and not capitalised.
+    """
+    if rates is None:
+        rates = reference_rate_index.snapshot(db)
+
+    days, keys, held = _floating_periods(assets, valuation_date)
+    price = np.array([asset.transaction_price for asset in assets], dtype=float)
+    margin = np.array([asset.coupon_rate for asset in assets], dtype=float)
+    first_rate = np.array([asset.inflation_first_year for asset in assets], dtype=float)
+
+    rate = rates.lookup(keys) + margin[:, None]
+    rate[:, 0] = first_rate
+    missing = (days > 0) & np.isnan(rate)
+    if missing.any():
+        raise HTTPException(
+            status_code=500,
+            detail=f"Reference rate missing for {_month_to_date(keys[missing][0])}",
         )
 
-        # EDO after firsty year without last
-        current_date = date_start + relativedelta(years=1)
-        while current_date + relativedelta(years=1) <= valuation_date:
-            inflation = get_inflation(db, current_date.month, current_date.year)
-            value += value_edo(
-                inflation=inflation, margin=asset.coupon_rate, value=value, days=365.25
+    interest = np.where(days > 0, price[:, None] * rate * days / DAYS_IN_YEAR, 0.0)
+    value = price + (interest * (1 - TAX)).sum(axis=1)
+    values = [
+        float(value[i]) if held[i] else float(price[i]) for i in range(len(assets))
+    ]
+    return values, [(REFERENCE_RATE,) if h else () for h in held]
+
+
+def _value_bonds(
+    assets: list[Asset],
+    db: Session,
+    valuation_date: datetime.datetime,
+    series: MonthlySeries | None = None,
+    rates: MonthlySeries | None = None,
+) -> tuple[list[float], list[tuple]]:
+    """
+    Value bonds: yearly (COI/EDO/ROS/ROD/OTS/TOS) and monthly floating (ROR/DOR)
+    ones together. Returns values and what every value depends on: inflation months
+    (year * 12 + month - 1) or REFERENCE_RATE.
+    """
+    floating = [
+        i for i, asset in enumerate(assets) if asset.isin[:3] in FLOATING_RATE_BONDS
+    ]
+    if not floating:
+        return _value_yearly_bonds(assets, db, valuation_date, series)
+
+    floating_set = set(floating)
+    yearly = [i for i in range(len(assets)) if i not in floating_set]
+    values = [None] * len(assets)
+    dependencies = [None] * len(assets)
+    parts = [(floating, _value_floating_bonds, rates)]
+    if yearly:
+        parts.append((yearly, _value_yearly_bonds, series))
+    for indexes, value_bonds, snapshot in parts:
+        part_values, part_dependencies = value_bonds(
+            [assets[i] for i in indexes], db, valuation_date, snapshot
+        )
+        for i, value, depends_on in zip(indexes, part_values, part_dependencies):
+            values[i] = value
+            dependencies[i] = depends_on
+    return values, dependencies
+
+
+# fields of Asset sent to worker processes
+WORKER_ASSET_FIELDS = (
+    "isin",
+    "name",
+    "date",
+    "transaction_price",
+    "type_",
+    "coupon_rate",
+    "inflation_first_year",
+)
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+class WorkerPricingError(Exception):
+    """
+    HTTPException of a worker process (it can't be unpickled), raised again as
+    HTTPException in the request process.
+    """
+
+    def __init__(self, status_code: int, detail: str):
+        super().__init__(status_code, detail)
+        self.status_code = status_code
+        self.detail = detail
+
+
+def _process_pool() -> ProcessPoolExecutor:
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            # spawn, because forking a threaded server can copy held locks
+            _pool = ProcessPoolExecutor(
+                max_workers=VALUATION_WORKERS,
+                mp_context=multiprocessing.get_context("spawn"),
             )
-            current_date += relativedelta(years=1)
+        return _pool
+
+
+def _discard_process_pool(pool: ProcessPoolExecutor):
+    """
+    Drop a broken pool, the next parallel valuation starts a new one.
+    """
+    global _pool
+    with _pool_lock:
+        if _pool is pool:
+            _pool = None
+    pool.shutdown(wait=False, cancel_futures=True)
+
+
+def shutdown_process_pool():
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.shutdown(wait=False, cancel_futures=True)
+        _pool = None
+
+
+def _value_bonds_chunk(
+    rows: list[tuple],
+    valuation_date: datetime.datetime,
+    series: MonthlySeries,
+    rates: MonthlySeries,
+) -> tuple[list[float], list[tuple]]:
+    assets = [Asset(**dict(zip(WORKER_ASSET_FIELDS, row))) for row in rows]
+    try:
+        return _value_bonds(
+            assets, db=None, valuation_date=valuation_date, series=series, rates=rates
+        )
+    except HTTPException as e:
+        raise WorkerPricingError(e.status_code, e.detail) from None
+
+
+def _value_bonds_parallel(
+    assets: list[Asset],
+    db: Session,
+    valuation_date: datetime.datetime,
+    workers: int,
+    chunk_size: int | None = None,
+) -> tuple[list[float], list[tuple[int, ...]]]:
+    """
+    Value bonds in chunks on the process pool (VALUATION_WORKERS processes).
+    Every chunk gets plain asset rows and snapshots of the inflation and reference
+    rate series, pickled once per chunk. Pricing errors of a worker are raised as
+    in this process. When the pool itself fails (a worker died, processes can't be
+    started) it is replaced and the bonds are valued in this process.
+    """
+    series = inflation_index.snapshot(db)
+    rates = reference_rate_index.snapshot(db)
+    chunk_size = chunk_size or max(
+        VALUATION_MIN_CHUNK, math.ceil(len(assets) / workers)
+    )
+    if workers <= 1 or len(assets) <= chunk_size:
+        return _value_bonds(
+            assets, db=db, valuation_date=valuation_date, series=series, rates=rates
+        )
 
-        # EDO last year
-        remaining_days = (valuation_date - current_date).days
-        if remaining_days > 0:
-            tmp_date = current_date
-            inflation = None
-            tries = 0
-            while (inflation is None or not math.isfinite(inflation)) and tries < 12:
-                try:
-                    inflation = get_inflation(db, tmp_date.month, tmp_date.year)
-                except (HTTPError, ValueError):
-                    inflation = None
-
-                if inflation is None or not math.isfinite(inflation):
-                    tmp_date -= relativedelta(months=1)
-                    tries += 1
-
-            if inflation is None or not math.isfinite(inflation):
-                raise HTTPException(
-                    status_code=500,
-                    detail=f"Inflation data missing for {current_date} and previous 12 months",
-                )
-
-            value += value_edo(
-                inflation=inflation,
-                margin=asset.coupon_rate,
-                value=value,
-                days=remaining_days,
+    pool = _process_pool()
+    chunks = [
+        assets[start : start + chunk_size]
+        for start in range(0, len(assets), chunk_size)
+    ]
+    values, dependencies = [], []
+    try:
+        futures = [
+            pool.submit(
+                _value_bonds_chunk,
+                [
+                    tuple(getattr(asset, field) for field in WORKER_ASSET_FIELDS)
+                    for asset in chunk
+                ],
+                valuation_date,
+                series,
+                rates,
             )
+            for chunk in chunks
+        ]
+        for future in futures:
+            chunk_values, chunk_dependencies = future.result()
+            values.extend(chunk_values)
+            dependencies.extend(chunk_dependencies)
+    except WorkerPricingError as e:
+        raise HTTPException(status_code=e.status_code, detail=e.detail) from None
+    except (BrokenProcessPool, OSError) as e:
+        logger.warning("Bond valuation pool failed, valuing in process: %r", e)
+        _discard_process_pool(pool)
+        return _value_bonds(
+            assets, db=db, valuation_date=valuation_date, series=series, rates=rates
+        )
+    return values, dependencies
+
+
+def _prefetch_bond_inflation(
+    assets: list[Asset], db: Session, valuation_date: datetime.datetime
+):
+    """
+    Fetch inflation of all started periods of inflation linked bonds in one batch
+    (one GUS call per year), before they are valued. The 12 months before the last
+    started period are included, so its fallback reads them from the index instead
+    of asking GUS month by month.
+    """
+    linked = [asset for asset in assets if asset.isin[:3] in INFLATION_LINKED_BONDS]
+    if not linked:
+        return
+    starts, maturity = get_bond_schedules(db, linked)
+    end_date = np.minimum(np.datetime64(valuation_date, "us"), maturity)
+    anniversaries = starts[:, 1:]
+    started = anniversaries <= end_date[:, None]
+    keys = month_index(anniversaries)
+    last = started.sum(axis=1) - 1
+    with_last = last >= 0
+    last_keys = keys[with_last, last[with_last]]
+    fallback = last_keys[:, None] - np.arange(FALLBACK_MONTHS)
+    prefetch_inflation(db, np.concatenate([keys[started], fallback.ravel()]))
+
+
+def _valuation_date(date: str) -> datetime.datetime:
+    # "today" is the UTC date of the routes, valued at midnight like a date
+    # given without time
+    if date == "today":
+        today = datetime.datetime.now(datetime.UTC).date()
+        return datetime.datetime.combine(today, datetime.time())
+    return parse_date(date)
+
+
+def _cache_key(asset: Asset, valuation_date: datetime.datetime):
+    # asset fields are part of the key, so a changed row never reads a stale value
+    return (
+        asset.id,
+        asset.isin,
+        asset.type_,
+        asset.date,
+        asset.transaction_price,
+        asset.coupon_rate,
+        asset.inflation_first_year,
+        valuation_date,
+    )
+
+
+def calculate_value_of_bonds(
+    assets: list[Asset],
+    db: Session,
+    date: str = "today",
+    workers: int = 1,
+    chunk_size: int | None = None,
+) -> list[float]:
+    """
+    Calculate value of many bonds for one valuation date at once.
+    Values of stored assets are memoized in bond_value_cache, only the missing ones
+    are calculated (in one batch, or in chunks on `workers` processes).
+    """
+    for asset in assets:
+        validate_bond_asset(asset)
+
+    if not assets:
+        return []
+
+    valuation_date = _valuation_date(date)
+
+    values = [None] * len(assets)
+    keys = [None] * len(assets)
+    for i, asset in enumerate(assets):
+        if asset.id is not None:
+            keys[i] = _cache_key(asset, valuation_date)
+            values[i] = bond_value_cache.get(keys[i])
+
+    missing = [i for i, value in enumerate(values) if value is None]
+    if missing:
+        _prefetch_bond_inflation([assets[i] for i in missing], db, valuation_date)
+        calculated, dependencies = _value_bonds_parallel(
+            [assets[i] for i in missing],
+            db=db,
+            valuation_date=valuation_date,
+            workers=workers,
+            chunk_size=chunk_size,
+        )
+        for i, value, months in zip(missing, calculated, dependencies):
+            values[i] = value
+            if keys[i] is not None:
+                bond_value_cache.set(keys[i], value, assets[i].id, months)
 
-        value = value - ((value - asset.transaction_price) * 0.19)
-
-        return value
+    return values
 
-    elif type_of_bond == "ROS":
-        # ROS term shorter than one year
-        if days_since_purchase <= 365.25:
-            value += value_ros(
-                inflation=asset.inflation_first_year,
-                margin=asset.coupon_rate,
-                value=value,
-                days=days_since_purchase,
-            )
-            return value - ((value - asset.transaction_price) * 0.19)
 
-        value += value_ros(
-            inflation=asset.inflation_first_year,
-            margin=asset.coupon_rate,
-            value=value,
-            days=365.25,
+def calculate_value_of_bond(asset: Asset, db: Session, date: str = "today"):
+    return calculate_value_of_bonds([asset], db=db, date=date)[0]
+
+
+def calculate_bond_scenarios(
+    assets: list[Asset],
+    db: Session,
+    paths: np.ndarray,
+    first_month: int,
+    date: str = "maturity",
+    chunk_paths: int | None = None,
+) -> np.ndarray:
+    """
+    Value bonds under many monthly inflation paths at once.
+    paths[:, 0] is inflation of month `first_month` (year * 12 + month - 1), earlier
+    months are read from the inflation table. With date="maturity" every bond is
+    valued at its own maturity. Returns values of shape (paths, bonds).
+    """
+    for asset in assets:
+        validate_bond_asset(asset)
+
+    paths = np.asarray(paths, dtype=float)
+    if not assets:
+        return np.empty((len(paths), 0))
+
+    floating = [
+        i for i, asset in enumerate(assets) if asset.isin[:3] in FLOATING_RATE_BONDS
+    ]
+    if floating:
+        # ROR/DOR don't depend on inflation, the last reference rate holds in future
+        floating_set = set(floating)
+        yearly = [i for i in range(len(assets)) if i not in floating_set]
+        if date == "maturity":
+            valuation_date = np.datetime64("9999-12-31", "us")
+        else:
+            valuation_date = _valuation_date(date)
+        result = np.empty((len(paths), len(assets)))
+        result[:, floating] = _value_floating_bonds(
+            [assets[i] for i in floating], db, valuation_date
+        )[0]
+        result[:, yearly] = calculate_bond_scenarios(
+            [assets[i] for i in yearly], db, paths, first_month, date, chunk_paths
         )
+        return result
 
-        # ROS after firsty year without last
-        current_date = date_start + relativedelta(years=1)
-        while current_date + relativedelta(years=1) <= valuation_date:
-            inflation = get_inflation(db, current_date.month, current_date.year)
-            value += value_ros(
-                inflation=inflation, margin=asset.coupon_rate, value=value, days=365.25
-            )
-            current_date += relativedelta(years=1)
+    if date == "maturity":
+        valuation_date = get_bond_schedules(db, assets)[1]
+    else:
+        valuation_date = _valuation_date(date)
+
+    series = inflation_index.snapshot(db)
+    bonds = _bond_periods(assets, db, valuation_date)
+    keys = bonds["keys"]
+    used = bonds["full_years"] | bonds["last_year"]
+    simulated = used & (keys >= first_month)
+
+    # months before the paths are the same in every scenario
+    inflation = np.full((len(assets), MAX_PERIODS), np.nan)
+    inflation[:, 0] = bonds["inflation_first_year"]
+    known = {}
+    for periods, fallback in (
+        (bonds["full_years"] & ~simulated, False),
+        (bonds["last_year"] & ~simulated, True),
+    ):
+        needed, position = np.unique(keys[periods], return_inverse=True)
+        values = _inflation_for_months(db, series, needed, known, fallback=fallback)
+        inflation[:, 1:][periods] = values[position]
 
-        # ROS last year
-        remaining_days = (valuation_date - current_date).days
-        if remaining_days > 0:
-            tmp_date = current_date
-            inflation = None
-            tries = 0
-            while (inflation is None or not math.isfinite(inflation)) and tries < 12:
-                try:
-                    inflation = get_inflation(db, tmp_date.month, tmp_date.year)
-                except (HTTPError, ValueError):
-                    inflation = None
-
-                if inflation is None or not math.isfinite(inflation):
-                    tmp_date -= relativedelta(months=1)
-                    tries += 1
-
-            if inflation is None or not math.isfinite(inflation):
-                raise HTTPException(
-                    status_code=500,
-                    detail=f"Inflation data missing for {current_date} and previous 12 months",
-                )
-
-            value += value_ros(
-                inflation=inflation,
-                margin=asset.coupon_rate,
-                value=value,
-                days=remaining_days,
-            )
+    offsets = keys[simulated] - first_month
+    if offsets.size and offsets.max() >= paths.shape[1]:
+        raise HTTPException(
+            status_code=400,
+            detail=(
+                f"Inflation paths too short: {int(offsets.max()) + 1} months "
+                f"from {_month_to_date(first_month)} needed"
+            ),
+        )
 
-        value = value - ((value - asset.transaction_price) * 0.19)
+    chunk_paths = chunk_paths or SCENARIO_CHUNK_PATHS
+    result = np.empty((len(paths), len(assets)))
+    for start in range(0, len(paths), chunk_paths):
+        chunk = paths[start : start + chunk_paths]
+        scenarios = np.broadcast_to(inflation, (len(chunk),) + inflation.shape).copy()
+        scenarios[:, :, 1:][:, simulated] = chunk[:, offsets]
+        result[start : start + chunk_paths] = _accumulate_values(bonds, scenarios)
+    return result
+
+
+def calculate_bond_value_series(
+    asset: Asset, db: Session, start_date: datetime.date, end_date: datetime.date
+) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Calculate value of a bond for every day between start_date and end_date (inclusive).
+    Value at the start of every yearly period is calculated once and carried forward,
+    the days inside a period only add the interest of the unfinished year.
+    Returns dates and values, equal to calculate_value_of_bond for every single day.
+    """
+    validate_bond_asset(asset)
 
-        return value
+    type_of_bond = asset.isin[:3]
+    price = asset.transaction_price
+    margin = asset.coupon_rate
 
-    elif type_of_bond == "ROD":
-        # ROD term shorter than one year
-        if days_since_purchase <= 365.25:
-            value += value_rod(
-                inflation=asset.inflation_first_year,
-                margin=asset.coupon_rate,
-                value=value,
-                days=days_since_purchase,
-            )
-            return value - ((value - asset.transaction_price) * 0.19)
+    dates = np.arange(np.datetime64(start_date, "D"), np.datetime64(end_date, "D") + 1)
+    values = np.full(dates.size, price, dtype=float)
 
-        value += value_rod(
-            inflation=asset.inflation_first_year,
-            margin=asset.coupon_rate,
-            value=value,
-            days=365.25,
-        )
+    date_start = np.datetime64(asset.date, "us")
+    held = dates.astype("datetime64[us]") > date_start
+    if not held.any():
+        return dates, values
 
-        # ROD after firsty year without last
-        current_date = date_start + relativedelta(years=1)
-        while current_date + relativedelta(years=1) <= valuation_date:
-            inflation = get_inflation(db, current_date.month, current_date.year)
-            value += value_rod(
-                inflation=inflation, margin=asset.coupon_rate, value=value, days=365.25
-            )
-            current_date += relativedelta(years=1)
-
-        # ROD last year
-        remaining_days = (valuation_date - current_date).days
-        if remaining_days > 0:
-            tmp_date = current_date
-            inflation = None
-            tries = 0
-            while (inflation is None or not math.isfinite(inflation)) and tries < 12:
-                try:
-                    inflation = get_inflation(db, tmp_date.month, tmp_date.year)
-                except (HTTPError, ValueError):
-                    inflation = None
-
-                if inflation is None or not math.isfinite(inflation):
-                    tmp_date -= relativedelta(months=1)
-                    tries += 1
-
-            if inflation is None or not math.isfinite(inflation):
-                raise HTTPException(
-                    status_code=500,
-                    detail=f"Inflation data missing for {current_date} and previous 12 months",
-                )
-
-            value += value_rod(
-                inflation=inflation,
-                margin=asset.coupon_rate,
-                value=value,
-                days=remaining_days,
-            )
+    if type_of_bond not in SUPPORTED_BONDS:
+        raise HTTPException(status_code=400, detail="Bond type not supported.")
 
-        value = value - ((value - asset.transaction_price) * 0.19)
+    if type_of_bond in FLOATING_RATE_BONDS:
+        # monthly coupons: value every held day on its own
+        held_dates = dates[held].astype("datetime64[us]")
+        values[held] = _value_floating_bonds([asset] * held_dates.size, db, held_dates)[
+            0
+        ]
+        return dates, values
 
-        return value
+    starts, maturity = get_bond_schedules(db, [asset])
+    end = np.minimum(dates[held].astype("datetime64[us]"), maturity[0])
 
-    elif type_of_bond == "OTS":
+    if type_of_bond == "OTS":
         # OTS only last 3 months
-        days = get_ots_days(date_start, valuation_date)
-        value += value_ots(
-            margin=asset.coupon_rate, value=asset.transaction_price, days=days
+        days = days_between(date_start, end)
+        values[held] = price + price * margin * days / DAYS_IN_YEAR * (1 - TAX)
+        return dates, values
+
+    compounding = type_of_bond in COMPOUNDING_BONDS
+    anniversaries = starts[0, 1:]
+    first_year_only = days_between(date_start, end) <= DAYS_IN_YEAR
+    period = np.where(
+        first_year_only, 0, np.searchsorted(anniversaries, end, side="right")
+    )
+    period_start = np.where(
+        period > 0, anniversaries[np.maximum(period - 1, 0)], date_start
+    )
+    period_days = days_between(period_start, end)
+    last_period = int(period.max())
+
+    # rate of finished years and of the unfinished (last) year of every period
+    full_rate = np.full(MAX_PERIODS, margin, dtype=float)
+    last_rate = np.full(MAX_PERIODS, margin, dtype=float)
+    if type_of_bond in INFLATION_LINKED_BONDS:
+        keys = month_index(anniversaries)
+        known = {}
+        series = inflation_index.snapshot(db)
+        inflation = np.full(MAX_PERIODS, np.nan)
+        inflation[0] = asset.inflation_first_year
+        inflation[1 : max(last_period, 1)] = _inflation_for_months(
+            db, series, keys[: max(last_period - 1, 0)], known
         )
-        return value
-
-    elif type_of_bond == "TOS":
-        # TOS term shorter than one year
-        if days_since_purchase <= 365.25:
-            value += value_tos(
-                margin=asset.coupon_rate, value=value, days=days_since_purchase
-            )
-            return value - ((value - asset.transaction_price) * 0.19)
-
-        value += value_tos(margin=asset.coupon_rate, value=value, days=365.25)
-
-        # TOS after firsty year without last
-        current_date = date_start + relativedelta(years=1)
-        while current_date + relativedelta(years=1) <= valuation_date:
-            value += value_tos(margin=asset.coupon_rate, value=value, days=365.25)
-            current_date += relativedelta(years=1)
+        full_rate = np.maximum(inflation, 0) + margin
 
-        # TOS last year
-        remaining_days = (valuation_date - current_date).days
-        if remaining_days > 0:
-            value += value_tos(
-                margin=asset.coupon_rate, value=value, days=remaining_days
-            )
-
-        value = value - ((value - asset.transaction_price) * 0.19)
-
-        return value
-
-    else:
-        raise HTTPException(status_code=400, detail="Bond type not supported.")
+        unfinished = np.unique(period[(period_days > 0) & ~first_year_only])
+        inflation = np.full(MAX_PERIODS, np.nan)
+        inflation[unfinished] = _inflation_for_months(
+            db, series, keys[unfinished - 1], known, fallback=True
+        )
+        last_rate = np.maximum(inflation, 0) + margin
+    last_rate[0] = full_rate[0]
+
+    # value at the start of every period, carried forward year by year
+    start_value = np.empty(last_period + 1)
+    start_value[0] = price
+    for p in range(last_period):
+        base = start_value[p] if compounding else price
+        interest = base * full_rate[p]
+        if not compounding:
+            interest = interest * (1 - TAX)
+        start_value[p + 1] = start_value[p] + interest
+
+    base = start_value[period] if compounding else price
+    interest = base * last_rate[period] * period_days / DAYS_IN_YEAR
+    if not compounding:
+        interest = interest * (1 - TAX)
+    value = np.where(
+        period_days > 0, start_value[period] + interest, start_value[period]
+    )
+    if compounding:
+        value = value - ((value - price) * TAX)
+
+    values[held] = value
+    return dates, values
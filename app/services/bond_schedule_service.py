@@ -0,0 +1,166 @@
+import numpy as np
+from models import Asset, BondSchedule
+from sqlalchemy import insert
+from sqlalchemy.orm import Session
+from utils.bond_utils import (
+    FIXED_RATE_BONDS,
+    INFLATION_LINKED_BONDS,
+    MAX_PERIODS,
+    MAX_YEARS,
+    OTS_MONTHS,
+)
+from utils.date_utils import add_months, days_between
+
+# start of periods after maturity
+NO_PERIOD = np.datetime64("9999-12-31", "us")
+
+# asset id -> (asset date, bond type, period starts, maturity), shared by the process
+_schedules = {}
+
+
+def build_bond_schedules(assets: list[Asset]) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Calculate period starts (n, MAX_PERIODS) and maturity of bonds.
+    The first period starts at purchase, the next ones at anniversaries counted from
+    the first one (29.02 -> 28.02), periods after maturity start at NO_PERIOD.
+    OTS has a single 3 months period.
+    """
+    date_start = np.array([asset.date for asset in assets], dtype="datetime64[us]")
+    types = [asset.isin[:3] for asset in assets]
+    is_ots = np.array([t == "OTS" for t in types], dtype=bool)
+    max_years = np.array([MAX_YEARS.get(t, 0) for t in types])
+
+    maturity = np.where(
+        is_ots,
+        add_months(date_start, OTS_MONTHS),
+        add_months(date_start, 12 * max_years),
+    )
+    anniversaries = add_months(
+        add_months(date_start, 12)[:, None], 12 * np.arange(MAX_PERIODS - 1)[None, :]
+    )
+    anniversaries[(anniversaries > maturity[:, None]) | is_ots[:, None]] = NO_PERIOD
+    return np.concatenate([date_start[:, None], anniversaries], axis=1), maturity
+
+
+def bond_schedule_rows(assets: list[Asset]) -> list[dict]:
+    """
+    Rows of bond_schedule table for stored bond assets, one row per period.
+    A bond held to maturity ends with an empty period starting at maturity.
+    Monthly periods of ROR/DOR are not stored, they are calculated on the fly.
+    """
+    assets = [
+        asset
+        for asset in assets
+        if asset.type_.upper() == "BOND"
+        and asset.isin[:3] in INFLATION_LINKED_BONDS + FIXED_RATE_BONDS
+    ]
+    if not assets:
+        return []
+
+    starts, maturity = build_bond_schedules(assets)
+    rows = []
+    for i, asset in enumerate(assets):
+        period_starts = starts[i][starts[i] != NO_PERIOD]
+        period_ends = np.append(period_starts[1:], maturity[i])
+        days = days_between(period_starts, period_ends)
+        linked = asset.isin[:3] in INFLATION_LINKED_BONDS
+
+        for period, (start, end, period_days) in enumerate(
+            zip(period_starts.tolist(), period_ends.tolist(), days.tolist())
+        ):
+            uses_inflation = linked and period > 0
+            rows.append(
+                {
+                    "asset_id": asset.id,
+                    "period": period,
+                    "start_date": start,
+                    "end_date": end,
+                    "days": period_days,
+                    "inflation_year": start.year if uses_inflation else None,
+                    "inflation_month": start.month if uses_inflation else None,
+                }
+            )
+        _schedules[asset.id] = (asset.date, asset.isin[:3], starts[i], maturity[i])
+    return rows
+
+
+def save_bond_schedules(db: Session, assets: list[Asset]):
+    """
+    Store schedules of newly inserted assets (they need an id, so flush before)
+    with one bulk INSERT.
+    """
+    rows = bond_schedule_rows(assets)
+    if rows:
+        db.execute(insert(BondSchedule.__table__), rows)
+
+
+def delete_bond_schedule(db: Session, asset_id: int):
+    db.query(BondSchedule).filter(BondSchedule.asset_id == asset_id).delete()
+    _schedules.pop(asset_id, None)
+
+
+def get_bond_schedules(
+    db: Session, assets: list[Asset]
+) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Period starts and maturity of bonds. Schedules are read from memory, then from
+    bond_schedule table (one query), and built only for assets without stored rows.
+    """
+    starts = np.full((len(assets), MAX_PERIODS), NO_PERIOD)
+    maturity = np.full(len(assets), NO_PERIOD)
+
+    def cached(i, asset):
+        schedule = _schedules.get(asset.id)
+        if schedule is None or schedule[:2] != (asset.date, asset.isin[:3]):
+            return False
+        starts[i], maturity[i] = schedule[2], schedule[3]
+        return True
+
+    missing = [
+        i for i, asset in enumerate(assets) if asset.id is None or not cached(i, asset)
+    ]
+
+    stored_ids = [assets[i].id for i in missing if assets[i].id is not None]
+    if stored_ids:
+        rows = (
+            db.query(BondSchedule)
+            .filter(BondSchedule.asset_id.in_(stored_ids))
+            .order_by(BondSchedule.asset_id, BondSchedule.period)
+            .all()
+        )
+        periods = {}
+        for row in rows:
+            periods.setdefault(row.asset_id, []).append(row)
+        for i in missing:
+            asset = assets[i]
+            rows = periods.get(asset.id)
+            if not rows or rows[0].start_date != asset.date:
+                continue
+            asset_starts = np.full(MAX_PERIODS, NO_PERIOD)
+            asset_starts[: len(rows)] = [row.start_date for row in rows]
+            _schedules[asset.id] = (
+                asset.date,
+                asset.isin[:3],
+                asset_starts,
+                np.datetime64(rows[-1].end_date, "us"),
+            )
+        missing = [i for i in missing if not cached(i, assets[i])]
+
+    if missing:
+        built_starts, built_maturity = build_bond_schedules(
+            [assets[i] for i in missing]
+        )
+        starts[missing] = built_starts
+        maturity[missing] = built_maturity
+        for i, asset_starts, asset_maturity in zip(
+            missing, built_starts, built_maturity
+        ):
+            if assets[i].id is not None:
+                _schedules[assets[i].id] = (
+                    assets[i].date,
+                    assets[i].isin[:3],
+                    asset_starts,
+                    asset_maturity,
+                )
+
+    return starts, maturity
@@ -0,0 +1,179 @@
+import logging
+import threading
+from collections.abc import Iterable
+from datetime import datetime
+from typing import Annotated
+
+from db import SessionLocal, get_db
+from fastapi import Depends, HTTPException
+from models import Asset, Equity, Forex, Inflation, Reference_Rate
+from services.inflation_service import load_inflation_from_custom_csv
+from services.market_data_services import (
+    import_all_equities_once,
+    import_all_forex_once,
+)
+from services.reference_rate_service import load_reference_rate_from_custom_csv
+from services.snapshot_service import SNAPSHOT_PATH, import_snapshot
+from sqlalchemy.orm import Session
+
+logger = logging.getLogger(__name__)
+
+PENDING = "pending"
+LOADING = "loading"
+READY = "ready"
+FAILED = "failed"
+
+# seconds a client is asked to wait before retrying a request for missing data
+RETRY_AFTER = 30
+
+# dataset -> (table holding it, loader), loaded in this order
+DATASETS = {
+    "inflation": (
+        Inflation,
+        lambda db: load_inflation_from_custom_csv(db, "data/inflation.csv"),
+    ),
+    "reference_rate": (
+        Reference_Rate,
+        lambda db: load_reference_rate_from_custom_csv(
+            db, "data/reference_rate_NBP.csv"
+        ),
+    ),
+    "equities": (Equity, import_all_equities_once),
+    "forex": (Forex, import_all_forex_once),
+}
+# datasets needed to value an asset of a type
+ASSET_DATASETS = {
+    "BOND": ("inflation", "reference_rate"),
+    "EQUITIES": ("equities", "forex"),
+}
+
+
+def initial_state() -> dict:
+    return {
+        name: {
+            "status": PENDING,
+            "loaded": False,
+            "error": None,
+            "finished_at": None,
+            "snapshot_rows": None,
+            "snapshot_error": None,
+        }
+        for name in DATASETS
+    }
+
+
+_state = initial_state()
+_state_lock = threading.Lock()
+_thread: threading.Thread | None = None
+
+
+def _set_state(name: str, **values):
+    with _state_lock:
+        _state[name].update(values)
+
+
+def load_datasets():
+    """
+    Load every dataset with its own session, one after another. A failing
+    loader (e.g. a yfinance outage) is recorded and doesn't stop the others.
+    With SNAPSHOT_PATH an empty table is seeded from the snapshot first, the
+    loader then only adds what is missing. A broken snapshot is recorded too,
+    the loader still runs.
+    """
+    for name, (_, loader) in DATASETS.items():
+        _set_state(name, status=LOADING, error=None, snapshot_error=None)
+        db = SessionLocal()
+        try:
+            if SNAPSHOT_PATH:
+                try:
+                    rows = import_snapshot(db, SNAPSHOT_PATH, [name])[name]
+                    _set_state(name, snapshot_rows=rows)
+                except Exception as e:
+                    db.rollback()
+                    logger.warning(
+                        "Snapshot of %s not imported: %s", name, e, exc_info=True
+                    )
+                    _set_state(name, snapshot_error=str(e))
+            loader(db)
+            _set_state(name, status=READY, finished_at=datetime.now())
+        except Exception as e:
+            logger.exception("Loading %s failed", name)
+            db.rollback()
+            _set_state(name, status=FAILED, error=str(e), finished_at=datetime.now())
+        finally:
+            db.close()
+
+
+def start_bootstrap() -> threading.Thread:
+    """
+    Load market data in a background thread, so the app serves requests while
+    it is loading. Datasets already in the database are served meanwhile.
+    """
+    global _thread
+    _thread = threading.Thread(target=load_datasets, name="bootstrap", daemon=True)
+    _thread.start()
+    return _thread
+
+
+def dataset_ready(db: Session, name: str) -> bool:
+    """
+    A dataset is ready once its table has rows: loaded by the bootstrap now or
+    on an earlier start.
+    """
+    if _state[name]["loaded"]:
+        return True
+    model = DATASETS[name][0]
+    if db.query(model.id).first() is None:
+        return False
+    _set_state(name, loaded=True)
+    return True
+
+
+def readiness(db: Session) -> dict:
+    """
+    Bootstrap status of every dataset and whether all of them are ready.
+    """
+    datasets = {}
+    for name in DATASETS:
+        loaded = dataset_ready(db, name)
+        with _state_lock:
+            datasets[name] = {**_state[name], "loaded": loaded}
+    return {
+        "ready": all(dataset["loaded"] for dataset in datasets.values()),
+        "datasets": datasets,
+    }
+
+
+def ensure_datasets(db: Session, names: Iterable[str]):
+    """
+    Raise 503 (with Retry-After) when any of the datasets isn't loaded yet.
+    """
+    missing = [name for name in names if not dataset_ready(db, name)]
+    if missing:
+        raise HTTPException(
+            status_code=503,
+            detail=f"Data not loaded yet: {', '.join(missing)}. Try again later.",
+            headers={"Retry-After": str(RETRY_AFTER)},
+        )
+
+
+def ensure_asset_datasets(db: Session, assets: Iterable[Asset]):
+    """
+    `ensure_datasets` for the datasets needed to value assets of these types.
+    """
+    types = {(asset.type_ or "").upper() for asset in assets}
+    ensure_datasets(
+        db,
+        [name for type_ in sorted(types) for name in ASSET_DATASETS.get(type_, ())],
+    )
+
+
+def require_datasets(*names: str):
+    """
+    Route dependency answering 503 until the datasets are loaded.
+    """
+
+    def dependency(db: Annotated[Session, Depends(get_db)]):
+        ensure_datasets(db, names)
+
+    return dependency
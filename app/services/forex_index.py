@@ -0,0 +1,176 @@
+import datetime
+import threading
+
+import numpy as np
+from models import Forex
+from sqlalchemy.orm import Session
+
+ONE_DAY = np.timedelta64(1, "D")
+# currency every stored pair is quoted in (XXX/PLN), cross rates go through it
+PIVOT_CURRENCY = "PLN"
+
+
+class ForexSeries:
+    """
+    Rates of one currency pair: sorted NumPy arrays of dates and values.
+    """
+
+    def __init__(self, dates: np.ndarray, values: np.ndarray):
+        self.dates = dates
+        self.values = values
+
+    def lookup(self, days) -> np.ndarray:
+        """
+        As-of rates for an array of days: the last rate stored until the end of
+        every day (NaN before the first one).
+        """
+        ends = np.asarray(days, dtype="datetime64[D]") + ONE_DAY
+        positions = np.searchsorted(self.dates, ends, side="left") - 1
+        result = np.full(ends.shape, np.nan)
+        found = positions >= 0
+        result[found] = self.values[positions[found]]
+        return result
+
+    def inverse(self) -> "ForexSeries":
+        return ForexSeries(self.dates, 1 / self.values)
+
+    def cross(self, other: "ForexSeries") -> "ForexSeries":
+        """
+        Rates of this series divided by `other` at every date of either one,
+        each side taken as of that date (NaN before the first rate of a side).
+        """
+        dates = np.union1d(self.dates, other.dates)
+        return ForexSeries(dates, self._as_of(dates) / other._as_of(dates))
+
+    def _as_of(self, dates: np.ndarray) -> np.ndarray:
+        positions = np.searchsorted(self.dates, dates, side="right") - 1
+        result = np.full(dates.shape, np.nan)
+        found = positions >= 0
+        result[found] = self.values[positions[found]]
+        return result
+
+
+class ForexIndex:
+    """
+    Process-wide, in-memory copy of the forex table: a ForexSeries per pair, so
+    as-of lookups are a binary search instead of SQL queries. Loaded lazily with
+    one query and reloaded after `invalidate()` (called after a forex sync).
+    Pairs which are not stored are derived on first use and kept with the
+    loaded pairs: the inverse of a stored pair, or a cross rate through
+    PIVOT_CURRENCY (USD/EUR = USD/PLN / EUR/PLN).
+    """
+
+    def __init__(self):
+        self._pairs = None
+        self._lock = threading.Lock()
+
+    def load(self, db: Session) -> dict:
+        records = (
+            db.query(
+                Forex.first_currency, Forex.second_currency, Forex.date, Forex.value
+            )
+            .filter(Forex.value.isnot(None), Forex.date.isnot(None))
+            .order_by(Forex.first_currency, Forex.second_currency, Forex.date, Forex.id)
+            .all()
+        )
+        rows = {}
+        for first, second, date, value in records:
+            rows.setdefault((first, second), ([], []))
+            rows[(first, second)][0].append(date)
+            rows[(first, second)][1].append(value)
+
+        pairs = {
+            pair: ForexSeries(
+                np.array(dates, dtype="datetime64[us]"), np.array(values, dtype=float)
+            )
+            for pair, (dates, values) in rows.items()
+        }
+        with self._lock:
+            self._pairs = pairs
+        return pairs
+
+    def invalidate(self):
+        with self._lock:
+            self._pairs = None
+
+    def is_loaded(self) -> bool:
+        return self._pairs is not None
+
+    def snapshot(self, db: Session) -> dict:
+        pairs = self._pairs
+        if pairs is None:
+            pairs = self.load(db)
+        return pairs
+
+    def series(self, db: Session, first: str, second: str) -> ForexSeries | None:
+        """
+        The series of `first`/`second`: stored, inverse or cross rate through
+        PIVOT_CURRENCY, None when it can't be derived.
+        """
+        return self._series(self.snapshot(db), first.upper(), second.upper())
+
+    def _series(self, pairs: dict, first: str, second: str) -> ForexSeries | None:
+        key = (first, second)
+        if key in pairs:
+            return pairs[key]
+
+        series = None
+        if (second, first) in pairs and pairs[(second, first)] is not None:
+            series = pairs[(second, first)].inverse()
+        elif PIVOT_CURRENCY not in key:
+            to_pivot = self._series(pairs, first, PIVOT_CURRENCY)
+            from_pivot = self._series(pairs, second, PIVOT_CURRENCY)
+            if to_pivot is not None and from_pivot is not None:
+                series = to_pivot.cross(from_pivot)
+        # a derived pair is computed once per loaded snapshot
+        pairs[key] = series
+        return series
+
+    def rate(
+        self, db: Session, first: str, second: str, date: datetime.date
+    ) -> float | None:
+        """
+        The last rate of `first`/`second` on or before `date`, None when missing.
+        A pair of the same currency has rate 1.
+        """
+        first, second = first.upper(), second.upper()
+        if first == second:
+            return 1.0
+        series = self._series(self.snapshot(db), first, second)
+        if series is None:
+            return None
+        rate = series.lookup([date])[0]
+        return None if np.isnan(rate) else float(rate)
+
+    def rates(self, db: Session, firsts, seconds, dates) -> np.ndarray:
+        """
+        As-of rates of many (first, second, date) rows at once, NaN where missing.
+        """
+        pairs = self.snapshot(db)
+        firsts = np.char.upper(np.asarray(firsts, dtype=str))
+        seconds = np.char.upper(np.asarray(seconds, dtype=str))
+        days = np.asarray(dates, dtype="datetime64[D]")
+
+        result = np.full(days.shape, np.nan)
+        result[firsts == seconds] = 1.0
+        keys = np.char.add(np.char.add(firsts, "/"), seconds)
+        for key in np.unique(keys[firsts != seconds]):
+            series = self._series(pairs, *key.split("/"))
+            if series is not None:
+                rows = keys == key
+                result[rows] = series.lookup(days[rows])
+        return result
+
+    def convert(
+        self, db: Session, amounts, currencies, target: str, dates
+    ) -> np.ndarray:
+        """
+        Amounts in `currencies` converted to `target` with the as-of rate of
+        every row's date, NaN where a rate is missing.
+        """
+        currencies = np.asarray(currencies, dtype=str)
+        rates = self.rates(db, currencies, np.full(currencies.shape, target), dates)
+        return np.asarray(amounts, dtype=float) * rates
+
+
+forex_index = ForexIndex()
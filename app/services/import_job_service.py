@@ -0,0 +1,214 @@
+import json
+import logging
+import os
+import shutil
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import closing
+from datetime import datetime
+from typing import BinaryIO
+
+from db import SessionLocal
+from fastapi import HTTPException
+from models import ImportJob
+from services.portfolio_upload_service import import_portfolio, iter_portfolio_chunks
+from sqlalchemy.orm import Session
+
+logger = logging.getLogger(__name__)
+
+# uploaded files waiting for (or being read by) an import job
+IMPORT_DIR = os.getenv("IMPORT_DIR", "./imports")
+# background threads running import jobs
+IMPORT_WORKERS = int(os.getenv("IMPORT_WORKERS", "2"))
+
+QUEUED = "queued"
+RUNNING = "running"
+DONE = "done"
+FAILED = "failed"
+
+_executor: ThreadPoolExecutor | None = None
+_executor_lock = threading.Lock()
+
+
+def _import_executor() -> ThreadPoolExecutor:
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(
+                max_workers=IMPORT_WORKERS, thread_name_prefix="import"
+            )
+        return _executor
+
+
+def shutdown_import_workers():
+    """
+    Stop the worker pool without waiting, unfinished jobs stay queued or running
+    in the table and are resumed by `resume_import_jobs` on the next start.
+    """
+    global _executor
+    with _executor_lock:
+        if _executor is not None:
+            _executor.shutdown(wait=False, cancel_futures=True)
+        _executor = None
+
+
+def create_import_job(
+    db: Session, file: BinaryIO, filename: str, chunk_rows: int
+) -> ImportJob:
+    """
+    Store an uploaded file in IMPORT_DIR and queue a job importing it.
+    """
+    job = ImportJob(
+        filename=filename,
+        chunk_rows=chunk_rows,
+        status=QUEUED,
+        created_at=datetime.now(),
+    )
+    db.add(job)
+    db.flush()
+
+    os.makedirs(IMPORT_DIR, exist_ok=True)
+    job.path = os.path.join(IMPORT_DIR, f"{job.id}_{os.path.basename(filename)}")
+    with open(job.path, "wb") as stored:
+        shutil.copyfileobj(file, stored)
+    job.size = os.path.getsize(job.path)
+    db.commit()
+
+    _import_executor().submit(run_import_job, job.id)
+    return job
+
+
+def resume_import_jobs(db: Session) -> int:
+    """
+    Queue jobs interrupted by a restart again, a running job continues after
+    its last committed chunk. Returns the number of resumed jobs.
+    """
+    jobs = (
+        db.query(ImportJob.id)
+        .filter(ImportJob.status.in_((QUEUED, RUNNING)))
+        .order_by(ImportJob.id)
+        .all()
+    )
+    for job in jobs:
+        _import_executor().submit(run_import_job, job.id)
+    return len(jobs)
+
+
+def _finish(db: Session, job: ImportJob, status: str, message: str):
+    job.status = status
+    job.message = message
+    job.finished_at = datetime.now()
+    db.commit()
+    if job.path and os.path.exists(job.path):
+        os.remove(job.path)
+
+
+def run_import_job(job_id: int):
+    """
+    Import the stored file of a job with its own session. Progress is committed
+    in the same transaction as every chunk, so a resumed job neither skips
+    nor repeats rows.
+    """
+    db = SessionLocal()
+    try:
+        job = db.get(ImportJob, job_id)
+        if job is None or job.status not in (QUEUED, RUNNING):
+            return
+        if not os.path.exists(job.path):
+            _finish(db, job, FAILED, "Uploaded file is missing")
+            return
+        job.status = RUNNING
+        job.started_at = job.started_at or datetime.now()
+        db.commit()
+
+        result = {
+            "rows": job.rows or 0,
+            "inserted": job.inserted or 0,
+            "updated": job.updated or 0,
+            "error_count": job.error_count or 0,
+            "errors": json.loads(job.errors) if job.errors else [],
+        }
+        with (
+            open(job.path, "rb") as file,
+            closing(
+                iter_portfolio_chunks(file, job.filename, job.chunk_rows)
+            ) as chunks,
+        ):
+            started = time.perf_counter()
+            processing_seconds = job.processing_seconds or 0
+
+            def on_chunk(result: dict):
+                job.rows = result["rows"]
+                job.inserted = result["inserted"]
+                job.updated = result["updated"]
+                job.error_count = result["error_count"]
+                job.errors = json.dumps(result["errors"])
+                if job.filename.endswith(".csv"):
+                    # an XLSX file is not read sequentially
+                    job.bytes_read = min(file.tell(), job.size)
+                job.processing_seconds = processing_seconds + (
+                    time.perf_counter() - started
+                )
+
+            result = import_portfolio(
+                db,
+                chunks,
+                on_chunk=on_chunk,
+                result=result,
+            )
+
+        if "read_error" in result:
+            _finish(db, job, FAILED, result["read_error"])
+        else:
+            job.bytes_read = job.size
+            _finish(
+                db,
+                job,
+                DONE,
+                f"{result['rows'] - result['error_count']} of {result['rows']} assets uploaded",
+            )
+    except Exception as e:
+        logger.exception("Import job %s failed", job_id)
+        db.rollback()
+        job = db.get(ImportJob, job_id)
+        if job is not None:
+            # HTTPException of invalid files (e.g. missing columns) keeps its detail
+            message = (
+                e.detail if isinstance(e, HTTPException) else f"Import failed: {e}"
+            )
+            _finish(db, job, FAILED, message)
+    finally:
+        db.close()
+
+
+def import_job_status(job: ImportJob) -> dict:
+    """
+    State of a job: progress (0-1, read bytes of the file), processed rows,
+    rows per second of processing time and reported errors.
+    """
+    if job.status == DONE:
+        progress = 1.0
+    elif job.size:
+        progress = round((job.bytes_read or 0) / job.size, 4)
+    else:
+        progress = 0.0
+    seconds = job.processing_seconds or 0
+    return {
+        "id": job.id,
+        "filename": job.filename,
+        "status": job.status,
+        "message": job.message,
+        "progress": progress,
+        "rows": job.rows or 0,
+        "inserted": job.inserted or 0,
+        "updated": job.updated or 0,
+        "rows_per_second": round(job.rows / seconds, 1)
+        if job.rows and seconds
+        else 0.0,
+        "error_count": job.error_count or 0,
+        "errors": json.loads(job.errors) if job.errors else [],
+        "created_at": job.created_at,
+        "started_at": job.started_at,
+        "finished_at": job.finished_at,
+    }
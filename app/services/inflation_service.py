@@ -1,9 +1,17 @@
 from fastapi import HTTPException
+import math
+import numpy as np
+import os
 import pandas as pd
 import requests
+import threading
 import time
+from collections import deque
+from datetime import date
 from sqlalchemy.orm import Session
 from models import Inflation
+from services.monthly_index import MonthlyIndex
+from services.valuation_cache import bond_value_cache
 
 ID_PERIOD_TO_MONTH_GUS_API = {
     1: 247,  # January
@@ -19,6 +27,23 @@ ID_PERIOD_TO_MONTH_GUS_API = {
     11: 257,  # November
     12: 258,  # December
 }
+MONTH_BY_GUS_PERIOD = {
+    period: month for month, period in ID_PERIOD_TO_MONTH_GUS_API.items()
+}
+
+GUS_API_URL = os.getenv("GUS_API_URL", "https://api-sdp.stat.gov.pl/api")
+GUS_TIMEOUT = float(os.getenv("GUS_TIMEOUT", "10"))
+# calls to GUS API per second
+GUS_RATE_LIMIT = int(os.getenv("GUS_RATE_LIMIT", "5"))
+GUS_PAGE_SIZE = 5000
+GUS_MAX_PAGES = 10
+GUS_RETRY_UNPUBLISHED = float(os.getenv("GUS_RETRY_UNPUBLISHED", "3600"))
+
+# first year of history the inflation scenarios are fitted on (after hyperinflation)
+SCENARIO_HISTORY_FROM = 2000
+
+# shared by every request of the process, refreshed after writes to the inflation table
+inflation_index = MonthlyIndex(Inflation)
 
 MONTHS_PL = {
     "Styczeń": 1,
@@ -36,46 +61,277 @@ MONTHS_PL = {
 }
 
 
+class RateLimiter:
+    """
+    Sliding window limit of `calls` per `period` seconds. Never sleeps,
+    `try_acquire` just tells if a call is allowed now.
+    """
+
+    def __init__(self, calls: int, period: float):
+        self.calls = calls
+        self.period = period
+        self._times = deque()
+        self._lock = threading.Lock()
+
+    def try_acquire(self) -> bool:
+        with self._lock:
+            now = time.monotonic()
+            while self._times and self._times[0] <= now - self.period:
+                self._times.popleft()
+            if len(self._times) >= self.calls:
+                return False
+            self._times.append(now)
+            return True
+
+    def retry_after(self) -> float:
+        """
+        Seconds until `try_acquire` allows a call again (0 when it does now).
+        """
+        with self._lock:
+            if len(self._times) < self.calls:
+                return 0.0
+            return max(self._times[0] + self.period - time.monotonic(), 0.0)
+
+
+class GusApiError(HTTPException):
+    """
+    GUS API answered with an error (or not at all) for a month: unlike a month
+    which is not published, it's not cached and may be skipped by a fallback.
+    """
+
+    def __init__(self, detail: str):
+        super().__init__(status_code=400, detail=detail)
+
+
+class GusRateLimited(HTTPException):
+    """
+    A GUS API call refused by gus_rate_limiter: the month may well be published,
+    the client is asked to retry (503 with Retry-After).
+    """
+
+    def __init__(self, retry_after: float):
+        super().__init__(
+            status_code=503,
+            detail="GUS API rate limit reached, try again later",
+            headers={"Retry-After": str(max(math.ceil(retry_after), 1))},
+        )
+
+
+# one pooled HTTP session for all calls to GUS API
+gus_session = requests.Session()
+gus_rate_limiter = RateLimiter(calls=GUS_RATE_LIMIT, period=1.0)
+
+# months GUS has not published yet, key (year * 12 + month - 1) -> retry after
+_unpublished = {}
+
+
+def _gus_url(year: int, period: int | None = None, page: int = 0) -> str:
+    url = (
+        f"{GUS_API_URL}/variable/variable-data-section"
+        f"?id-zmienna=305&id-przekroj=739&id-rok={year}"
+    )
+    if period is not None:
+        url += f"&id-okres={period}"
+    return url + f"&page-size={GUS_PAGE_SIZE}&page={page}&lang=pl"
+
+
+def _cpi_by_month(records: list) -> dict:
+    """
+    Inflation (fraction) per month from GUS API records.
+    """
+    df = pd.DataFrame(records)
+    if df.empty:
+        return {}
+    df = df[
+        (df["id-pozycja-2"] == 6656078) & (df["id-sposob-prezentacji-miara"] == 5)
+    ]  # 6656078 for Poland in general and 5 for cpi
+    result = {}
+    for period, value in zip(df["id-okres"], df["wartosc"]):
+        month = MONTH_BY_GUS_PERIOD.get(period)
+        if month is not None and month not in result:
+            result[month] = round((value - 100) / 100, 4)
+    return result
+
+
 def get_inflation_for_month(month, year):
     ip_period = ID_PERIOD_TO_MONTH_GUS_API.get(month)
-    url = f"https://api-sdp.stat.gov.pl/api/variable/variable-data-section?id-zmienna=305&id-przekroj=739&id-rok={year}&id-okres={ip_period}&page-size=50&page=0&lang=pl"
-    response = requests.get(url)
+    response = None
     try:
-        response = requests.get(url)
-        if response.status_code == 200:
-            data = response.json()
-            records = data.get("data", [])
-            df = pd.DataFrame(records)
-            df = df[
-                (df["id-pozycja-2"] == 6656078)
-                & (df["id-sposob-prezentacji-miara"] == 5)
-            ]  # 6656078 for Poland in general and 5 for cpi
-            if df.empty:
-                return None
-            time.sleep(1)  # to not overloard gus api
-            return round((df["wartosc"].iloc[0] - 100) / 100, 4)
+        response = gus_session.get(_gus_url(year, ip_period), timeout=GUS_TIMEOUT)
+        response.raise_for_status()
+        records = response.json().get("data", [])
+        return _cpi_by_month(records).get(month)
     except Exception as e:
-        raise HTTPException(
-            status_code=400,
-            detail=f"Error from api-sdp.stat.gov: {e, response.status_code}",
+        raise GusApiError(
+            f"Error from api-sdp.stat.gov: {e, getattr(response, 'status_code', None)}"
+        ) from e
+
+
+def get_inflation_for_year(year: int) -> dict:
+    """
+    Inflation of all published months of a year with one call per page
+    (a single page for a whole year).
+    """
+    records = []
+    for page in range(GUS_MAX_PAGES):
+        response = gus_session.get(_gus_url(year, page=page), timeout=GUS_TIMEOUT)
+        response.raise_for_status()
+        data = response.json().get("data", [])
+        records.extend(data)
+        if len(data) < GUS_PAGE_SIZE:
+            break
+    return _cpi_by_month(records)
+
+
+def _is_unpublished(key: int) -> bool:
+    retry_after = _unpublished.get(key)
+    return retry_after is not None and retry_after > time.monotonic()
+
+
+def prefetch_inflation(db: Session, keys) -> int:
+    """
+    Fetch all missing inflation months (year * 12 + month - 1) before a valuation:
+    one GUS call per year, limited by gus_rate_limiter without waiting (years refused
+    by the limiter are skipped, not marked unpublished), and one bulk write.
+    Every published month of a fetched year is stored, not only the asked ones.
+    Months GUS has not published yet are not asked again for GUS_RETRY_UNPUBLISHED s.
+    Returns number of added months.
+    """
+    keys = np.unique(np.asarray(keys, dtype=np.int64))
+    if keys.size == 0:
+        return 0
+    keys = keys[np.isnan(inflation_index.lookup(db, keys))]
+    missing = [int(key) for key in keys if not _is_unpublished(int(key))]
+
+    months_by_year = {}
+    for key in missing:
+        year, month = divmod(key, 12)
+        months_by_year.setdefault(year, []).append(month + 1)
+
+    records = []
+    for year, months in months_by_year.items():
+        if not gus_rate_limiter.try_acquire():
+            continue
+        try:
+            published = get_inflation_for_year(year)
+        except (requests.RequestException, ValueError, KeyError):
+            continue
+        stored = inflation_index.lookup(
+            db, np.array([year * 12 + month - 1 for month in published], dtype=np.int64)
+        )
+        records.extend(
+            Inflation(year=year, month=month, value=value)
+            for (month, value), known in zip(published.items(), stored)
+            if np.isnan(known)
         )
+        for month in months:
+            if month not in published:
+                _unpublished[year * 12 + month - 1] = (
+                    time.monotonic() + GUS_RETRY_UNPUBLISHED
+                )
+
+    if records:
+        db.bulk_save_objects(records)
+        db.commit()
+        inflation_index.invalidate()
+        for record in records:
+            bond_value_cache.invalidate_month(record.year, record.month)
+    return len(records)
 
 
 def get_inflation(db: Session, month: int, year: int) -> float:
-    record = db.query(Inflation).filter_by(year=year, month=month).first()
-    if record:
-        return record.value
+    """
+    Inflation of a month from the inflation table, fetched from GUS API when
+    missing. None when GUS has not published the month, GusRateLimited when
+    the call is refused by gus_rate_limiter.
+    """
+    value = inflation_index.get(db, month, year)
+    if value is not None:
+        return value
+
+    key = year * 12 + month - 1
+    if _is_unpublished(key):
+        return None
+    if not gus_rate_limiter.try_acquire():
+        raise GusRateLimited(gus_rate_limiter.retry_after())
 
     value = get_inflation_for_month(month, year)
     if value is not None:
         new_record = Inflation(year=year, month=month, value=value)
         db.add(new_record)
         db.commit()
+        inflation_index.invalidate()
+        bond_value_cache.invalidate_month(year, month)
+    else:
+        _unpublished[key] = time.monotonic() + GUS_RETRY_UNPUBLISHED
     return value
 
 
+def last_published_month(db: Session, since_year: int = SCENARIO_HISTORY_FROM) -> int:
+    """
+    Key (year * 12 + month - 1) of the last month of the contiguous run of
+    published inflation from `since_year` (or the first month in the table),
+    at most the current month. Stray rows after a gap (e.g. far in the future)
+    are ignored.
+    """
+    series = inflation_index.snapshot(db)
+    today = date.today()
+    current = today.year * 12 + today.month - 1
+    published = ~np.isnan(series.values)
+    first_published = np.flatnonzero(published)
+    if first_published.size == 0:
+        raise HTTPException(status_code=500, detail="Inflation table is empty")
+
+    start = max(since_year * 12 - series.first, 0)
+    if not published[start:].any():
+        start = int(first_published[0])
+    start += int(np.argmax(published[start:]))
+    run = published[start : current - series.first + 1]
+    gaps = np.flatnonzero(~run)
+    length = int(gaps[0]) if gaps.size else run.size
+    return series.first + start + length - 1
+
+
+def simulate_inflation_paths(
+    db: Session,
+    n_paths: int,
+    months: int,
+    seed: int | None = None,
+    since_year: int = SCENARIO_HISTORY_FROM,
+) -> tuple[int, np.ndarray]:
+    """
+    Simulate monthly inflation paths with an AR(1) model fitted on the inflation
+    table since `since_year`. Paths start the month after the last published one.
+    Returns key (year * 12 + month - 1) of the first month and paths (n_paths, months).
+    """
+    series = inflation_index.snapshot(db)
+    last = last_published_month(db, since_year)
+    history = series.lookup(np.arange(since_year * 12, last + 1))
+
+    previous, current = history[:-1], history[1:]
+    observed = ~np.isnan(previous) & ~np.isnan(current)
+    if observed.sum() < 24:
+        raise HTTPException(
+            status_code=500,
+            detail=f"Not enough inflation history since {since_year} to simulate paths",
+        )
+    slope, intercept = np.polyfit(previous[observed], current[observed], 1)
+    residuals = current[observed] - (intercept + slope * previous[observed])
+    sigma = residuals.std(ddof=2)
+
+    rng = np.random.default_rng(seed)
+    shocks = rng.normal(0.0, sigma, size=(n_paths, months))
+    paths = np.empty((n_paths, months))
+    value = np.full(n_paths, history[-1])
+    for month in range(months):
+        value = intercept + slope * value + shocks[:, month]
+        paths[:, month] = value
+    return last + 1, paths
+
+
 def load_inflation_from_custom_csv(db: Session, csv_path: str):
     df = pd.read_csv(csv_path)
+    added = []
 
     for _, row in df.iterrows():
         month_name = row["label"]
@@ -93,5 +349,9 @@ def load_inflation_from_custom_csv(db: Session, csv_path: str):
             record = db.query(Inflation).filter_by(year=year, month=month).first()
             if not record:
                 db.add(Inflation(year=year, month=month, value=value))
+                added.append((year, month))
 
     db.commit()
+    inflation_index.invalidate()
+    for year, month in added:
+        bond_value_cache.invalidate_month(year, month)
@@ -0,0 +1,100 @@
+import os
+import threading
+from collections import OrderedDict
+from collections.abc import Iterable
+
+from models import Equity
+from sqlalchemy.orm import Session
+
+ISIN_CACHE_SIZE = int(os.getenv("ISIN_CACHE_SIZE", "20000"))
+# ISINs of one IN (...) query
+ISIN_QUERY_BATCH = 1000
+
+
+class IsinResolver:
+    """
+    Bounded LRU map ISIN -> symbols of the equities table, filled lazily by
+    one query per batch of unknown ISINs. ISINs without an equity are cached
+    too, so `invalidate` must be called when equities are added or deleted.
+    """
+
+    def __init__(self, maxsize: int = ISIN_CACHE_SIZE):
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._entries = OrderedDict()
+        # bumped by every invalidation, a query started before it isn't cached
+        self._generation = 0
+        self._lock = threading.Lock()
+
+    def resolve_many(self, db: Session, isins: Iterable[str]) -> dict:
+        """
+        Symbols and stored currencies of equities for many ISINs:
+        isin -> list of (symbol, currency) sorted by symbol.
+        """
+        isins = sorted(set(isins))
+        result = {}
+        with self._lock:
+            for isin in isins:
+                entry = self._entries.get(isin)
+                if entry is not None:
+                    self._entries.move_to_end(isin)
+                    result[isin] = list(entry)
+            self.hits += len(result)
+            self.misses += len(isins) - len(result)
+            generation = self._generation
+
+        missing = [isin for isin in isins if isin not in result]
+        for start in range(0, len(missing), ISIN_QUERY_BATCH):
+            batch = missing[start : start + ISIN_QUERY_BATCH]
+            loaded = {isin: [] for isin in batch}
+            rows = (
+                db.query(Equity.isin, Equity.symbol, Equity.currency)
+                .filter(Equity.isin.in_(batch))
+                .order_by(Equity.symbol)
+                .all()
+            )
+            for isin, symbol, currency in rows:
+                loaded[isin].append((symbol, currency))
+            result.update((isin, list(symbols)) for isin, symbols in loaded.items())
+            self._store(loaded, generation)
+        return result
+
+    def resolve(self, db: Session, isin: str) -> list:
+        return self.resolve_many(db, [isin])[isin]
+
+    def _store(self, loaded: dict, generation: int):
+        with self._lock:
+            if generation != self._generation:
+                return
+            for isin, symbols in loaded.items():
+                self._entries[isin] = tuple(symbols)
+                self._entries.move_to_end(isin)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def invalidate(self, *isins: str):
+        """
+        Forget the ISINs (all of them without arguments).
+        """
+        with self._lock:
+            self._generation += 1
+            if not isins:
+                self._entries.clear()
+            for isin in isins:
+                self._entries.pop(isin, None)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "size": len(self._entries),
+                "maxsize": self.maxsize,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+            }
+
+
+isin_resolver = IsinResolver()
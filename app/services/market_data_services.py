@@ -1,136 +1,224 @@
 import financedatabase as fd
-from fastapi import HTTPException
-from typing import Optional
+import logging
+import time
+from collections.abc import Iterable
+import numpy as np
+import pandas as pd
+from sqlalchemy import func, inspect, select
 from sqlalchemy.orm import Session
-from models import Equity, Forex
+from db import bulk_insert, upsert_insert
+from models import Equity, Forex, forex_pair_date_index
+from services.forex_index import forex_index
+from services.isin_resolver import isin_resolver
 import yfinance as yf
-from datetime import date, timedelta, datetime
-from utils.date_utils import parse_date
+from datetime import timedelta, datetime
+
+FOREX_PAIRS = [
+    ("USD", "PLN"),
+    ("EUR", "PLN"),
+    ("GBP", "PLN"),
+    ("CHF", "PLN"),
+    ("JPY", "PLN"),
+    ("CAD", "PLN"),
+    ("AUD", "PLN"),
+    ("NZD", "PLN"),
+    ("SEK", "PLN"),
+    ("NOK", "PLN"),
+    ("DKK", "PLN"),
+]
+# history fetched for a pair without stored rates
+FOREX_HISTORY_DAYS = 365 * 10
+
+# financedatabase columns stored in the equities table
+EQUITY_COLUMNS = [
+    "symbol",
+    "isin",
+    "name",
+    "currency",
+    "sector",
+    "industry",
+    "exchange",
+    "market",
+    "country",
+    "market_cap",
+]
+# rows of one executemany batch of the equities import
+EQUITY_BATCH_ROWS = 10000
+
+logger = logging.getLogger(__name__)
+
+
+def _equity_rows(df: pd.DataFrame) -> pd.DataFrame:
+    """
+    Columns of the equities table from the financedatabase universe (indexed
+    by symbol): missing values become "Unknown", rows without a symbol and
+    repeated symbols are dropped.
+    """
+    df = df.reset_index()
+    df = df[df["symbol"].notna()].drop_duplicates("symbol")
+    return df.reindex(columns=EQUITY_COLUMNS).fillna("Unknown")
 
 
 def import_all_equities_once(db: Session):
-    if db.query(Equity).first():
+    """
+    Fill the empty equities table with the financedatabase universe in bulk:
+    COPY on PostgreSQL, batches of EQUITY_BATCH_ROWS Core inserts otherwise.
+    Time of every phase is logged.
+    """
+    if db.query(Equity.id).first():
         return
 
-    equities = fd.Equities()
-    df = equities.select()
-    df = df.reset_index()
-    df = df.fillna("Unknown")
-    objects = []
-    for _, row in df.iterrows():
-        objects.append(
-            Equity(
-                symbol=row["symbol"],
-                isin=row.get("isin"),
-                name=row.get("name"),
-                currency=row.get("currency"),
-                sector=row.get("sector"),
-                industry=row.get("industry"),
-                exchange=row.get("exchange"),
-                market=row.get("market"),
-                country=row.get("country"),
-                market_cap=row.get("market_cap"),
-            )
-        )
+    started = time.perf_counter()
+    df = fd.Equities().select()
+    loaded = time.perf_counter()
+    rows = _equity_rows(df)
+    mapped = time.perf_counter()
 
-    db.add_all(objects)
+    bulk_insert(db, Equity.__table__, rows, EQUITY_BATCH_ROWS)
     db.commit()
+    isin_resolver.invalidate()
+    inserted = time.perf_counter()
+
+    logger.info(
+        "Imported %d equities: load %.2fs, map %.2fs, insert %.2fs",
+        len(rows),
+        loaded - started,
+        mapped - loaded,
+        inserted - mapped,
+    )
 
 
-def import_all_forex_once(db: Session):
+def _forex_index_exists(db: Session) -> bool:
+    return any(
+        index["name"] == forex_pair_date_index.name
+        for index in inspect(db.get_bind()).get_indexes(Forex.__tablename__)
+    )
 
-    pairs = [
-        ("USD", "PLN"),
-        ("EUR", "PLN"),
-        ("GBP", "PLN"),
-        ("CHF", "PLN"),
-        ("JPY", "PLN"),
-        ("CAD", "PLN"),
-        ("AUD", "PLN"),
-        ("NZD", "PLN"),
-        ("SEK", "PLN"),
-        ("NOK", "PLN"),
-        ("DKK", "PLN"),
-    ]
-
-    start_date = datetime.now() - timedelta(days=365 * 10)
-    end_date = datetime.now()
 
-    for first, second in pairs:
-        symbol = f"{first}{second}=X"
-        ticker = yf.Ticker(symbol)
+def import_all_forex_once(db: Session):
+    """
+    Fetch forex history missing in the table: FOREX_HISTORY_DAYS for a new pair,
+    otherwise from the last stored day (refreshed, it may have been stored before
+    the close). Pairs with the same start are downloaded with one call.
+    A table without the unique (pair, date) index (see `compact_forex`) only gets
+    days after the last stored one.
+    """
+    unique = _forex_index_exists(db)
+    latest = {
+        (first, second): last
+        for first, second, last in db.query(
+            Forex.first_currency, Forex.second_currency, func.max(Forex.date)
+        )
+        .group_by(Forex.first_currency, Forex.second_currency)
+        .all()
+    }
 
-        df = ticker.history(start=start_date, end=end_date, interval="1d")
+    end_date = datetime.now()
+    starts = {}
+    for pair in FOREX_PAIRS:
+        last = latest.get(pair)
+        if last is None:
+            start = end_date - timedelta(days=FOREX_HISTORY_DAYS)
+        elif unique:
+            start = last
+        else:
+            start = last + timedelta(days=1)
+        if start.date() <= end_date.date():
+            starts.setdefault(start.date(), []).append(pair)
+
+    stmt = upsert_insert(db, Forex.__table__)
+    if unique:
+        stmt = stmt.on_conflict_do_update(
+            index_elements=["first_currency", "second_currency", "date"],
+            set_={"value": stmt.excluded.value},
+        )
+    else:
+        stmt = stmt.on_conflict_do_nothing()
 
-        if df.empty:
+    for start, pairs in starts.items():
+        symbols = [f"{first}{second}=X" for first, second in pairs]
+        data = yf.download(
+            symbols, start=start, end=end_date, interval="1d", progress=False
+        )
+        if data is None or data.empty:
             continue
 
-        objects = []
-        for index, row in df.iterrows():
-            objects.append(
-                Forex(
-                    first_currency=first,
-                    second_currency=second,
-                    value=float(row["Close"]),
-                    date=index.to_pydatetime(),
-                )
+        rows = []
+        for (first, second), symbol in zip(pairs, symbols):
+            if symbol not in data["Close"]:
+                continue
+            close = data["Close"][symbol].dropna()
+            rows.extend(
+                {
+                    "first_currency": first,
+                    "second_currency": second,
+                    "value": float(value),
+                    "date": index.to_pydatetime(),
+                }
+                for index, value in close.items()
             )
-
-        db.bulk_save_objects(objects)
-        db.commit()
-
-
-def get_current_price_from_yfinance(
-    symbol: str, target_date: Optional[date] = "today"
-) -> float:
-
-    ticker = yf.Ticker(symbol)
-
-    if target_date == "today":
-        data = ticker.history(period="1d")
-    else:
-        target_date = parse_date(target_date)
-        data = target_date + timedelta(days=1)
-        data = ticker.history(start=target_date, end=target_date + timedelta(days=1))
-    if data.empty:
-        raise HTTPException(status_code=404, detail=f"No data for symbol: {symbol}")
-
-    row = data.iloc[-1]
-    price = float(row["Close"])
-    currency = ticker.fast_info.get("currency")
-    return {
-        "symbol": symbol,
-        "date": row.name.date().isoformat(),
-        "price": price,
-        "currency": currency,
-    }
-
-
-def get_forex_rate(db: Session, first: str, second: str, date: datetime.date):
-    start_of_day = datetime.combine(date, datetime.min.time())
-    end_of_day = start_of_day + timedelta(days=1)
-
-    rate = (
-        db.query(Forex)
-        .filter(Forex.first_currency == first.upper())
-        .filter(Forex.second_currency == second.upper())
-        .filter(Forex.date >= start_of_day)
-        .filter(Forex.date < end_of_day)
-        .order_by(Forex.date.desc())
-        .first()
+        if rows:
+            db.execute(stmt, rows)
+            db.commit()
+            forex_index.invalidate()
+
+
+def compact_forex(db: Session) -> int:
+    """
+    Remove duplicate forex rows (the last stored row of a pair and date is kept)
+    and create the unique (pair, date) index. Returns the number of removed rows.
+    """
+    kept = (
+        select(func.max(Forex.id))
+        .group_by(Forex.first_currency, Forex.second_currency, Forex.date)
+        .scalar_subquery()
+    )
+    removed = (
+        db.query(Forex).filter(Forex.id.not_in(kept)).delete(synchronize_session=False)
     )
+    forex_pair_date_index.create(db.connection(), checkfirst=True)
+    db.commit()
+    forex_index.invalidate()
+    return removed
 
-    if not rate:
-        rate = (
-            db.query(Forex)
-            .filter(Forex.first_currency == first.upper())
-            .filter(Forex.second_currency == second.upper())
-            .filter(Forex.date < start_of_day)
-            .order_by(Forex.date.desc())
-            .first()
-        )
 
-    if not rate:
+def get_forex_rate(db: Session, first: str, second: str, date: datetime.date):
+    """
+    The last rate of `first`/`second` on or before `date`, from the in-memory
+    forex index (a pair which is not stored is inverted or crossed through PLN).
+    """
+    rate = forex_index.rate(db, first, second, date)
+    if rate is None:
         raise ValueError(f"No forex rate for {first}/{second} on {date}")
 
-    return rate.value
+    return rate
+
+
+def get_symbols_for_isins(db: Session, isins: Iterable[str]) -> dict:
+    """
+    Symbols and stored currencies of equities for many ISINs from the cached
+    resolver (one query for the ISINs it doesn't know):
+    isin -> list of (symbol, currency).
+    """
+    return isin_resolver.resolve_many(db, isins)
+
+
+def get_forex_rates(db: Session, pairs: Iterable[tuple], date: datetime.date) -> dict:
+    """
+    The last rate on or before `date` of many currency pairs from the in-memory
+    forex index: (first, second) -> rate. A pair of the same currency has rate 1,
+    pairs without a rate are left out.
+    """
+    pairs = sorted({(first.upper(), second.upper()) for first, second in pairs})
+    if not pairs:
+        return {}
+
+    values = forex_index.rates(
+        db,
+        [first for first, _ in pairs],
+        [second for _, second in pairs],
+        [date] * len(pairs),
+    )
+    return {
+        pair: float(value) for pair, value in zip(pairs, values) if not np.isnan(value)
+    }
@@ -0,0 +1,95 @@
+import threading
+
+import numpy as np
+from sqlalchemy.orm import Session
+
+
+class MonthlySeries:
+    """
+    Snapshot of a monthly series: a dense NumPy array indexed by
+    year * 12 + month - 1 (NaN for missing months). Cheap to pickle for worker processes.
+    With `fill_forward` the last value holds until the next one, also after the end.
+    """
+
+    def __init__(self, first: int, values: np.ndarray, fill_forward: bool = False):
+        self.first = first
+        self.values = values
+        self.fill_forward = fill_forward
+
+    def lookup(self, keys) -> np.ndarray:
+        """
+        Values for an array of month keys (year * 12 + month - 1), NaN where missing.
+        """
+        keys = np.asarray(keys, dtype=np.int64) - self.first
+        if self.fill_forward:
+            keys = np.minimum(keys, self.values.size - 1)
+        inside = (keys >= 0) & (keys < self.values.size)
+        result = np.full(keys.shape, np.nan)
+        result[inside] = self.values[keys[inside]]
+        return result
+
+    def get(self, month: int, year: int) -> float | None:
+        value = self.lookup([year * 12 + month - 1])[0]
+        return None if np.isnan(value) else float(value)
+
+
+class MonthlyIndex:
+    """
+    Process-wide, in-memory copy of a monthly `year, month, value` table.
+    Values are stored in a dense NumPy array indexed by year * 12 + month - 1
+    (NaN for missing months), so lookups don't need any SQL query.
+    The series is loaded lazily on first use and reloaded after `invalidate()`.
+    With `fill_forward` months without a value keep the previous one (a table of
+    changes, like the NBP reference rate).
+    """
+
+    def __init__(self, model, fill_forward: bool = False):
+        self.model = model
+        self.fill_forward = fill_forward
+        self._series = None
+        self._lock = threading.Lock()
+
+    def load(self, db: Session) -> MonthlySeries:
+        records = (
+            db.query(self.model.year, self.model.month, self.model.value)
+            .order_by(self.model.id.desc())
+            .all()
+        )
+        keys = np.array(
+            [year * 12 + month - 1 for year, month, _ in records], dtype=np.int64
+        )
+        first = int(keys.min()) if keys.size else 0
+        values = np.full(int(keys.max()) - first + 1 if keys.size else 0, np.nan)
+        # rows are ordered by id desc, so for duplicated months the oldest row wins
+        values[keys - first] = np.array(
+            [np.nan if value is None else value for _, _, value in records],
+            dtype=float,
+        )
+
+        if self.fill_forward and values.size:
+            filled = np.where(np.isnan(values), 0, np.arange(values.size))
+            values = values[np.maximum.accumulate(filled)]
+
+        series = MonthlySeries(first, values, self.fill_forward)
+        with self._lock:
+            self._series = series
+        return series
+
+    def invalidate(self):
+        with self._lock:
+            self._series = None
+
+    def is_loaded(self) -> bool:
+        return self._series is not None
+
+    def snapshot(self, db: Session) -> MonthlySeries:
+        series = self._series
+        if series is None:
+            series = self.load(db)
+        return series
+
+    def lookup(self, db: Session, keys) -> np.ndarray:
+        return self.snapshot(db).lookup(keys)
+
+    def get(self, db: Session, month: int, year: int) -> float | None:
+        return self.snapshot(db).get(month, year)
@@ -0,0 +1,533 @@
+import os
+from collections.abc import Callable, Iterator
+from functools import partial
+from typing import BinaryIO
+from zipfile import BadZipFile
+
+import openpyxl
+import pandas as pd
+from db import upsert_insert
+from fastapi import HTTPException
+from models import ASSET_MERGE_KEY, Asset, asset_merge_key_index
+from openpyxl.utils.exceptions import InvalidFileException
+from services.bond_schedule_service import delete_bond_schedule, save_bond_schedules
+from services.valuation_cache import bond_value_cache
+from sqlalchemy import inspect, literal_column, select, text, update
+from sqlalchemy.exc import SQLAlchemyError
+from sqlalchemy.orm import Session
+from utils.bond_utils import (
+    FIXED_RATE_BONDS,
+    FLOATING_RATE_BONDS,
+    INFLATION_LINKED_BONDS,
+)
+from utils.date_utils import parse_date
+
+# column of uploaded file -> Asset field
+UPLOAD_COLUMNS = {
+    "ISIN": "isin",
+    "NAME": "name",
+    "QUANTITY": "amount",
+    "DATE": "date",
+    "TRANSACTION PRICE": "transaction_price",
+    "CURRENCY": "currency",
+    "CURRENCY TRANSACTION": "currency_transaction",
+    "TYPE": "type_",
+    "COUPON RATE (%)": "coupon_rate",
+    "INFLATION_FIRST_YEAR": "inflation_first_year",
+}
+REQUIRED_COLUMNS = ("ISIN", "NAME", "QUANTITY", "DATE", "TRANSACTION PRICE", "TYPE")
+
+# transactions with equal values (on the same day) are merged into one asset
+MERGE_KEY = [
+    "isin",
+    "name",
+    "currency",
+    "currency_transaction",
+    "type_",
+    "coupon_rate",
+    "inflation_first_year",
+    "day",
+]
+
+# rows read, merged and committed at once by streaming uploads
+UPLOAD_CHUNK_ROWS = int(os.getenv("UPLOAD_CHUNK_ROWS", "5000"))
+# errors listed in the result of an upload (all of them are counted)
+MAX_REPORTED_ERRORS = 1000
+# errors of a file which can't be read further: pandas parser errors are
+# ValueErrors, a broken XLSX raises BadZipFile, InvalidFileException or KeyError
+READ_ERRORS = (ValueError, KeyError, OSError, BadZipFile, InvalidFileException)
+
+
+def _percent_to_fraction(value):
+    return round(value / 100, 4) if value >= 1 else value
+
+
+def _parse_dates(values: pd.Series) -> pd.Series:
+    """
+    Parse every distinct date once, NaT where the date can't be parsed.
+    """
+    parsed = {}
+    for value in values.dropna().unique():
+        try:
+            parsed[value] = parse_date(value)
+        except HTTPException:
+            continue
+    return pd.to_datetime(values.map(parsed))
+
+
+def normalize_portfolio(
+    df: pd.DataFrame, first_row: int = 1
+) -> tuple[pd.DataFrame, list[dict]]:
+    """
+    Normalise an uploaded portfolio in bulk: uppercase ISIN and TYPE, coupon rate and
+    inflation of the first year from % to fractions (values >= 1), parsed dates and
+    the day of every transaction.
+    Returns valid rows (Asset fields + day) and errors of invalid rows, rows are
+    numbered from `first_row`.
+    """
+    missing = [column for column in REQUIRED_COLUMNS if column not in df.columns]
+    if missing:
+        raise HTTPException(
+            status_code=400, detail=f"Missing columns: {', '.join(missing)}"
+        )
+
+    assets = pd.DataFrame(
+        {
+            field: df[column] if column in df.columns else None
+            for column, field in UPLOAD_COLUMNS.items()
+        },
+        index=df.index,
+    )
+    assets["isin"] = assets["isin"].where(
+        assets["isin"].isna(), assets["isin"].astype(str).str.upper()
+    )
+    assets["type_"] = assets["type_"].where(
+        assets["type_"].isna(), assets["type_"].astype(str).str.upper()
+    )
+    assets["amount"] = pd.to_numeric(assets["amount"], errors="coerce")
+    assets["transaction_price"] = pd.to_numeric(
+        assets["transaction_price"], errors="coerce"
+    )
+    for field in ("coupon_rate", "inflation_first_year"):
+        assets[field] = pd.to_numeric(assets[field], errors="coerce").map(
+            _percent_to_fraction, na_action="ignore"
+        )
+    assets["date"] = _parse_dates(assets["date"])
+    assets["day"] = assets["date"].dt.normalize()
+
+    bond_type = assets["isin"].str[:3]
+    bond = assets["type_"] == "BOND"
+    linked = bond & bond_type.isin(INFLATION_LINKED_BONDS)
+    fixed = bond & bond_type.isin(FIXED_RATE_BONDS)
+    floating = bond & bond_type.isin(FLOATING_RATE_BONDS)
+
+    checks = [
+        (assets["isin"].isna(), "ISIN is missing"),
+        (assets["type_"].isna(), "TYPE is missing"),
+        (assets["date"].isna(), "Invalid date format"),
+        (assets["amount"].isna(), "QUANTITY is not a number"),
+        (assets["transaction_price"].isna(), "TRANSACTION PRICE is not a number"),
+        (
+            linked
+            & (assets["coupon_rate"].isna() | assets["inflation_first_year"].isna()),
+            "COI/EDO bonds require coupon_rate and inflation_first_year",
+        ),
+        (fixed & assets["coupon_rate"].isna(), "OTS/TOS bonds require coupon_rate"),
+        (
+            floating
+            & (assets["coupon_rate"].isna() | assets["inflation_first_year"].isna()),
+            "ROR/DOR bonds require coupon_rate (margin) and inflation_first_year (fixed rate of the first month)",
+        ),
+    ]
+    invalid = pd.Series(False, index=assets.index)
+    errors = []
+    for failed, message in checks:
+        failed = failed & ~invalid
+        for position in failed.to_numpy().nonzero()[0]:
+            errors.append(
+                {
+                    "row": first_row + int(position),
+                    "isin": assets["isin"].iloc[position],
+                    "error": message,
+                }
+            )
+        invalid |= failed
+    errors.sort(key=lambda error: error["row"])
+
+    # fields not used by a bond type are not stored
+    assets.loc[~(linked | floating), "inflation_first_year"] = None
+    assets.loc[~(linked | fixed | floating), "coupon_rate"] = None
+    return assets[~invalid], errors
+
+
+def _none_if_missing(value):
+    return None if pd.isna(value) else value
+
+
+def _merge_key(row: dict) -> tuple:
+    """
+    Merge key of a row as the database compares it (see ASSET_MERGE_KEY).
+    """
+    return (
+        row["isin"],
+        row.get("name") or "",
+        row.get("currency") or "",
+        row.get("currency_transaction") or "",
+        row["type_"],
+        -1.0 if row.get("coupon_rate") is None else row["coupon_rate"],
+        -1.0
+        if row.get("inflation_first_year") is None
+        else row["inflation_first_year"],
+        row["trade_day"],
+    )
+
+
+def _merge_rows(rows: list[dict]) -> list[dict]:
+    """
+    Rows with equal merge keys (e.g. an empty and a missing name) merged into
+    the first one: one statement can't update a stored asset twice.
+    """
+    merged = {}
+    for row in rows:
+        key = _merge_key(row)
+        first = merged.get(key)
+        if first is None:
+            merged[key] = dict(row)
+        else:
+            first["amount"] += row["amount"]
+            first["transaction_price"] += row["transaction_price"]
+    return list(merged.values())
+
+
+def _add_to_stored(stmt):
+    # amount and transaction price are added to the stored asset of the merge key
+    table = Asset.__table__
+    return stmt.on_conflict_do_update(
+        index_elements=ASSET_MERGE_KEY,
+        set_={
+            "amount": table.c.amount + stmt.excluded.amount,
+            "transaction_price": table.c.transaction_price
+            + stmt.excluded.transaction_price,
+        },
+    )
+
+
+def upsert_assets(db: Session, rows: list[dict]) -> tuple[list, list[int]]:
+    """
+    Merge assets into the database with INSERT ... ON CONFLICT on the merge key
+    (uq_assets_merge_key): amount and transaction price of a stored asset of the
+    same day and attributes are increased, other rows are inserted.
+    Rows with equal merge keys are merged first.
+    Returns inserted rows (id, isin, type_, date) and ids of updated assets.
+    """
+    if not rows:
+        return [], []
+    rows = _merge_rows(rows)
+
+    table = Asset.__table__
+    stmt = upsert_insert(db, table)
+    if db.get_bind().dialect.name == "postgresql":
+        # one statement, a row inserted by it has no deleting transaction
+        stored = db.execute(
+            _add_to_stored(stmt).returning(
+                table.c.id,
+                table.c.isin,
+                table.c.type_,
+                table.c.date,
+                (literal_column("xmax") == 0).label("inserted"),
+            ),
+            rows,
+        ).all()
+        return (
+            [row for row in stored if row.inserted],
+            [row.id for row in stored if not row.inserted],
+        )
+
+    # SQLite returns an upserted row the same way either it was inserted or
+    # updated: new keys are inserted first (RETURNING gives exactly the inserted
+    # rows), the write lock of that insert keeps the other keys stored until the
+    # commit, so adding to them only updates
+    inserted = db.execute(
+        stmt.on_conflict_do_nothing(index_elements=ASSET_MERGE_KEY).returning(
+            table.c.id,
+            table.c.isin,
+            table.c.type_,
+            table.c.date,
+            table.c.name,
+            table.c.currency,
+            table.c.currency_transaction,
+            table.c.coupon_rate,
+            table.c.inflation_first_year,
+            table.c.trade_day,
+        ),
+        rows,
+    ).all()
+    new_keys = {_merge_key(row._mapping) for row in inserted}
+    stored = [row for row in rows if _merge_key(row) not in new_keys]
+    updated = []
+    if stored:
+        updated = (
+            db.execute(_add_to_stored(stmt).returning(table.c.id), stored)
+            .scalars()
+            .all()
+        )
+    return inserted, updated
+
+
+def _merge_key_index_exists(db: Session) -> bool:
+    # SQLite indexes on expressions are not reflected by the inspector
+    if db.get_bind().dialect.name == "sqlite":
+        return (
+            db.execute(
+                text(
+                    "SELECT 1 FROM sqlite_master WHERE type = 'index' AND name = :name"
+                ),
+                {"name": asset_merge_key_index.name},
+            ).first()
+            is not None
+        )
+    return any(
+        index["name"] == asset_merge_key_index.name
+        for index in inspect(db.get_bind()).get_indexes(Asset.__tablename__)
+    )
+
+
+def upgrade_asset_merge_key(db: Session):
+    """
+    Add `trade_day` and the unique merge key index to an assets table created
+    before them: fill the day of stored assets and merge assets with equal keys
+    (amounts and transaction prices are summed into the first one).
+    """
+    if _merge_key_index_exists(db):
+        return
+
+    inspector = inspect(db.get_bind())
+    if "trade_day" not in {
+        column["name"] for column in inspector.get_columns(Asset.__tablename__)
+    }:
+        db.execute(text("ALTER TABLE assets ADD COLUMN trade_day DATE"))
+    stored = pd.read_sql(
+        select(
+            Asset.id,
+            Asset.date,
+            Asset.amount,
+            Asset.transaction_price,
+            *(
+                key.label(f"key_{position}")
+                for position, key in enumerate(ASSET_MERGE_KEY[:-1])
+            ),
+        ).order_by(Asset.id),
+        db.connection(),
+    )
+    if not stored.empty:
+        stored["trade_day"] = pd.to_datetime(stored["date"]).dt.date
+        key = [column for column in stored.columns if column.startswith("key_")]
+        key.append("trade_day")
+        groups = stored.groupby(key, dropna=False, sort=False)
+        merged = groups.agg(
+            id=("id", "first"),
+            amount=("amount", "sum"),
+            transaction_price=("transaction_price", "sum"),
+        )
+        db.execute(
+            update(Asset),
+            [
+                {
+                    "id": int(row.id),
+                    "trade_day": row.Index[-1],
+                    "amount": row.amount,
+                    "transaction_price": row.transaction_price,
+                }
+                for row in merged.itertuples()
+            ],
+        )
+        duplicates = stored["id"][~stored["id"].isin(merged["id"])].tolist()
+        for asset_id in duplicates:
+            delete_bond_schedule(db, asset_id)
+        if duplicates:
+            db.query(Asset).filter(Asset.id.in_(duplicates)).delete()
+    asset_merge_key_index.create(db.connection())
+    db.commit()
+    bond_value_cache.clear()
+
+
+def save_portfolio(
+    db: Session,
+    assets: pd.DataFrame,
+    before_commit: Callable[[int, int], None] | None = None,
+) -> tuple[int, int]:
+    """
+    Merge normalised rows into the database and commit. Transactions of the same day
+    with the same attributes are merged with a groupby, then upserted on the merge
+    key (see `upsert_assets`).
+    `before_commit` gets numbers of inserted and updated assets before the commit,
+    changes it makes in `db` are committed with the assets.
+    Returns numbers of inserted and updated assets.
+    """
+    if assets.empty:
+        if before_commit is not None:
+            before_commit(0, 0)
+            db.commit()
+        return 0, 0
+
+    merged = (
+        assets.groupby(MERGE_KEY, dropna=False, sort=False)
+        .agg(
+            date=("date", "first"),
+            amount=("amount", "sum"),
+            transaction_price=("transaction_price", "sum"),
+        )
+        .reset_index()
+    )
+    rows = [
+        {
+            "isin": row.isin,
+            "name": _none_if_missing(row.name),
+            "date": row.date.to_pydatetime(),
+            "trade_day": row.day.date(),
+            "amount": float(row.amount),
+            "transaction_price": float(row.transaction_price),
+            "currency": _none_if_missing(row.currency),
+            "currency_transaction": _none_if_missing(row.currency_transaction),
+            "type_": row.type_,
+            "coupon_rate": _none_if_missing(row.coupon_rate),
+            "inflation_first_year": _none_if_missing(row.inflation_first_year),
+        }
+        for row in merged.itertuples(index=False)
+    ]
+
+    inserted, updated = upsert_assets(db, rows)
+    # a schedule only needs these fields
+    save_bond_schedules(
+        db,
+        [
+            Asset(id=row.id, isin=row.isin, type_=row.type_, date=row.date)
+            for row in inserted
+            if row.type_ == "BOND"
+        ],
+    )
+    if before_commit is not None:
+        before_commit(len(inserted), len(updated))
+    db.commit()
+
+    for asset_id in updated:
+        bond_value_cache.invalidate_asset(asset_id)
+    return len(inserted), len(updated)
+
+
+def iter_portfolio_chunks(
+    file: BinaryIO, filename: str, chunk_rows: int = UPLOAD_CHUNK_ROWS
+) -> Iterator[pd.DataFrame]:
+    """
+    Read an uploaded portfolio in DataFrames of `chunk_rows` rows: CSV with pandas
+    chunks, XLSX with the read-only row iterator of openpyxl.
+    """
+    if filename.endswith(".csv"):
+        yield from pd.read_csv(file, chunksize=chunk_rows)
+        return
+
+    workbook = openpyxl.load_workbook(file, read_only=True, data_only=True)
+    try:
+        rows = workbook.active.iter_rows(values_only=True)
+        header = [
+            str(value).strip() if value is not None else "" for value in next(rows, ())
+        ]
+        chunk = []
+        for row in rows:
+            if all(value is None for value in row):
+                continue
+            chunk.append(row[: len(header)])
+            if len(chunk) == chunk_rows:
+                yield pd.DataFrame(chunk, columns=header)
+                chunk = []
+        if chunk:
+            yield pd.DataFrame(chunk, columns=header)
+    finally:
+        workbook.close()
+
+
+def import_portfolio(
+    db: Session,
+    chunks: Iterator[pd.DataFrame],
+    on_chunk: Callable[[dict], None] | None = None,
+    result: dict | None = None,
+) -> dict:
+    """
+    Validate, merge and commit a portfolio chunk by chunk, so memory doesn't grow
+    with the file. Invalid rows (and chunks which fail in the database) are reported
+    and skipped, rows of other chunks are kept. A file which can't be read further
+    stops the import with `read_error`.
+    `on_chunk` gets the running result after every chunk, before the chunk is
+    committed, so changes it makes in `db` are committed together with the chunk.
+    An import is resumed by passing the `result` of its committed chunks, chunks
+    with these rows are skipped.
+    """
+    if result is None:
+        result = {"rows": 0, "inserted": 0, "updated": 0, "error_count": 0}
+    result.setdefault("errors", [])
+    resumed_rows = result["rows"]
+
+    def report(errors: list[dict]):
+        result["error_count"] += len(errors)
+        space = MAX_REPORTED_ERRORS - len(result["errors"])
+        result["errors"].extend(errors[: max(space, 0)])
+
+    def apply(rows: int, inserted: int, updated: int, errors: list[dict]):
+        result["rows"] += rows
+        result["inserted"] += inserted
+        result["updated"] += updated
+        report(errors)
+        if on_chunk is not None:
+            on_chunk(result)
+
+    read_rows = 0
+    chunks = iter(chunks)
+    while True:
+        try:
+            chunk = next(chunks)
+        except StopIteration:
+            break
+        except READ_ERRORS as e:
+            # rows of committed chunks are kept
+            result["read_error"] = f"Error reading file: {e}"
+            break
+        read_rows += len(chunk)
+        if read_rows <= resumed_rows:
+            continue
+        first_row = result["rows"] + 1
+        assets, errors = normalize_portfolio(chunk, first_row=first_row)
+        committed = {
+            "rows": result["rows"],
+            "inserted": result["inserted"],
+            "updated": result["updated"],
+            "error_count": result["error_count"],
+            "errors": len(result["errors"]),
+        }
+        try:
+            save_portfolio(
+                db,
+                assets,
+                before_commit=partial(apply, len(chunk), errors=errors),
+            )
+        except SQLAlchemyError as e:
+            db.rollback()
+            # undo the result of the failed chunk if it was applied before commit
+            del result["errors"][committed.pop("errors") :]
+            result.update(committed)
+            positions = chunk.index.get_indexer(assets.index)
+            apply(
+                len(chunk),
+                0,
+                0,
+                errors
+                + [
+                    {
+                        "row": first_row + int(position),
+                        "isin": isin,
+                        "error": f"Error saving rows: {e}",
+                    }
+                    for position, isin in zip(positions, assets["isin"])
+                ],
+            )
+            db.commit()
+    return result
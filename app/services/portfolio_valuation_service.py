@@ -0,0 +1,171 @@
+import datetime
+from math import isfinite
+
+from models import Asset
+from services.bond_pricing_service import calculate_value_of_bonds
+from services.market_data_services import (
+    get_forex_rates,
+    get_symbols_for_isins,
+)
+from services.price_service import get_prices, symbol_currency
+from sqlalchemy.orm import Session
+
+# currency of equities imported without one
+UNKNOWN_CURRENCY = "Unknown"
+
+
+def _symbol_currency(
+    db: Session, symbol: str, stored: str | None, price: dict
+) -> str | None:
+    if stored and stored != UNKNOWN_CURRENCY:
+        return stored
+    return price["currency"] or symbol_currency(db, symbol)
+
+
+def _value_equities(
+    assets: list[Asset],
+    db: Session,
+    date_to_calculate: str,
+    calc_date: datetime.date,
+) -> dict:
+    """
+    Values of equities with one query for symbols, one batched price download
+    and one query for forex rates: asset id -> (value, currency, value per unit)
+    or an error message.
+    """
+    symbols = get_symbols_for_isins(db, (asset.isin for asset in assets))
+    single = {
+        isin: matches[0] for isin, matches in symbols.items() if len(matches) == 1
+    }
+    prices = get_prices(
+        db, (symbol for symbol, _ in single.values()), target_date=date_to_calculate
+    )
+    currencies = {
+        symbol: _symbol_currency(db, symbol, currency, prices[symbol])
+        for symbol, currency in single.values()
+        if symbol in prices
+    }
+    rates = get_forex_rates(
+        db,
+        {
+            (currencies[single[asset.isin][0]], asset.currency_transaction)
+            for asset in assets
+            if asset.isin in single
+            and currencies.get(single[asset.isin][0])
+            and asset.currency_transaction
+        },
+        calc_date,
+    )
+
+    values = {}
+    for asset in assets:
+        if asset.isin not in single:
+            values[asset.id] = (
+                f"More symbols than one or no symbol for {asset.isin}: "
+                f"{[symbol for symbol, _ in symbols.get(asset.isin, [])]}"
+            )
+            continue
+        symbol = single[asset.isin][0]
+        if symbol not in prices:
+            values[asset.id] = f"No data for symbol: {symbol}"
+            continue
+        currency = currencies[symbol]
+        if str(currency) != str(asset.currency):
+            values[asset.id] = (
+                f"There are different currencies in equities for: {asset.isin, asset.id}. "
+                f"Input currency = {asset.currency}, yfinance currency = {currency}"
+            )
+            continue
+        rate = rates.get(
+            (str(currency).upper(), str(asset.currency_transaction).upper())
+        )
+        if rate is None:
+            values[asset.id] = (
+                f"No forex rate for {currency}/{asset.currency_transaction} on {calc_date}"
+            )
+            continue
+        price = prices[symbol]["price"]
+        values[asset.id] = (round(price * asset.amount * rate, 4), currency, price)
+    return values
+
+
+def calculate_portfolio_value(
+    assets: list[Asset],
+    db: Session,
+    date_to_calculate: str,
+    calc_date: datetime.date,
+) -> dict:
+    """
+    Value every asset of a portfolio on one date: bonds with the batch pricing
+    engine, equities with batched market data (see `_value_equities`), other
+    assets at transaction price. Assets which can't be valued are listed with
+    an error and left out of totals by currency and by type (and currency).
+    """
+    bonds = [asset for asset in assets if asset.type_.upper() == "BOND"]
+    equities = [asset for asset in assets if asset.type_.upper() == "EQUITIES"]
+
+    values = {}
+    if bonds:
+        for asset, value in zip(
+            bonds, calculate_value_of_bonds(bonds, db=db, date=date_to_calculate)
+        ):
+            if value is None or not isfinite(value):
+                values[asset.id] = f"Calculated bond value is not finite: {value}"
+            elif asset.amount == 0:
+                values[asset.id] = "Asset amount cannot be 0"
+            else:
+                values[asset.id] = (value, None, round(value / asset.amount, 4))
+    if equities:
+        values.update(_value_equities(equities, db, date_to_calculate, calc_date))
+
+    rows = []
+    by_currency = {}
+    by_type = {}
+    for asset in assets:
+        value = values.get(asset.id)
+        if value is None:
+            price = asset.transaction_price or 0
+            value = (price, asset.currency_transaction, price)
+        row = {
+            "id": asset.id,
+            "isin": asset.isin,
+            "name": asset.name,
+            "type": asset.type_,
+            "date_buy": asset.date,
+            "currency": asset.currency_transaction,
+            "amount": asset.amount,
+            "value_before": asset.transaction_price,
+        }
+        if isinstance(value, str):
+            row.update(
+                value=None,
+                currency_yfinance=None,
+                value_in_currency_per_unit=None,
+                error=value,
+            )
+        else:
+            row.update(
+                value=value[0],
+                currency_yfinance=value[1],
+                value_in_currency_per_unit=value[2],
+            )
+            currency = asset.currency_transaction
+            by_currency[currency] = by_currency.get(currency, 0) + value[0]
+            type_totals = by_type.setdefault(asset.type_.upper(), {})
+            type_totals[currency] = type_totals.get(currency, 0) + value[0]
+        rows.append(row)
+
+    return {
+        "date_calc": date_to_calculate,
+        "totals": {
+            "by_currency": {
+                currency: round(total, 4) for currency, total in by_currency.items()
+            },
+            "by_type": {
+                type_: {currency: round(total, 4) for currency, total in totals.items()}
+                for type_, totals in by_type.items()
+            },
+        },
+        "error_count": sum(1 for row in rows if "error" in row),
+        "assets": rows,
+    }
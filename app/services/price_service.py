@@ -0,0 +1,235 @@
+import os
+import threading
+import time
+from collections.abc import Iterable
+from contextlib import closing
+from datetime import date, timedelta
+
+import pandas as pd
+import yfinance as yf
+from db import SessionLocal, upsert_insert
+from fastapi import HTTPException
+from models import Price, SymbolCurrency
+from sqlalchemy.orm import Session
+from utils.date_utils import parse_date
+
+# seconds a price of "today" is served from memory
+PRICE_TODAY_TTL = float(os.getenv("PRICE_TODAY_TTL", "300"))
+# days searched back for the last close of "today" (weekends, holidays)
+TODAY_LOOKBACK_DAYS = 7
+
+
+class YFinancePriceProvider:
+    """
+    Market data from yfinance: closes of many symbols with one batched download.
+    Any object with `closes` and `currency` can be plugged in instead
+    (`set_price_provider`), e.g. a local stand-in in tests.
+    """
+
+    def closes(self, symbols: list[str], start: date, end: date) -> dict:
+        """
+        Daily closes from `start` until `end` (exclusive): symbol -> list of
+        (date, close). Symbols without data are left out.
+        """
+        data = yf.download(
+            symbols, start=start, end=end, progress=False, auto_adjust=True
+        )
+        if data is None or data.empty:
+            return {}
+
+        closes = data["Close"]
+        if isinstance(closes, pd.Series):
+            closes = closes.to_frame(symbols[0])
+
+        result = {}
+        for symbol in symbols:
+            if symbol not in closes:
+                continue
+            close = closes[symbol].dropna()
+            if not close.empty:
+                result[symbol] = [
+                    (day.date(), float(value)) for day, value in close.items()
+                ]
+        return result
+
+    def currency(self, symbol: str) -> str | None:
+        return yf.Ticker(symbol).fast_info.get("currency")
+
+
+price_provider = YFinancePriceProvider()
+
+# symbol -> (expiry on the monotonic clock, price of "today")
+_today_prices = {}
+_today_lock = threading.Lock()
+
+
+def set_price_provider(provider):
+    """
+    Use `provider` for prices missing in the prices table, returns the previous one.
+    """
+    global price_provider
+    previous, price_provider = price_provider, provider
+    clear_today_prices()
+    return previous
+
+
+def clear_today_prices():
+    with _today_lock:
+        _today_prices.clear()
+
+
+def _write_session(db: Session) -> Session:
+    # write-backs commit on their own session, never the caller's transaction
+    return SessionLocal(bind=db.get_bind())
+
+
+def _store_closes(db: Session, closes: dict, no_trading: Iterable[tuple] = ()):
+    """
+    Write fetched closes back to the prices table, only of finished days
+    (a close of today still changes). (symbol, day) pairs of `no_trading`
+    (past days the provider had no close for, e.g. weekends) are stored
+    without a close, so they are not asked for again.
+    """
+    today = date.today()
+    rows = [
+        {"symbol": symbol, "date": day, "close": close}
+        for symbol, values in closes.items()
+        for day, close in values
+        if day < today
+    ]
+    rows += [
+        {"symbol": symbol, "date": day, "close": None}
+        for symbol, day in no_trading
+        if day < today
+    ]
+    if not rows:
+        return
+    with closing(_write_session(db)) as writer:
+        stmt = upsert_insert(writer, Price.__table__)
+        writer.execute(
+            stmt.on_conflict_do_update(
+                index_elements=["symbol", "date"], set_={"close": stmt.excluded.close}
+            ),
+            rows,
+        )
+        writer.commit()
+
+
+def _price(symbol: str, day: date, close: float, currency: str | None) -> dict:
+    return {
+        "symbol": symbol,
+        "date": day.isoformat(),
+        "price": close,
+        "currency": currency,
+    }
+
+
+def get_prices(
+    db: Session, symbols: Iterable[str], target_date: str | None = "today"
+) -> dict:
+    """
+    Close prices of many symbols (read-through): a past date is read from the
+    prices table, "today" from memory for PRICE_TODAY_TTL seconds, and missing
+    symbols are fetched with one provider call and written back (a past day
+    without a close is stored as such).
+    Returns symbol -> {"symbol", "date", "price", "currency"}, symbols without
+    data are left out.
+    """
+    symbols = sorted(set(symbols))
+    if not symbols:
+        return {}
+
+    if target_date == "today":
+        now = time.monotonic()
+        with _today_lock:
+            prices = {
+                symbol: _today_prices[symbol][1]
+                for symbol in symbols
+                if symbol in _today_prices and _today_prices[symbol][0] > now
+            }
+        missing = [symbol for symbol in symbols if symbol not in prices]
+        if missing:
+            today = date.today()
+            closes = price_provider.closes(
+                missing,
+                today - timedelta(days=TODAY_LOOKBACK_DAYS),
+                today + timedelta(days=1),
+            )
+            _store_closes(db, closes)
+            fetched = {
+                symbol: _price(symbol, *values[-1], None)
+                for symbol, values in closes.items()
+            }
+            with _today_lock:
+                for symbol, price in fetched.items():
+                    _today_prices[symbol] = (now + PRICE_TODAY_TTL, price)
+            prices.update(fetched)
+        return prices
+
+    day = parse_date(target_date).date()
+    rows = db.query(Price).filter(Price.symbol.in_(symbols), Price.date == day).all()
+    prices = {
+        row.symbol: _price(row.symbol, row.date, row.close, row.currency)
+        for row in rows
+        if row.close is not None
+    }
+    stored = {row.symbol for row in rows}
+    missing = [symbol for symbol in symbols if symbol not in stored]
+    if missing:
+        closes = price_provider.closes(missing, day, day + timedelta(days=1))
+        _store_closes(
+            db,
+            closes,
+            no_trading=[(symbol, day) for symbol in missing if symbol not in closes],
+        )
+        for symbol, values in closes.items():
+            prices[symbol] = _price(symbol, *values[-1], None)
+    return prices
+
+
+def symbol_currency(db: Session, symbol: str) -> str | None:
+    """
+    Currency of a symbol from the symbol_currencies table (or stored prices),
+    asked for once and stored, also for a symbol without stored prices.
+    """
+    currency = (
+        db.query(SymbolCurrency.currency)
+        .filter(SymbolCurrency.symbol == symbol)
+        .scalar()
+    ) or (
+        db.query(Price.currency)
+        .filter(Price.symbol == symbol, Price.currency.isnot(None))
+        .limit(1)
+        .scalar()
+    )
+    if currency is None:
+        currency = price_provider.currency(symbol)
+        if currency is None:
+            return None
+        with closing(_write_session(db)) as writer:
+            stmt = upsert_insert(writer, SymbolCurrency.__table__)
+            writer.execute(
+                stmt.on_conflict_do_update(
+                    index_elements=["symbol"], set_={"currency": currency}
+                ),
+                [{"symbol": symbol, "currency": currency}],
+            )
+            writer.query(Price).filter(Price.symbol == symbol).update(
+                {"currency": currency}
+            )
+            writer.commit()
+    return currency
+
+
+def get_price(db: Session, symbol: str, target_date: str | None = "today") -> dict:
+    """
+    Close price and currency of one symbol (see `get_prices` and
+    `symbol_currency`).
+    """
+    price = get_prices(db, [symbol], target_date).get(symbol)
+    if price is None:
+        raise HTTPException(status_code=404, detail=f"No data for symbol: {symbol}")
+
+    if price["currency"] is None:
+        price = {**price, "currency": symbol_currency(db, symbol)}
+    return price
@@ -1,6 +1,12 @@
 import pandas as pd
 from sqlalchemy.orm import Session
 from models import Reference_Rate
+from services.monthly_index import MonthlyIndex
+from services.valuation_cache import bond_value_cache, REFERENCE_RATE
+
+# NBP reference rate in effect in every month (the table holds only changes),
+# shared by every request of the process, refreshed after writes
+reference_rate_index = MonthlyIndex(Reference_Rate, fill_forward=True)
 
 MONTHS_PL = {
     "Styczeń": 1,
@@ -49,3 +55,5 @@ def load_reference_rate_from_custom_csv(db: Session, csv_path: str):
                 db.add(Reference_Rate(year=year, month=month, value=value))
 
     db.commit()
+    reference_rate_index.invalidate()
+    bond_value_cache.invalidate_dependency(REFERENCE_RATE)
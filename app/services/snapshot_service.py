@@ -0,0 +1,109 @@
+import json
+import os
+from collections.abc import Iterable
+from datetime import datetime
+
+import pandas as pd
+from db import bulk_insert
+from models import Equity, Forex, Inflation, Reference_Rate
+from services.forex_index import forex_index
+from services.inflation_service import inflation_index
+from services.isin_resolver import isin_resolver
+from services.reference_rate_service import reference_rate_index
+from services.valuation_cache import bond_value_cache
+from sqlalchemy import select
+from sqlalchemy.orm import Session
+
+# snapshot directory seeding empty reference data tables on startup
+SNAPSHOT_PATH = os.getenv("SNAPSHOT_PATH", "")
+SNAPSHOT_VERSION = 1
+SNAPSHOT_COMPRESSION = "zstd"
+MANIFEST_FILE = "manifest.json"
+
+# dataset -> table stored in the snapshot (one Parquet file each)
+SNAPSHOT_TABLES = {
+    "inflation": Inflation,
+    "reference_rate": Reference_Rate,
+    "equities": Equity,
+    "forex": Forex,
+}
+
+
+def _data_columns(model) -> list:
+    # ids are given by the importing database
+    return [column for column in model.__table__.columns if column.name != "id"]
+
+
+def export_snapshot(db: Session, path: str) -> dict:
+    """
+    Write the reference data tables to `path`: a Parquet file per table and a
+    manifest with the snapshot version and row counts. Returns the manifest.
+    """
+    os.makedirs(path, exist_ok=True)
+    tables = {}
+    for name, model in SNAPSHOT_TABLES.items():
+        columns = _data_columns(model)
+        rows = pd.read_sql(
+            select(*columns).order_by(model.id),
+            db.connection(),
+        )
+        filename = f"{name}.parquet"
+        rows.to_parquet(
+            os.path.join(path, filename),
+            compression=SNAPSHOT_COMPRESSION,
+            index=False,
+        )
+        tables[name] = {"file": filename, "rows": len(rows)}
+
+    manifest = {
+        "version": SNAPSHOT_VERSION,
+        "created_at": datetime.now().isoformat(timespec="seconds"),
+        "tables": tables,
+    }
+    with open(os.path.join(path, MANIFEST_FILE), "w") as file:
+        json.dump(manifest, file, indent=2)
+    return manifest
+
+
+def read_manifest(path: str) -> dict:
+    with open(os.path.join(path, MANIFEST_FILE)) as file:
+        manifest = json.load(file)
+    if manifest.get("version") != SNAPSHOT_VERSION:
+        raise ValueError(
+            f"Unsupported snapshot version {manifest.get('version')}, "
+            f"expected {SNAPSHOT_VERSION}"
+        )
+    return manifest
+
+
+def import_snapshot(db: Session, path: str, names: Iterable[str] | None = None) -> dict:
+    """
+    Load tables of the snapshot in `path` (all, or `names`) into empty tables,
+    a table which already has rows is left as it is. Columns missing in the
+    snapshot stay NULL, unknown columns are ignored.
+    Returns name -> imported rows.
+    """
+    manifest = read_manifest(path)
+    imported = {}
+    for name in names if names is not None else SNAPSHOT_TABLES:
+        model = SNAPSHOT_TABLES[name]
+        entry = manifest["tables"].get(name)
+        if entry is None or db.query(model.id).first() is not None:
+            imported[name] = 0
+            continue
+
+        rows = pd.read_parquet(os.path.join(path, entry["file"]))
+        columns = [
+            column.name for column in _data_columns(model) if column.name in rows
+        ]
+        bulk_insert(db, model.__table__, rows[columns])
+        db.commit()
+        imported[name] = len(rows)
+
+    if any(imported.values()):
+        forex_index.invalidate()
+        isin_resolver.invalidate()
+        inflation_index.invalidate()
+        reference_rate_index.invalidate()
+        bond_value_cache.clear()
+    return imported
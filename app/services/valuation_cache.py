@@ -0,0 +1,104 @@
+import os
+import threading
+import time
+from collections import OrderedDict
+
+VALUATION_CACHE_SIZE = int(os.getenv("VALUATION_CACHE_SIZE", "50000"))
+VALUATION_CACHE_TTL = float(os.getenv("VALUATION_CACHE_TTL", "600"))
+
+# dependency of values calculated from the whole reference rate curve
+REFERENCE_RATE = "reference_rate"
+
+
+class ValuationCache:
+    """
+    Bounded LRU cache of calculated values with a time to live.
+    Every entry remembers the asset and the inflation months (year * 12 + month - 1)
+    it was calculated from, so a change of one asset or one inflation month evicts
+    only the entries depending on it.
+    """
+
+    def __init__(
+        self, maxsize: int = VALUATION_CACHE_SIZE, ttl: float = VALUATION_CACHE_TTL
+    ):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._entries = OrderedDict()
+        self._by_asset = {}
+        self._by_month = {}
+        self._lock = threading.Lock()
+
+    def get(self, key) -> float | None:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[1] < time.monotonic():
+                self._remove(key)
+                entry = None
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def set(self, key, value: float, asset_id: int, months=()):
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = (value, time.monotonic() + self.ttl, asset_id, months)
+            self._by_asset.setdefault(asset_id, set()).add(key)
+            for month in months:
+                self._by_month.setdefault(month, set()).add(key)
+            while len(self._entries) > self.maxsize:
+                self._remove(next(iter(self._entries)))
+                self.evictions += 1
+
+    def _remove(self, key):
+        _, _, asset_id, months = self._entries.pop(key)
+        self._by_asset.get(asset_id, set()).discard(key)
+        for month in months:
+            self._by_month.get(month, set()).discard(key)
+
+    def invalidate_asset(self, asset_id: int):
+        with self._lock:
+            for key in self._by_asset.pop(asset_id, set()):
+                if key in self._entries:
+                    self._remove(key)
+
+    def invalidate_month(self, year: int, month: int):
+        self.invalidate_dependency(year * 12 + month - 1)
+
+    def invalidate_dependency(self, dependency):
+        """
+        Evict entries depending on an inflation month or another tag (REFERENCE_RATE).
+        """
+        with self._lock:
+            for key in self._by_month.pop(dependency, set()):
+                if key in self._entries:
+                    self._remove(key)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._by_asset.clear()
+            self._by_month.clear()
+
+    def stats(self) -> dict:
+        with self._lock:
+            requests = self.hits + self.misses
+            return {
+                "size": len(self._entries),
+                "maxsize": self.maxsize,
+                "ttl": self.ttl,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / requests, 4) if requests else None,
+                "evictions": self.evictions,
+            }
+
+
+# values of bonds, shared by every request of the process
+bond_value_cache = ValuationCache()
@@ -0,0 +1,38 @@
+"""
+Export the reference data tables (equities, forex, inflation, reference rates)
+to a compressed Parquet snapshot, or seed empty tables from one:
+
+    python snapshot.py export snapshots/2024-06
+    python snapshot.py import snapshots/2024-06
+
+Set SNAPSHOT_PATH to seed a new instance from a snapshot on startup.
+"""
+
+import argparse
+
+from db import Base, SessionLocal, engine
+from services.snapshot_service import export_snapshot, import_snapshot
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Reference data snapshots")
+    parser.add_argument("command", choices=["export", "import"])
+    parser.add_argument("path", help="snapshot directory")
+    args = parser.parse_args()
+
+    Base.metadata.create_all(bind=engine)
+    db = SessionLocal()
+    try:
+        if args.command == "export":
+            manifest = export_snapshot(db, args.path)
+            counts = {name: table["rows"] for name, table in manifest["tables"].items()}
+        else:
+            counts = import_snapshot(db, args.path)
+    finally:
+        db.close()
+    for name, rows in counts.items():
+        print(f"{args.command}ed {rows} rows of {name}")
+
+
+if __name__ == "__main__":
+    main()
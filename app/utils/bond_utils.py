@@ -1,6 +1,25 @@
 from typing import Optional
 from fastapi import HTTPException
 
+TAX = 0.19
+DAYS_IN_YEAR = 365.25
+
+INFLATION_LINKED_BONDS = ("COI", "EDO", "ROS", "ROD")
+FIXED_RATE_BONDS = ("OTS", "TOS")
+# reference rate of NBP + margin, interest paid every month
+FLOATING_RATE_BONDS = ("ROR", "DOR")
+SUPPORTED_BONDS = INFLATION_LINKED_BONDS + FIXED_RATE_BONDS + FLOATING_RATE_BONDS
+
+# bonds which capitalise interest every year and pay tax from the whole gain at the end
+COMPOUNDING_BONDS = ("EDO", "ROS", "ROD", "TOS")
+
+MAX_YEARS = {"COI": 4, "TOS": 3, "EDO": 10, "ROS": 6, "ROD": 12}
+OTS_MONTHS = 3
+FLOATING_MONTHS = {"ROR": 12, "DOR": 24}
+
+# first year + one period for every following anniversary
+MAX_PERIODS = max(MAX_YEARS.values()) + 1
+
 
 def validate_bond_fields(
     type_: str,
@@ -15,7 +34,7 @@ def validate_bond_fields(
     bond_type = isin[:3].upper()
 
     # COI / EDO / ROS / ROD
-    if bond_type in ("COI", "EDO", "ROS", "ROD"):
+    if bond_type in INFLATION_LINKED_BONDS:
         if coupon_rate is None or inflation_first_year is None:
             raise HTTPException(
                 status_code=400,
@@ -23,13 +42,22 @@ def validate_bond_fields(
             )
 
     # OTS / TOS
-    elif bond_type in ("OTS", "TOS"):
+    elif bond_type in FIXED_RATE_BONDS:
         if coupon_rate is None:
             raise HTTPException(
                 status_code=400, detail=f"OTS/TOS bonds require coupon_rate ({isin})"
             )
         inflation_first_year = None
 
+    # ROR / DOR, inflation_first_year holds the fixed rate of the first month
+    # (these bonds have no inflation-linked year), coupon_rate the margin
+    elif bond_type in FLOATING_RATE_BONDS:
+        if coupon_rate is None or inflation_first_year is None:
+            raise HTTPException(
+                status_code=400,
+                detail=f"ROR/DOR bonds require coupon_rate (margin) and inflation_first_year (fixed rate of the first month) ({isin})",
+            )
+
     else:
         coupon_rate = None
         inflation_first_year = None
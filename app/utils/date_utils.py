@@ -1,4 +1,5 @@
 from datetime import datetime
+import numpy as np
 import pandas as pd
 from fastapi import HTTPException
 
@@ -33,3 +34,37 @@ def parse_date(value) -> datetime:
         status_code=400,
         detail="Invalid date format. Accepted formats: DD.MM.YYYY, DD.MM.YYYY HH:MM, YYYY-MM-DD, etc.",
     )
+
+
+def add_months(dates, months) -> np.ndarray:
+    """
+    Shift datetime64 values by a number of months (vectorized relativedelta(months=...)).
+    The day is clamped to the last day of the target month, e.g. 31.01 + 1 month = 28.02.
+    """
+    dates = np.asarray(dates, dtype="datetime64[us]")
+    days = dates.astype("datetime64[D]")
+    month_start = days.astype("datetime64[M]")
+    day_of_month = days - month_start.astype("datetime64[D]")
+    time_of_day = dates - days
+
+    target = month_start + np.asarray(months).astype("timedelta64[M]")
+    month_length = (target + 1).astype("datetime64[D]") - target.astype("datetime64[D]")
+    day_of_month = np.minimum(day_of_month, month_length - np.timedelta64(1, "D"))
+    return target.astype("datetime64[D]") + day_of_month + time_of_day
+
+
+def days_between(start, end) -> np.ndarray:
+    """
+    Number of whole days between datetime64 values, same as `(end - start).days`.
+    """
+    start = np.asarray(start, dtype="datetime64[us]")
+    end = np.asarray(end, dtype="datetime64[us]")
+    return (end - start) // np.timedelta64(1, "D")
+
+
+def month_index(dates) -> np.ndarray:
+    """
+    Absolute month number (year * 12 + month - 1) of datetime64 values.
+    """
+    months = np.asarray(dates, dtype="datetime64[us]").astype("datetime64[M]")
+    return months.astype(np.int64) + 1970 * 12
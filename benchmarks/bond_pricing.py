@@ -0,0 +1,283 @@
+"""
+Benchmark of bond pricing for every supported bond type and holding period.
+
+Synthetic bonds are valued against in-memory SQLite inflation and reference rate
+tables loaded from app/data. For every bond type the single path (calculate_value_of_bond
+per bond) and the batch path (calculate_value_of_bonds) report latency per valuation,
+SQL queries per valuation and throughput.
+
+    python benchmarks/bond_pricing.py                # print results
+    python benchmarks/bond_pricing.py --save         # store results as the baseline
+    python benchmarks/bond_pricing.py --check        # exit 1 on a slowdown
+    python benchmarks/bond_pricing.py --check --relative  # on any machine (CI)
+
+Absolute throughput only compares to a baseline saved on the same machine.
+With --relative the speedup of the batch path over the single path, measured
+in the same run, is compared instead.
+"""
+
+import argparse
+import datetime
+import json
+import os
+import statistics
+import sys
+import time
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+os.environ["DATABASE_URL"] = "sqlite://"
+sys.path.insert(0, os.path.join(ROOT, "app"))
+
+from dateutil.relativedelta import relativedelta
+from db import Base, SessionLocal, engine
+from models import Asset
+from services.bond_pricing_service import (
+    calculate_value_of_bond,
+    calculate_value_of_bonds,
+)
+from services.inflation_service import (
+    inflation_index,
+    load_inflation_from_custom_csv,
+)
+from services.reference_rate_service import (
+    load_reference_rate_from_custom_csv,
+)
+from sqlalchemy import event
+from utils.bond_utils import (
+    FLOATING_MONTHS,
+    MAX_YEARS,
+    OTS_MONTHS,
+    SUPPORTED_BONDS,
+)
+
+BASELINE_PATH = os.path.join(os.path.dirname(__file__), "baseline_bond_pricing.json")
+INFLATION_CSV = os.path.join(ROOT, "app", "data", "inflation.csv")
+REFERENCE_RATE_CSV = os.path.join(ROOT, "app", "data", "reference_rate_NBP.csv")
+
+# every needed inflation month is in the CSV, so GUS API is never called
+VALUATION_DATE = datetime.datetime(2025, 11, 28)
+HOLDING_DAYS = (1, 30, 182, 365, 366, 500)
+MIN_ROUND_SECONDS = 0.1
+
+_queries = {"count": 0}
+
+
+@event.listens_for(engine, "before_cursor_execute")
+def _count_query(*args):
+    _queries["count"] += 1
+
+
+def holding_periods(bond_type: str) -> list[relativedelta]:
+    """
+    Holding periods from 1 day up to the maximum term of a bond type.
+    """
+    if bond_type == "OTS":
+        max_term = relativedelta(months=OTS_MONTHS)
+    elif bond_type in FLOATING_MONTHS:
+        max_term = relativedelta(months=FLOATING_MONTHS[bond_type])
+    else:
+        max_term = relativedelta(years=MAX_YEARS[bond_type])
+
+    periods = [relativedelta(days=days) for days in HOLDING_DAYS]
+    periods += [
+        relativedelta(years=years)
+        for years in range(2, MAX_YEARS.get(bond_type, 0) + 1)
+    ]
+    periods = [
+        period
+        for period in periods
+        if VALUATION_DATE - period > VALUATION_DATE - max_term
+    ]
+    return periods + [max_term]
+
+
+def build_assets(bond_type: str, copies: int) -> list[Asset]:
+    """
+    Synthetic (not stored) bond assets of one type, `copies` per holding period.
+    """
+    assets = []
+    for period in holding_periods(bond_type):
+        date = VALUATION_DATE - period
+        for copy in range(copies):
+            assets.append(
+                Asset(
+                    isin=f"{bond_type}{date:%m%y}",
+                    name=f"{bond_type}{date:%m%y}",
+                    date=date,
+                    amount=1,
+                    transaction_price=100.0 + copy,
+                    currency="PLN",
+                    currency_transaction="PLN",
+                    type_="BOND",
+                    coupon_rate=0.015 if bond_type != "OTS" else 0.03,
+                    inflation_first_year=0.068,
+                )
+            )
+    return assets
+
+
+def _measure(run, valuations: int, repeat: int) -> dict:
+    """
+    Best and median of `repeat` rounds, every round runs long enough
+    (MIN_ROUND_SECONDS) to not be dominated by timer noise.
+    """
+    start = time.perf_counter()
+    run()  # warm up
+    loops = max(1, int(MIN_ROUND_SECONDS / (time.perf_counter() - start)))
+
+    timings = []
+    queries = 0
+    for _ in range(repeat):
+        _queries["count"] = 0
+        start = time.perf_counter()
+        for _ in range(loops):
+            run()
+        timings.append((time.perf_counter() - start) / loops)
+        queries += _queries["count"] / loops
+    return {
+        "valuations": valuations,
+        "latency_us": round(statistics.median(timings) / valuations * 1e6, 2),
+        "queries_per_valuation": round(queries / repeat / valuations, 4),
+        "throughput": round(valuations / min(timings), 1),
+    }
+
+
+def run_benchmarks(copies: int, repeat: int) -> dict:
+    Base.metadata.create_all(bind=engine)
+    db = SessionLocal()
+    load_inflation_from_custom_csv(db, INFLATION_CSV)
+    load_reference_rate_from_custom_csv(db, REFERENCE_RATE_CSV)
+    date = f"{VALUATION_DATE:%Y-%m-%d}"
+
+    results = {}
+    try:
+        for bond_type in SUPPORTED_BONDS:
+            assets = build_assets(bond_type, copies)
+            inflation_index.snapshot(db)
+
+            results[f"{bond_type}/single"] = _measure(
+                lambda assets=assets: [
+                    calculate_value_of_bond(a, db, date) for a in assets
+                ],
+                len(assets),
+                repeat,
+            )
+            results[f"{bond_type}/batch"] = _measure(
+                lambda assets=assets: calculate_value_of_bonds(assets, db, date),
+                len(assets),
+                repeat,
+            )
+
+        # cold start: inflation index loaded from the table first
+        assets = [a for t in SUPPORTED_BONDS for a in build_assets(t, copies)]
+
+        def cold_batch():
+            inflation_index.invalidate()
+            calculate_value_of_bonds(assets, db, date)
+
+        results["ALL/batch_cold"] = _measure(cold_batch, len(assets), repeat)
+    finally:
+        db.close()
+    return results
+
+
+def speedups(results: dict) -> dict:
+    """
+    Throughput of the batch path over the single path per bond type.
+    """
+    return {
+        name.split("/")[0]: row["throughput"]
+        / results[name.replace("/batch", "/single")]["throughput"]
+        for name, row in results.items()
+        if name.endswith("/batch") and name.replace("/batch", "/single") in results
+    }
+
+
+def compare(
+    results: dict, baseline: dict, tolerance: float, relative: bool = False
+) -> list[str]:
+    """
+    Slowdowns against the baseline: lower throughput (beyond tolerance), or
+    with `relative` a lower batch speedup, or more SQL queries per valuation.
+    """
+    problems = []
+    if relative:
+        current_speedups = speedups(results)
+        for bond_type, base in speedups(baseline).items():
+            current = current_speedups.get(bond_type)
+            if current is not None and current < base * (1 - tolerance):
+                problems.append(
+                    f"{bond_type}: batch speedup {current:.1f}x, baseline {base:.1f}x"
+                )
+
+    for name, base in baseline.items():
+        current = results.get(name)
+        if current is None:
+            problems.append(f"{name}: missing")
+            continue
+        if not relative and current["throughput"] < base["throughput"] * (
+            1 - tolerance
+        ):
+            problems.append(
+                f"{name}: throughput {current['throughput']}/s, "
+                f"baseline {base['throughput']}/s"
+            )
+        if current["queries_per_valuation"] > base["queries_per_valuation"]:
+            problems.append(
+                f"{name}: {current['queries_per_valuation']} queries per valuation, "
+                f"baseline {base['queries_per_valuation']}"
+            )
+    return problems
+
+
+def print_results(results: dict):
+    print(f"{'case':<18}{'n':>6}{'latency us':>14}{'queries':>10}{'per s':>12}")
+    for name, row in results.items():
+        print(
+            f"{name:<18}{row['valuations']:>6}{row['latency_us']:>14}"
+            f"{row['queries_per_valuation']:>10}{row['throughput']:>12}"
+        )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument(
+        "--copies", type=int, default=20, help="bonds per holding period"
+    )
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--save", action="store_true", help="store results as baseline")
+    parser.add_argument("--check", action="store_true", help="fail on a slowdown")
+    parser.add_argument(
+        "--relative",
+        action="store_true",
+        help="check the batch speedup instead of absolute throughput",
+    )
+    parser.add_argument(
+        "--tolerance",
+        type=float,
+        default=0.5,
+        help="allowed throughput drop against the baseline (0.5 = 50%%)",
+    )
+    args = parser.parse_args()
+
+    results = run_benchmarks(args.copies, args.repeat)
+    print_results(results)
+
+    if args.save:
+        with open(BASELINE_PATH, "w") as f:
+            json.dump(results, f, indent=2)
+        print(f"Baseline saved to {BASELINE_PATH}")
+
+    if args.check:
+        with open(BASELINE_PATH) as f:
+            baseline = json.load(f)
+        problems = compare(results, baseline, args.tolerance, args.relative)
+        for problem in problems:
+            print(f"SLOWDOWN {problem}")
+        if problems:
+            sys.exit(1)
+        print("No slowdown against the baseline")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,5 +1,15 @@
-from models import Asset
-from datetime import datetime
+import pytest
+from sqlalchemy import create_engine, text
+from sqlalchemy.exc import IntegrityError, OperationalError
+from sqlalchemy.pool import StaticPool
+from db import Base, SessionLocal
+from models import Asset, ImportJob
+from services.import_job_service import run_import_job
+from services.portfolio_upload_service import upgrade_asset_merge_key, upsert_assets
+from datetime import date, datetime
+import json
+import os
+import time
 
 
 def test_add_asset(client):
@@ -37,8 +47,10 @@ def test_add_asset_duplicate(client, db_session):
         currency_transaction="PLN",
         type_="EQUITY",
     )
-    db_session.add(asset)
-    db_session.commit()
+    # the merge key is unique, the asset may be stored by test_add_asset already
+    if not db_session.query(Asset).filter(Asset.isin == asset.isin).first():
+        db_session.add(asset)
+        db_session.commit()
 
     response = client.post(
         "/assets/add",
@@ -68,6 +80,115 @@ def test_add_asset_duplicate(client, db_session):
     )
 
 
+def test_upgrade_asset_merge_key():
+    """
+    An assets table created before trade_day gets the column and the unique merge
+    key index, assets with equal keys are merged.
+    """
+    engine = create_engine("sqlite://", poolclass=StaticPool)
+    Base.metadata.create_all(bind=engine)
+    with engine.begin() as connection:
+        connection.execute(text("DROP INDEX uq_assets_merge_key"))
+        connection.execute(text("ALTER TABLE assets DROP COLUMN trade_day"))
+        connection.execute(
+            text(
+                "INSERT INTO assets (isin, name, date, amount, transaction_price, "
+                "currency, currency_transaction, type_) VALUES "
+                "('PLOLD0001', 'Old', '2024-01-01 10:00:00.000000', 1, 10, 'PLN', 'PLN', 'ETF'), "
+                "('PLOLD0001', 'Old', '2024-01-01 15:00:00.000000', 2, 20, 'PLN', 'PLN', 'ETF'), "
+                "('PLOLD0001', 'Old', '2024-01-02 10:00:00.000000', 4, 40, 'PLN', 'PLN', 'ETF')"
+            )
+        )
+
+    db = SessionLocal(bind=engine)
+    try:
+        upgrade_asset_merge_key(db)
+        stored = db.query(Asset).order_by(Asset.id).all()
+        assert [(a.id, a.amount, a.transaction_price) for a in stored] == [
+            (1, 3, 30),
+            (3, 4, 40),
+        ]
+        assert [a.trade_day for a in stored] == [date(2024, 1, 1), date(2024, 1, 2)]
+
+        db.add(
+            Asset(
+                isin="PLOLD0001",
+                name="Old",
+                date=datetime(2024, 1, 2, 12, 0),
+                amount=1,
+                transaction_price=10,
+                currency="PLN",
+                currency_transaction="PLN",
+                type_="ETF",
+            )
+        )
+        with pytest.raises(IntegrityError):
+            db.commit()
+        db.rollback()
+
+        # an upgraded (or newly created) table is left as it is
+        upgrade_asset_merge_key(db)
+        assert db.query(Asset).count() == 2
+    finally:
+        db.close()
+        engine.dispose()
+
+
+def _upsert_row(**values) -> dict:
+    row = {
+        "isin": "PLUPSERT01",
+        "name": None,
+        "date": datetime(2024, 5, 6, 10, 0),
+        "trade_day": date(2024, 5, 6),
+        "amount": 1.0,
+        "transaction_price": 10.0,
+        "currency": "PLN",
+        "currency_transaction": "PLN",
+        "type_": "ETF",
+        "coupon_rate": None,
+        "inflation_first_year": None,
+    }
+    row.update(values)
+    return row
+
+
+def test_upsert_assets_merges_equal_keys_and_locks(tmp_path):
+    engine = create_engine(
+        f"sqlite:///{tmp_path / 'assets.db'}", connect_args={"timeout": 0.1}
+    )
+    Base.metadata.create_all(bind=engine)
+    db = SessionLocal(bind=engine)
+    try:
+        # a missing and an empty name have the same merge key
+        inserted, updated = upsert_assets(
+            db, [_upsert_row(), _upsert_row(name="", amount=2.0)]
+        )
+        db.commit()
+        assert (len(inserted), updated) == (1, [])
+        asset = db.query(Asset).one()
+        assert (asset.amount, asset.transaction_price) == (3.0, 20.0)
+
+        # the stored asset is found by its merge key, not by its exact values
+        inserted, updated = upsert_assets(
+            db, [_upsert_row(name=""), _upsert_row(isin="PLUPSERT02")]
+        )
+        assert [row.isin for row in inserted] == ["PLUPSERT02"]
+        assert updated == [asset.id]
+        # no other writer can insert until the upsert is committed
+        with (
+            engine.connect() as other,
+            pytest.raises(OperationalError, match="locked"),
+        ):
+            other.execute(
+                text("INSERT INTO assets (isin, type_) VALUES ('PLOTHER', 'ETF')")
+            )
+        db.commit()
+        assert db.query(Asset).count() == 2
+    finally:
+        db.close()
+        engine.dispose()
+
+
 def test_delete_asset(client, db_session):
 
     asset = Asset(
@@ -109,3 +230,228 @@ def test_list_assets(client):
     assert isinstance(response.json(), list), (
         f"Expected list, got {type(response.json())}: {response.json()}"
     )
+
+
+def test_list_assets_pages_and_stream(client, db_session):
+    assets = [
+        Asset(
+            isin=f"PLPAGE{number:04d}",
+            name="Page ETF",
+            date=datetime(2024, 1, 1),
+            amount=number,
+            transaction_price=10.0 * number,
+            currency="PLN",
+            currency_transaction="PLN",
+            type_="ETF",
+        )
+        for number in range(1, 8)
+    ]
+    db_session.add_all(assets)
+    db_session.commit()
+
+    try:
+        pages = []
+        params = {"limit": 3, "after_id": assets[0].id - 1}
+        while True:
+            response = client.get("/assets/list", params=params)
+            assert response.status_code == 200, response.text
+            pages.append(response.json())
+            cursor = response.headers.get("X-Next-Cursor")
+            if cursor is None:
+                break
+            params["after_id"] = cursor
+        listed = [row for page in pages for row in page]
+        assert all(len(page) == 3 for page in pages[:-1])
+        assert [row["id"] for row in listed[:7]] == [asset.id for asset in assets]
+        assert [row["id"] for row in listed] == sorted(row["id"] for row in listed)
+
+        after = {"after_id": assets[0].id - 1}
+        ndjson = client.get("/assets/list", params={**after, "stream": "ndjson"})
+        assert ndjson.headers["content-type"] == "application/x-ndjson"
+        assert [json.loads(line) for line in ndjson.text.splitlines()] == listed
+
+        array = client.get("/assets/list", params={**after, "stream": "json"})
+        assert array.json() == listed
+    finally:
+        for asset in assets:
+            db_session.delete(asset)
+        db_session.commit()
+
+
+def test_list_assets_invalid_limit(client):
+    response = client.get("/assets/list", params={"limit": 0})
+    assert response.status_code == 400
+
+
+UPLOAD_CSV = """ISIN,NAME,TYPE,CURRENCY,CURRENCY TRANSACTION,DATE,QUANTITY,TRANSACTION PRICE,COUPON RATE (%),INFLATION_FIRST_YEAR
+plupload0001,Upload ETF,etf,PLN,PLN,05.03.2024 10:00,2,200,,
+PLUPLOAD0001,Upload ETF,ETF,PLN,PLN,05.03.2024 15:30,3,330,,
+PLUPLOAD0001,Upload ETF,ETF,PLN,PLN,06.03.2024 09:00,1,101,,
+EDO0334,Upload EDO,BOND,PLN,PLN,2024-03-05,10,1000,1.5,6.8
+"""
+
+
+def test_upload_portfolio_merges_same_day(client, db_session):
+    response = client.post(
+        "/assets/upload", files={"file": ("portfolio.csv", UPLOAD_CSV)}
+    )
+    assert response.status_code == 200, (
+        f"Expected 200, got {response.status_code}. Response: {response.text}"
+    )
+    assert response.json()["inserted"] == 3, f"Unexpected result: {response.json()}"
+
+    response = client.post(
+        "/assets/upload", files={"file": ("portfolio.csv", UPLOAD_CSV)}
+    )
+    assert response.json()["updated"] == 3, f"Unexpected result: {response.json()}"
+
+    etf = (
+        db_session.query(Asset)
+        .filter(Asset.isin == "PLUPLOAD0001")
+        .order_by(Asset.date)
+        .all()
+    )
+    assert [(a.amount, a.transaction_price) for a in etf] == [(10, 1060), (2, 202)]
+    assert etf[0].date == datetime(2024, 3, 5, 10, 0)
+
+    edo = db_session.query(Asset).filter(Asset.isin == "EDO0334").one()
+    assert (edo.coupon_rate, edo.inflation_first_year) == (0.015, 0.068)
+
+    for asset in etf + [edo]:
+        client.delete("/assets/delete", params={"asset_id": asset.id})
+
+
+def test_upload_portfolio_invalid_row(client):
+    csv = UPLOAD_CSV.replace("2024-03-05,10", "2024-13-45,10")
+    response = client.post("/assets/upload", files={"file": ("portfolio.csv", csv)})
+
+    assert response.status_code == 400, (
+        f"Expected 400, got {response.status_code}. Response: {response.text}"
+    )
+    assert "row 4" in response.json()["detail"]
+
+
+def test_upload_portfolio_floating_bond_requires_first_month_rate(client):
+    csv = UPLOAD_CSV.replace(
+        "EDO0334,Upload EDO,BOND,PLN,PLN,2024-03-05,10,1000,1.5,6.8",
+        "ROR0325,Upload ROR,BOND,PLN,PLN,2024-03-05,10,1000,0.1,",
+    )
+    response = client.post("/assets/upload", files={"file": ("portfolio.csv", csv)})
+
+    assert response.status_code == 400, (
+        f"Expected 400, got {response.status_code}. Response: {response.text}"
+    )
+    assert response.json()["detail"] == (
+        "ROR/DOR bonds require coupon_rate (margin) and inflation_first_year "
+        "(fixed rate of the first month) (ROR0325, row 4)"
+    )
+
+
+def test_upload_portfolio_stream_keeps_valid_rows(client, db_session):
+    csv = (
+        UPLOAD_CSV.replace("PLUPLOAD0001", "PLSTREAM0001")
+        .replace("plupload0001", "plstream0001")
+        .replace("2024-03-05,10", "2024-13-45,10")
+    )
+    response = client.post(
+        "/assets/upload",
+        params={"stream": True, "chunk_rows": 1},
+        files={"file": ("portfolio.csv", csv)},
+    )
+
+    assert response.status_code == 200, (
+        f"Expected 200, got {response.status_code}. Response: {response.text}"
+    )
+    data = response.json()
+    assert data["status"] == "partial", f"Unexpected result: {data}"
+    assert data["rows"] == 4
+    assert data["errors"] == [
+        {"row": 4, "isin": "EDO0334", "error": "Invalid date format"}
+    ]
+
+    # the same day rows from two chunks end up in one asset
+    stored = db_session.query(Asset).filter(Asset.isin == "PLSTREAM0001").all()
+    assert sorted(a.amount for a in stored) == [1, 5]
+    for asset in stored:
+        client.delete("/assets/delete", params={"asset_id": asset.id})
+
+
+def _wait_for_job(client, job_id, timeout=30):
+    deadline = time.monotonic() + timeout
+    while True:
+        data = client.get(f"/assets/jobs/{job_id}").json()
+        if data["status"] in ("done", "failed") or time.monotonic() > deadline:
+            return data
+        time.sleep(0.05)
+
+
+def test_upload_portfolio_async_job(client, db_session):
+    csv = UPLOAD_CSV.replace("PLUPLOAD0001", "PLASYNC0001").replace(
+        "plupload0001", "plasync0001"
+    )
+    response = client.post(
+        "/assets/upload",
+        params={"async": True, "chunk_rows": 2},
+        files={"file": ("portfolio.csv", csv)},
+    )
+
+    assert response.status_code == 200, (
+        f"Expected 200, got {response.status_code}. Response: {response.text}"
+    )
+    job_id = response.json()["job_id"]
+    data = _wait_for_job(client, job_id)
+    assert data["status"] == "done", f"Unexpected job: {data}"
+    assert data["progress"] == 1.0
+    assert data["rows"] == 4
+    assert data["error_count"] == 0
+    assert data["rows_per_second"] > 0
+
+    job = db_session.get(ImportJob, job_id)
+    assert not os.path.exists(job.path), "Stored file should be removed"
+    stored = db_session.query(Asset).filter(Asset.isin == "PLASYNC0001").all()
+    assert sum(a.amount for a in stored) == 6
+    bonds = db_session.query(Asset).filter(Asset.isin == "EDO0334").all()
+    for asset in stored + bonds:
+        client.delete("/assets/delete", params={"asset_id": asset.id})
+
+
+def test_import_job_resumes_after_committed_chunks(client, db_session, tmp_path):
+    """
+    A job interrupted after its first chunk continues with the second one.
+    """
+    path = tmp_path / "portfolio.csv"
+    path.write_text(
+        UPLOAD_CSV.replace("PLUPLOAD0001", "PLRESUME0001").replace(
+            "plupload0001", "plresume0001"
+        )
+    )
+    job = ImportJob(
+        filename="portfolio.csv",
+        path=str(path),
+        size=path.stat().st_size,
+        chunk_rows=2,
+        status="running",
+        rows=2,
+        inserted=1,
+        updated=0,
+        error_count=0,
+    )
+    db_session.add(job)
+    db_session.commit()
+
+    run_import_job(job.id)
+
+    data = client.get(f"/assets/jobs/{job.id}").json()
+    assert data["status"] == "done", f"Unexpected job: {data}"
+    assert data["rows"] == 4
+    db_session.expire_all()
+    stored = db_session.query(Asset).filter(Asset.isin == "PLRESUME0001").all()
+    assert [a.amount for a in stored] == [1], "Rows of the first chunk were repeated"
+    bonds = db_session.query(Asset).filter(Asset.isin == "EDO0334").all()
+    for asset in stored + bonds:
+        client.delete("/assets/delete", params={"asset_id": asset.id})
+
+
+def test_get_import_job_not_exist(client):
+    response = client.get("/assets/jobs/999999")
+    assert response.status_code == 404
@@ -1,4 +1,16 @@
-from models import Equity
+from datetime import date, datetime
+
+import pandas as pd
+import pytest
+from db import Base, SessionLocal
+from fastapi import HTTPException
+from models import Asset, Equity, Forex, Price, SymbolCurrency
+from services import market_data_services, price_service
+from services.forex_index import forex_index
+from services.isin_resolver import IsinResolver, isin_resolver
+from services.portfolio_valuation_service import calculate_portfolio_value
+from sqlalchemy import create_engine
+from sqlalchemy.pool import StaticPool
 
 GET_SYMBOL = {
     "US0378331005": "AAPL",  # Apple
@@ -105,3 +117,306 @@ def test_get_equities(client):
             errors.append(f"{isin}: expected [{expected_symbol}], got {data}")
 
     assert not errors, f"Found errors: {errors}"
+
+
+class LocalPriceProvider:
+    """
+    Stand-in for yfinance: stored closes, calls are recorded.
+    """
+
+    def __init__(self, closes: dict, currency: str = "USD"):
+        self.data = closes
+        self.currency_of_symbols = currency
+        self.calls = []
+
+    def closes(self, symbols, start, end):
+        self.calls.append(list(symbols))
+        return {
+            symbol: [(day, close) for day, close in values if start <= day < end]
+            for symbol, values in self.data.items()
+            if symbol in symbols and any(start <= day < end for day, _ in values)
+        }
+
+    def currency(self, symbol):
+        return self.currency_of_symbols
+
+
+@pytest.fixture
+def local_prices():
+    today = date.today()
+    provider = LocalPriceProvider(
+        {
+            "LOCALA": [(date(2024, 3, 1), 10.0), (today, 12.0)],
+            "LOCALB": [(date(2024, 3, 1), 20.0)],
+            "LOCALC": [(date(2024, 3, 1), 10.0)],
+        }
+    )
+    previous = price_service.set_price_provider(provider)
+    yield provider
+    price_service.set_price_provider(previous)
+    price_service.clear_today_prices()
+    db = SessionLocal()
+    for model in (Price, SymbolCurrency):
+        db.query(model).filter(model.symbol.like("LOCAL%")).delete(
+            synchronize_session=False
+        )
+    db.commit()
+    db.close()
+
+
+def test_prices_read_through_past_date(db_session, local_prices):
+    price = price_service.get_price(db_session, "LOCALA", "2024-03-01")
+    assert price == {
+        "symbol": "LOCALA",
+        "date": "2024-03-01",
+        "price": 10.0,
+        "currency": "USD",
+    }
+    stored = db_session.query(Price).filter(Price.symbol == "LOCALA").all()
+    assert [(row.date, row.close, row.currency) for row in stored] == [
+        (date(2024, 3, 1), 10.0, "USD")
+    ]
+
+    # the stored price is read locally, only the missing symbol is fetched
+    prices = price_service.get_prices(db_session, ["LOCALA", "LOCALB"], "2024-03-01")
+    assert {symbol: p["price"] for symbol, p in prices.items()} == {
+        "LOCALA": 10.0,
+        "LOCALB": 20.0,
+    }
+    assert local_prices.calls == [["LOCALA"], ["LOCALB"]]
+    assert price_service.get_price(db_session, "LOCALA", "2024-03-01") == price
+    assert len(local_prices.calls) == 2
+
+
+def test_prices_no_trading_day_stored(db_session, local_prices):
+    # 2024-03-02 is a Saturday: no close, asked for once
+    for _ in range(2):
+        assert price_service.get_prices(db_session, ["LOCALC"], "2024-03-02") == {}
+    assert local_prices.calls == [["LOCALC"]]
+    stored = db_session.query(Price).filter(Price.symbol == "LOCALC").all()
+    assert [(row.date, row.close) for row in stored] == [(date(2024, 3, 2), None)]
+    with pytest.raises(HTTPException) as exc:
+        price_service.get_price(db_session, "LOCALC", "2024-03-02")
+    assert exc.value.status_code == 404
+    assert len(local_prices.calls) == 1
+
+
+def test_prices_write_back_keeps_caller_transaction(db_session, local_prices):
+    pending = Equity(symbol="LOCALP", isin="XXLOCALP0001", name="Pending")
+    db_session.add(pending)
+    price_service.get_prices(db_session, ["LOCALB"], "2024-03-01")
+    price_service.symbol_currency(db_session, "LOCALA")
+    db_session.rollback()
+    assert db_session.query(Equity).filter(Equity.symbol == "LOCALP").count() == 0
+    assert db_session.query(Price).filter(Price.symbol == "LOCALB").count() == 1
+
+
+def test_symbol_currency_without_price_rows(db_session, local_prices):
+    local_prices.currency_of_symbols = "XTD"
+    prices = price_service.get_prices(db_session, ["LOCALA"])
+    assert prices["LOCALA"]["price"] == 12.0
+    assert db_session.query(Price).filter(Price.symbol == "LOCALA").count() == 0
+    assert price_service.symbol_currency(db_session, "LOCALA") == "XTD"
+    local_prices.currency_of_symbols = None
+    assert price_service.symbol_currency(db_session, "LOCALA") == "XTD"
+
+
+def test_prices_today_cached_with_ttl(db_session, local_prices, monkeypatch):
+    assert price_service.get_prices(db_session, ["LOCALA"])["LOCALA"]["price"] == 12.0
+    assert price_service.get_prices(db_session, ["LOCALA"])["LOCALA"]["price"] == 12.0
+    assert local_prices.calls == [["LOCALA"]]
+    # the close of today still changes, it is not stored
+    assert not (
+        db_session.query(Price)
+        .filter(Price.symbol == "LOCALA", Price.date == date.today())
+        .first()
+    )
+
+    monkeypatch.setattr(price_service, "PRICE_TODAY_TTL", 0)
+    price_service.clear_today_prices()
+    price_service.get_prices(db_session, ["LOCALA"])
+    price_service.get_prices(db_session, ["LOCALA"])
+    assert len(local_prices.calls) == 3
+
+
+def test_calc_current_value_equity_local_prices(client, db_session, local_prices):
+    local_prices.currency_of_symbols = "XLC"
+    equity = Equity(symbol="LOCALC", isin="XXLOCALC0001", name="Local C")
+    rate = Forex(
+        first_currency="XLC",
+        second_currency="PLN",
+        value=4.0,
+        date=datetime(2024, 3, 1),
+    )
+    asset = Asset(
+        isin="XXLOCALC0001",
+        name="Local C",
+        date=datetime(2024, 2, 1),
+        amount=3,
+        transaction_price=25,
+        currency="XLC",
+        currency_transaction="PLN",
+        type_="EQUITIES",
+    )
+    db_session.add_all([equity, rate, asset])
+    db_session.commit()
+    forex_index.invalidate()
+
+    try:
+        response = client.get(
+            "/assets/calc_current_value",
+            params={"id": asset.id, "date_to_calculate": "2024-03-01"},
+        )
+        assert response.status_code == 200, response.text
+        assert response.json()[0]["value"] == 120.0
+    finally:
+        db_session.delete(asset)
+        db_session.delete(rate)
+        db_session.delete(equity)
+        db_session.commit()
+
+
+def test_portfolio_value_currency_from_provider(db_session, local_prices):
+    local_prices.currency_of_symbols = "XLC"
+    equity = Equity(
+        symbol="LOCALB", isin="XXLOCALB0001", name="Local B", currency="Unknown"
+    )
+    rate = Forex(
+        first_currency="XLC",
+        second_currency="PLN",
+        value=4.0,
+        date=datetime(2024, 3, 1),
+    )
+    asset = Asset(
+        isin="XXLOCALB0001",
+        name="Local B",
+        date=datetime(2024, 2, 1),
+        amount=2,
+        transaction_price=25,
+        currency="XLC",
+        currency_transaction="PLN",
+        type_="EQUITIES",
+    )
+    db_session.add_all([equity, rate, asset])
+    db_session.commit()
+    forex_index.invalidate()
+    isin_resolver.invalidate()
+
+    try:
+        result = calculate_portfolio_value(
+            [asset], db_session, "2024-03-01", date(2024, 3, 1)
+        )
+        row = result["assets"][0]
+        assert row["currency_yfinance"] == "XLC", row
+        assert row["value"] == 160.0
+        # stored with the prices like by get_price, not asked for again
+        stored = db_session.query(Price).filter(Price.symbol == "LOCALB").all()
+        assert [row.currency for row in stored] == ["XLC"]
+        local_prices.currency_of_symbols = None
+        assert price_service.symbol_currency(db_session, "LOCALB") == "XLC"
+    finally:
+        db_session.query(Price).filter(Price.symbol == "LOCALB").delete()
+        db_session.delete(asset)
+        db_session.delete(rate)
+        db_session.delete(equity)
+        db_session.commit()
+        isin_resolver.invalidate()
+
+
+class FakeEquities:
+    """
+    Stand-in for fd.Equities: a small universe indexed by symbol.
+    """
+
+    def select(self):
+        return pd.DataFrame(
+            {
+                "symbol": ["AAA", "BBB", "CCC", "AAA", None],
+                "isin": ["XS0000000001", None, "XS0000000003", "XS0000000009", "X"],
+                "name": ["A", "B", "C", "A again", "no symbol"],
+                "currency": ["USD", "EUR", None, "USD", "USD"],
+                "summary": ["not stored"] * 5,
+            }
+        ).set_index("symbol")
+
+
+def test_import_all_equities_bulk(monkeypatch):
+    monkeypatch.setattr(market_data_services.fd, "Equities", FakeEquities)
+    monkeypatch.setattr(market_data_services, "EQUITY_BATCH_ROWS", 2)
+    engine = create_engine("sqlite://", poolclass=StaticPool)
+    Base.metadata.create_all(bind=engine)
+    db = SessionLocal(bind=engine)
+    try:
+        market_data_services.import_all_equities_once(db)
+
+        rows = db.query(Equity).order_by(Equity.symbol).all()
+        assert [(e.symbol, e.isin, e.currency, e.sector) for e in rows] == [
+            ("AAA", "XS0000000001", "USD", "Unknown"),
+            ("BBB", "Unknown", "EUR", "Unknown"),
+            ("CCC", "XS0000000003", "Unknown", "Unknown"),
+        ]
+        assert rows[0].summary is None
+
+        # a filled table is not imported again
+        market_data_services.import_all_equities_once(db)
+        assert db.query(Equity).count() == 3
+    finally:
+        db.close()
+
+
+def test_isin_resolver_invalidated_by_add_and_delete(client, db_session):
+    isin = "XS9999999991"
+    assert isin_resolver.resolve(db_session, isin) == []
+    hits = isin_resolver.stats()["hits"]
+    assert isin_resolver.resolve(db_session, isin) == []
+    assert isin_resolver.stats()["hits"] == hits + 1
+
+    response = client.post(
+        "/equities/add",
+        params={
+            "symbol": "RESOLVA",
+            "name": "Resolver",
+            "isin": isin,
+            "currency": "USD",
+        },
+    )
+    assert response.status_code == 200
+    assert isin_resolver.resolve(db_session, isin) == [("RESOLVA", "USD")]
+
+    response = client.delete("/equities/delete", params={"symbol": "RESOLVA"})
+    assert response.status_code == 200
+    assert isin_resolver.resolve(db_session, isin) == []
+
+
+def test_isin_resolver_bulk_and_bounded():
+    engine = create_engine("sqlite://", poolclass=StaticPool)
+    Base.metadata.create_all(bind=engine)
+    db = SessionLocal(bind=engine)
+    try:
+        db.add_all(
+            [
+                Equity(symbol="BBB", isin="XS0000000001", name="B"),
+                Equity(symbol="AAA", isin="XS0000000001", name="A"),
+                Equity(symbol="CCC", isin="XS0000000002", name="C", currency="EUR"),
+            ]
+        )
+        db.commit()
+        resolver = IsinResolver(maxsize=2)
+
+        assert resolver.resolve_many(
+            db, ["XS0000000002", "XS0000000001", "XS0000000003", "XS0000000001"]
+        ) == {
+            "XS0000000001": [("AAA", None), ("BBB", None)],
+            "XS0000000002": [("CCC", "EUR")],
+            "XS0000000003": [],
+        }
+        stats = resolver.stats()
+        assert (stats["size"], stats["misses"], stats["evictions"]) == (2, 3, 1)
+
+        # the least recently used ISIN was evicted and is queried again
+        resolver.resolve_many(db, ["XS0000000002", "XS0000000003"])
+        resolver.resolve(db, "XS0000000001")
+        assert resolver.stats()["hits"] == 2
+        assert resolver.stats()["misses"] == 4
+    finally:
+        db.close()
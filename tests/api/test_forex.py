@@ -1,5 +1,45 @@
-from datetime import datetime
+from datetime import date, datetime
+import numpy as np
+import pytest
+import pandas as pd
+from sqlalchemy import create_engine, func, inspect, text
+from sqlalchemy.pool import StaticPool
+from db import Base, SessionLocal
 from models import Forex
+from services import market_data_services
+from services.forex_index import forex_index
+from services.market_data_services import (
+    compact_forex,
+    get_forex_rate,
+    get_forex_rates,
+    import_all_forex_once,
+)
+
+
+def _memory_session():
+    engine = create_engine("sqlite://", poolclass=StaticPool)
+    Base.metadata.create_all(bind=engine)
+    return SessionLocal(bind=engine)
+
+
+class FakeDownload:
+    """
+    Stand-in for yf.download: a daily close (1 + day of month / 100) for every
+    requested symbol, requested ranges are recorded.
+    """
+
+    def __init__(self):
+        self.calls = []
+
+    def __call__(self, symbols, start, end, **kwargs):
+        self.calls.append((sorted(symbols), start))
+        days = pd.date_range(start, end, freq="D", inclusive="left").normalize()
+        columns = pd.MultiIndex.from_product([["Close"], symbols])
+        return pd.DataFrame(
+            [[1 + day.day / 100] * len(symbols) for day in days],
+            index=days,
+            columns=columns,
+        )
 
 
 def test_forex_pairs_exist_in_db(db_session):
@@ -67,3 +107,246 @@ def test_forex_list(client, db_session):
 
     assert data[-1]["date"] == "2099-01-02"
     assert data[-1]["value"] == 4.6
+
+
+def test_forex_rates_batch_lookup(db_session):
+    db_session.add_all(
+        [
+            Forex(
+                first_currency="XAA",
+                second_currency="PLN",
+                value=2.0,
+                date=datetime(2098, 1, 1),
+            ),
+            Forex(
+                first_currency="XAA",
+                second_currency="PLN",
+                value=2.5,
+                date=datetime(2098, 1, 3, 12),
+            ),
+            Forex(
+                first_currency="XAB",
+                second_currency="PLN",
+                value=3.0,
+                date=datetime(2098, 1, 2),
+            ),
+        ]
+    )
+    db_session.commit()
+    forex_index.invalidate()
+
+    rates = get_forex_rates(
+        db_session,
+        [("XAA", "PLN"), ("xab", "pln"), ("XAC", "PLN"), ("PLN", "PLN")],
+        date(2098, 1, 2),
+    )
+
+    assert rates == {("XAA", "PLN"): 2.0, ("XAB", "PLN"): 3.0, ("PLN", "PLN"): 1.0}
+    for first, second in [("XAA", "PLN"), ("XAB", "PLN")]:
+        for day in (date(2098, 1, 2), date(2098, 1, 3)):
+            assert get_forex_rates(db_session, [(first, second)], day)[
+                (first, second)
+            ] == get_forex_rate(db_session, first, second, day)
+
+
+def test_import_forex_incremental(monkeypatch):
+    download = FakeDownload()
+    monkeypatch.setattr(market_data_services.yf, "download", download)
+    monkeypatch.setattr(market_data_services, "FOREX_HISTORY_DAYS", 10)
+    db = _memory_session()
+    try:
+        import_all_forex_once(db)
+        first_count = db.query(Forex).count()
+        days = db.query(Forex.date).distinct().count()
+        assert days >= 10
+        assert first_count == days * len(market_data_services.FOREX_PAIRS)
+        # all pairs start on the same day, they are downloaded at once
+        assert len(download.calls) == 1
+
+        import_all_forex_once(db)
+        # only the last stored day is fetched again and it replaces the stored rate
+        last_day = db.query(func.max(Forex.date)).scalar().date()
+        assert download.calls[1][1] == last_day
+        assert db.query(Forex).count() == first_count
+    finally:
+        db.close()
+
+
+def test_compact_forex():
+    db = _memory_session()
+    try:
+        db.execute(text("DROP INDEX uq_forex_pair_date"))
+        day = datetime(2024, 3, 1)
+        db.add_all(
+            [
+                Forex(first_currency="USD", second_currency="PLN", value=4.0, date=day),
+                Forex(first_currency="USD", second_currency="PLN", value=4.1, date=day),
+                Forex(first_currency="EUR", second_currency="PLN", value=4.3, date=day),
+            ]
+        )
+        db.commit()
+
+        assert compact_forex(db) == 1
+        rows = db.query(Forex.first_currency, Forex.value).order_by(Forex.id).all()
+        assert rows == [("USD", 4.1), ("EUR", 4.3)]
+        assert "uq_forex_pair_date" in {
+            index["name"] for index in inspect(db.get_bind()).get_indexes("forex")
+        }
+        assert compact_forex(db) == 0
+    finally:
+        db.close()
+
+
+def test_forex_index_as_of_lookup():
+    db = _memory_session()
+    try:
+        db.add_all(
+            [
+                Forex(
+                    first_currency="USD",
+                    second_currency="PLN",
+                    value=4.0,
+                    date=datetime(2024, 3, 1),
+                ),
+                Forex(
+                    first_currency="USD",
+                    second_currency="PLN",
+                    value=4.2,
+                    date=datetime(2024, 3, 4, 18),
+                ),
+                Forex(
+                    first_currency="EUR",
+                    second_currency="PLN",
+                    value=4.3,
+                    date=datetime(2024, 3, 1),
+                ),
+            ]
+        )
+        db.commit()
+        forex_index.invalidate()
+
+        assert forex_index.rate(db, "usd", "pln", date(2024, 3, 3)) == 4.0
+        # a rate later on the same day is used
+        assert forex_index.rate(db, "USD", "PLN", date(2024, 3, 4)) == 4.2
+        assert forex_index.rate(db, "USD", "PLN", date(2024, 2, 29)) is None
+        assert forex_index.rate(db, "PLN", "PLN", date(2024, 2, 29)) == 1.0
+
+        converted = forex_index.convert(
+            db,
+            [1, 2, 3, 4, 5],
+            ["USD", "EUR", "USD", "PLN", "CHF"],
+            "PLN",
+            [
+                date(2024, 3, 1),
+                date(2024, 3, 2),
+                date(2024, 3, 5),
+                date(2024, 3, 5),
+                date(2024, 3, 5),
+            ],
+        )
+        assert converted[:4].tolist() == pytest.approx([4.0, 8.6, 12.6, 4.0])
+        assert np.isnan(converted[4])
+    finally:
+        db.close()
+        forex_index.invalidate()
+
+
+def test_forex_index_cross_rates():
+    db = _memory_session()
+    try:
+        db.add_all(
+            [
+                Forex(
+                    first_currency="USD",
+                    second_currency="PLN",
+                    value=4.0,
+                    date=datetime(2024, 3, 1),
+                ),
+                Forex(
+                    first_currency="EUR",
+                    second_currency="PLN",
+                    value=4.4,
+                    date=datetime(2024, 3, 4),
+                ),
+                Forex(
+                    first_currency="USD",
+                    second_currency="PLN",
+                    value=3.6,
+                    date=datetime(2024, 3, 6),
+                ),
+            ]
+        )
+        db.commit()
+        forex_index.invalidate()
+
+        assert forex_index.rate(db, "PLN", "USD", date(2024, 3, 2)) == 0.25
+        # no EUR rate yet
+        assert forex_index.rate(db, "USD", "EUR", date(2024, 3, 2)) is None
+        assert forex_index.rate(db, "USD", "EUR", date(2024, 3, 5)) == pytest.approx(
+            4.0 / 4.4
+        )
+        assert forex_index.rate(db, "EUR", "USD", date(2024, 3, 7)) == pytest.approx(
+            4.4 / 3.6
+        )
+        assert forex_index.rate(db, "USD", "CHF", date(2024, 3, 7)) is None
+
+        rates = get_forex_rates(db, [("USD", "EUR"), ("EUR", "PLN")], date(2024, 3, 6))
+        assert rates == {
+            ("EUR", "PLN"): 4.4,
+            ("USD", "EUR"): pytest.approx(3.6 / 4.4),
+        }
+        assert market_data_services.get_forex_rate(
+            db, "usd", "eur", date(2024, 3, 6)
+        ) == pytest.approx(3.6 / 4.4)
+    finally:
+        db.close()
+        forex_index.invalidate()
+
+
+def test_forex_list_resampled_columnar(client, db_session):
+    values = [
+        (datetime(2098, 1, 6), 4.0),
+        (datetime(2098, 1, 7), 4.4),
+        (datetime(2098, 1, 9), 4.2),
+        (datetime(2098, 1, 13), float("nan")),
+        (datetime(2098, 2, 3), 4.8),
+    ]
+    db_session.add_all(
+        Forex(first_currency="XRS", second_currency="PLN", value=value, date=day)
+        for day, value in values
+    )
+    db_session.commit()
+    params = {"first_currency": "XRS", "second_currency": "PLN"}
+
+    response = client.get("/forex/list", params={**params, "format": "columnar"})
+    assert response.status_code == 200
+    assert response.json() == {
+        "dates": ["2098-01-06", "2098-01-07", "2098-01-09", "2098-02-03"],
+        "values": [4.0, 4.4, 4.2, 4.8],
+    }
+
+    response = client.get("/forex/list", params={**params, "interval": "month"})
+    assert response.json() == [
+        {"date": "2098-01-01", "value": 4.2},
+        {"date": "2098-02-01", "value": 4.8},
+    ]
+
+    response = client.get(
+        "/forex/list",
+        params={**params, "interval": "week", "agg": "ohlc", "format": "columnar"},
+    )
+    assert response.json() == {
+        "dates": ["2098-01-06", "2098-02-03"],
+        "open": [4.0, 4.8],
+        "high": [4.4, 4.8],
+        "low": [4.0, 4.8],
+        "close": [4.2, 4.8],
+    }
+
+    response = client.get(
+        "/forex/list", params={**params, "interval": "month", "agg": "mean"}
+    )
+    assert response.json()[0]["value"] == pytest.approx(4.2)
+
+    response = client.get("/forex/list", params={**params, "interval": "year"})
+    assert response.status_code == 400
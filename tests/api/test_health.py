@@ -0,0 +1,92 @@
+from datetime import datetime
+
+import pytest
+from db import Base, SessionLocal, get_db
+from main import app
+from models import Forex, Inflation
+from services import bootstrap_service
+from sqlalchemy import create_engine
+from sqlalchemy.pool import StaticPool
+
+
+@pytest.fixture()
+def empty_db(monkeypatch):
+    """
+    An empty in-memory database used by the app, with a fresh bootstrap state.
+    """
+    engine = create_engine(
+        "sqlite://",
+        connect_args={"check_same_thread": False},
+        poolclass=StaticPool,
+    )
+    Base.metadata.create_all(bind=engine)
+    db = SessionLocal(bind=engine)
+    monkeypatch.setattr(bootstrap_service, "_state", bootstrap_service.initial_state())
+    app.dependency_overrides[get_db] = lambda: db
+    try:
+        yield db
+    finally:
+        app.dependency_overrides.pop(get_db, None)
+        db.close()
+
+
+def test_health_ready_and_503_until_loaded(client, empty_db):
+    response = client.get("/health/ready")
+    assert response.status_code == 503
+    body = response.json()
+    assert body["ready"] is False
+    assert set(body["datasets"]) == {"inflation", "reference_rate", "equities", "forex"}
+    assert body["datasets"]["forex"]["status"] == "pending"
+
+    params = {"first_currency": "USD", "second_currency": "PLN"}
+    response = client.get("/forex/list", params=params)
+    assert response.status_code == 503
+    assert response.headers["Retry-After"] == str(bootstrap_service.RETRY_AFTER)
+    assert "forex" in response.json()["detail"]
+
+    empty_db.add(
+        Forex(
+            first_currency="USD",
+            second_currency="PLN",
+            value=4.0,
+            date=datetime(2024, 1, 2),
+        )
+    )
+    empty_db.commit()
+    response = client.get("/forex/list", params=params)
+    assert response.status_code == 200
+
+    response = client.get("/health/ready")
+    assert response.json()["datasets"]["forex"]["loaded"] is True
+
+
+def test_load_datasets_records_failures(monkeypatch, empty_db):
+    def fail(db):
+        raise RuntimeError("yfinance is down")
+
+    def load_inflation(db):
+        db.add(Inflation(year=2024, month=1, value=0.03))
+        db.commit()
+
+    monkeypatch.setattr(
+        bootstrap_service,
+        "DATASETS",
+        {
+            "inflation": (Inflation, load_inflation),
+            "reference_rate": (bootstrap_service.Reference_Rate, lambda db: None),
+            "equities": (bootstrap_service.Equity, lambda db: None),
+            "forex": (Forex, fail),
+        },
+    )
+    monkeypatch.setattr(bootstrap_service, "SessionLocal", lambda: empty_db)
+
+    bootstrap_service.load_datasets()
+
+    state = bootstrap_service.readiness(empty_db)
+    assert state["datasets"]["inflation"]["status"] == "ready"
+    assert state["datasets"]["inflation"]["loaded"] is True
+    assert state["datasets"]["forex"]["status"] == "failed"
+    assert state["datasets"]["forex"]["error"] == "yfinance is down"
+    # tables without rows are not ready even when their loader finished
+    assert state["datasets"]["equities"]["loaded"] is False
+    assert state["ready"] is False
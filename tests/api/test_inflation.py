@@ -1,4 +1,21 @@
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from urllib.parse import parse_qs, urlparse
+
+import pytest
+from fastapi import HTTPException
 from models import Inflation
+from services import inflation_service
+from services.bond_pricing_service import _resolve_inflation_with_fallback
+from services.inflation_service import (
+    ID_PERIOD_TO_MONTH_GUS_API,
+    GusRateLimited,
+    RateLimiter,
+    get_inflation,
+    inflation_index,
+    prefetch_inflation,
+)
 
 
 def test_inflation_list(client):
@@ -83,3 +100,173 @@ def test_add_inflation_duplicate(client, db_session):
     assert response.status_code == 400, (
         f"Expected 400 for duplicate entry, got {response.status_code}. Response: {response.text}"
     )
+
+
+def test_inflation_index_refreshed_on_add_and_delete(client, db_session):
+    assert inflation_index.get(db_session, 3, 2098) is None
+
+    response = client.post(
+        "/inflation/add", params={"month": 3, "year": 2098, "value": 0.07}
+    )
+    assert response.status_code == 200, (
+        f"Expected 200, got {response.status_code}. Response: {response.text}"
+    )
+    assert inflation_index.get(db_session, 3, 2098) == 0.07, (
+        "Inflation index not refreshed after add"
+    )
+
+    record = db_session.query(Inflation).filter_by(month=3, year=2098).first()
+    response = client.delete("/inflation/delete", params={"inflation_id": record.id})
+    assert response.status_code == 200, (
+        f"Expected 200, got {response.status_code}. Response: {response.text}"
+    )
+    assert inflation_index.get(db_session, 3, 2098) is None, (
+        "Inflation index not refreshed after delete"
+    )
+
+
+@pytest.fixture()
+def gus_stub(monkeypatch):
+    """
+    Local stand-in for GUS API: publishes January-March 2097, answers 404 for 2095
+    and records requests.
+    """
+    requests_seen = []
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            query = parse_qs(urlparse(self.path).query)
+            requests_seen.append(query)
+            year = int(query["id-rok"][0])
+            if year == 2095:
+                self.send_response(404)
+                self.end_headers()
+                return
+            data = [
+                {
+                    "id-pozycja-2": 6656078,
+                    "id-sposob-prezentacji-miara": 5,
+                    "id-okres": ID_PERIOD_TO_MONTH_GUS_API[month],
+                    "wartosc": 100 + month,
+                }
+                for month in (1, 2, 3)
+                if year == 2097
+            ]
+            body = json.dumps({"data": data}).encode()
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    server = HTTPServer(("127.0.0.1", 0), Handler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    monkeypatch.setattr(
+        inflation_service, "GUS_API_URL", f"http://127.0.0.1:{server.server_port}"
+    )
+    monkeypatch.setattr(inflation_service, "gus_rate_limiter", RateLimiter(100, 1.0))
+    monkeypatch.setattr(inflation_service, "_unpublished", {})
+    yield requests_seen
+    server.shutdown()
+    server.server_close()
+
+
+def test_prefetch_inflation_one_call_per_year(gus_stub, db_session):
+    keys = [2097 * 12 + month - 1 for month in (1, 2, 3, 4)]
+    keys += [2096 * 12 + 5]
+    try:
+        added = prefetch_inflation(db_session, keys)
+
+        assert added == 3, f"Expected 3 months added, got {added}"
+        assert len(gus_stub) == 2, f"Expected one call per year, got {gus_stub}"
+        assert inflation_index.get(db_session, 2, 2097) == 0.02
+        assert inflation_index.get(db_session, 4, 2097) is None
+
+        # cached and not published months are not asked again
+        assert prefetch_inflation(db_session, keys) == 0
+        assert len(gus_stub) == 2, f"Expected no new calls, got {gus_stub}"
+    finally:
+        db_session.query(Inflation).filter(Inflation.year == 2097).delete()
+        db_session.commit()
+        inflation_index.invalidate()
+
+
+def test_prefetch_inflation_stores_whole_year(gus_stub, db_session):
+    try:
+        assert prefetch_inflation(db_session, [2097 * 12]) == 3
+        assert inflation_index.get(db_session, 3, 2097) == 0.03
+        # already stored months are not added again
+        assert prefetch_inflation(db_session, [2097 * 12 + 3]) == 0
+    finally:
+        db_session.query(Inflation).filter(Inflation.year == 2097).delete()
+        db_session.commit()
+        inflation_index.invalidate()
+
+
+def test_fallback_skips_gus_errors(gus_stub, db_session):
+    db_session.add(Inflation(year=2095, month=5, value=0.03))
+    db_session.commit()
+    inflation_index.invalidate()
+    try:
+        series = inflation_index.snapshot(db_session)
+        # GUS answers 404 for June 2095, the latest known month is taken
+        value = _resolve_inflation_with_fallback(db_session, series, 2095 * 12 + 5, {})
+        assert value == 0.03
+        assert len(gus_stub) == 1
+        assert inflation_service._unpublished == {}
+    finally:
+        db_session.query(Inflation).filter(Inflation.year == 2095).delete()
+        db_session.commit()
+        inflation_index.invalidate()
+
+
+def test_prefetch_inflation_skips_refused_years(gus_stub, db_session, monkeypatch):
+    monkeypatch.setattr(inflation_service, "gus_rate_limiter", RateLimiter(1, 60))
+    keys = [2096 * 12, 2097 * 12, 2097 * 12 + 5]
+    try:
+        added = prefetch_inflation(db_session, keys)
+
+        assert added == 0
+        assert len(gus_stub) == 1
+        # 2096 is not published, the refused 2097 is asked again later
+        assert set(inflation_service._unpublished) == {2096 * 12}
+    finally:
+        db_session.query(Inflation).filter(Inflation.year == 2097).delete()
+        db_session.commit()
+        inflation_index.invalidate()
+
+
+def test_get_inflation_rate_limited(gus_stub, db_session, monkeypatch):
+    limiter = RateLimiter(1, 60)
+    assert limiter.try_acquire()
+    monkeypatch.setattr(inflation_service, "gus_rate_limiter", limiter)
+
+    with pytest.raises(GusRateLimited) as error:
+        get_inflation(db_session, 6, 2096)
+
+    assert error.value.status_code == 503
+    assert 1 <= int(error.value.headers["Retry-After"]) <= 60
+    assert gus_stub == []
+    assert inflation_service._unpublished == {}
+
+
+def test_get_inflation_error_not_cached_as_unpublished(gus_stub, db_session):
+    with pytest.raises(HTTPException):
+        get_inflation(db_session, 6, 2095)
+    assert inflation_service._unpublished == {}
+
+    # a successful response without the month is cached
+    assert get_inflation(db_session, 6, 2096) is None
+    assert set(inflation_service._unpublished) == {2096 * 12 + 5}
+
+
+def test_rate_limiter_does_not_wait():
+    limiter = RateLimiter(calls=2, period=60)
+
+    assert limiter.try_acquire()
+    assert limiter.try_acquire()
+    assert not limiter.try_acquire(), "Expected third call in window to be denied"
+    assert 0 < limiter.retry_after() <= 60
@@ -1,4 +1,20 @@
-from datetime import datetime, timedelta
+import logging
+from concurrent.futures.process import BrokenProcessPool
+from datetime import UTC, datetime, timedelta
+
+import numpy as np
+import pytest
+from fastapi import HTTPException
+from models import Asset, BondSchedule, Inflation
+from services import bond_pricing_service, inflation_service
+from services.bond_pricing_service import (
+    calculate_bond_scenarios,
+    calculate_value_of_bond,
+    calculate_value_of_bonds,
+)
+from services.inflation_service import inflation_index
+from services.reference_rate_service import reference_rate_index
+from services.valuation_cache import bond_value_cache
 
 BONDS_TO_CALCULATE = {
     "bond_coi": {
@@ -129,3 +145,540 @@ def test_calc_current_value_bonds(client):
         assert data["amount"] == bond_data["amount"], (
             f"Amount before not equal after: before - {data['amount']}, after - {bond_data['amount']}"
         )
+
+
+def test_calc_value_of_bonds_batch_matches_single(db_session):
+    assets = [
+        Asset(
+            isin=bond_data["isin"],
+            name=bond_data["name"],
+            date=datetime(2019, 2, 28, 12, 0) + timedelta(days=17 * i),
+            amount=bond_data["amount"],
+            transaction_price=bond_data["transaction_price"],
+            currency=bond_data["currency"],
+            currency_transaction=bond_data["currency_transaction"],
+            type_=bond_data["type_"],
+            coupon_rate=bond_data["coupon_rate"],
+            inflation_first_year=bond_data["inflation_first_year"],
+        )
+        for i, bond_data in enumerate(BONDS_TO_CALCULATE.values())
+    ]
+
+    values = calculate_value_of_bonds(assets, db=db_session, date="2024-06-01")
+
+    assert len(values) == len(assets)
+    for asset, value in zip(assets, values):
+        expected = calculate_value_of_bond(asset, db=db_session, date="2024-06-01")
+        assert value == expected, f"{asset.isin}: batch {value} != single {expected}"
+
+
+def test_calc_value_of_bond_tos_compounding(db_session):
+    asset = Asset(
+        isin="TOS123456",
+        name="Test TOS Bond",
+        date=datetime(2020, 1, 10),
+        amount=1,
+        transaction_price=100,
+        currency="PLN",
+        currency_transaction="PLN",
+        type_="BOND",
+        coupon_rate=0.04,
+    )
+
+    value = calculate_value_of_bond(asset, db=db_session, date="2022-01-10")
+
+    # two full years of 4% capitalised interest, 19% tax from the gain
+    assert value == pytest.approx(108.16 - 8.16 * 0.19)
+
+
+def test_calc_value_series_bond(client, db_session):
+    asset = Asset(
+        isin="TOS654321",
+        name="Test TOS Bond series",
+        date=datetime(2020, 3, 15, 10, 30),
+        amount=10,
+        transaction_price=1000,
+        currency="PLN",
+        currency_transaction="PLN",
+        type_="BOND",
+        coupon_rate=0.03,
+    )
+    db_session.add(asset)
+    db_session.commit()
+
+    response = client.get(
+        "/assets/calc_value_series",
+        params={"id": asset.id, "start_date": "2020-03-01", "end_date": "2023-06-30"},
+    )
+
+    assert response.status_code == 200, (
+        f"Status: {response.status_code}, Respons: {response.text}"
+    )
+    data = response.json()
+    assert len(data) == 1 and data[0]["id"] == asset.id
+    values = data[0]["values"]
+    assert values[0]["date"] == "2020-03-15", (
+        f"Series should start at purchase date, got {values[0]['date']}"
+    )
+    assert values[-1]["date"] == "2023-06-30"
+
+    for row in values[::97] + values[-1:]:
+        expected = calculate_value_of_bond(asset, db=db_session, date=row["date"])
+        assert row["value"] == expected, (
+            f"{row['date']}: series {row['value']} != single {expected}"
+        )
+
+
+def test_valuation_cache_hits_and_invalidation(client, db_session):
+    asset = Asset(
+        isin="EDO654321",
+        name="Test EDO Bond cache",
+        date=datetime(2015, 6, 10, 9, 0),
+        amount=10,
+        transaction_price=1000,
+        currency="PLN",
+        currency_transaction="PLN",
+        type_="BOND",
+        coupon_rate=0.01,
+        inflation_first_year=0.03,
+    )
+    db_session.add(asset)
+    db_session.commit()
+
+    def stats():
+        response = client.get("/assets/valuation_cache")
+        assert response.status_code == 200, response.text
+        return response.json()
+
+    value = calculate_value_of_bond(asset, db=db_session, date="2018-01-01")
+    before = stats()
+    assert calculate_value_of_bond(asset, db=db_session, date="2018-01-01") == value
+    assert stats()["hits"] == before["hits"] + 1
+
+    # valuation uses inflation of June 2016 and June 2017 only
+    bond_value_cache.invalidate_month(2010, 1)
+    calculate_value_of_bond(asset, db=db_session, date="2018-01-01")
+    assert stats()["hits"] == before["hits"] + 2
+
+    bond_value_cache.invalidate_month(2017, 6)
+    calculate_value_of_bond(asset, db=db_session, date="2018-01-01")
+    assert stats()["misses"] == before["misses"] + 1
+
+    response = client.delete("/assets/delete", params={"asset_id": asset.id})
+    assert response.status_code == 200, response.text
+    assert stats()["size"] == before["size"] - 1
+
+
+def test_valuation_cache_today_is_midnight(db_session):
+    asset = Asset(
+        isin="EDO654321",
+        name="Test EDO Bond today",
+        date=datetime(2015, 6, 10, 9, 0),
+        amount=10,
+        transaction_price=1000,
+        currency="PLN",
+        currency_transaction="PLN",
+        type_="BOND",
+        coupon_rate=0.01,
+        inflation_first_year=0.03,
+    )
+    db_session.add(asset)
+    db_session.commit()
+    try:
+        today = calculate_value_of_bond(asset, db=db_session, date="today")
+        hits = bond_value_cache.stats()["hits"]
+        # "today" is valued at midnight, the same as the date without time
+        date = datetime.now(UTC).strftime("%Y-%m-%d")
+        assert calculate_value_of_bond(asset, db=db_session, date=date) == today
+        assert bond_value_cache.stats()["hits"] == hits + 1
+    finally:
+        db_session.delete(asset)
+        db_session.commit()
+
+
+def test_bond_schedule_built_on_add(client, db_session):
+    response = client.post(
+        "/assets/add",
+        params={
+            "isin": "EDO777777",
+            "name": "Test EDO Bond schedule",
+            "amount": 10,
+            "date": "10.05.2015 12:00",
+            "transaction_price": 1000,
+            "currency": "PLN",
+            "currency_transaction": "PLN",
+            "type_": "BOND",
+            "coupon_rate": 0.01,
+            "inflation_first_year": 0.02,
+        },
+    )
+    assert response.status_code == 200, response.text
+
+    asset = db_session.query(Asset).filter(Asset.isin == "EDO777777").first()
+    rows = (
+        db_session.query(BondSchedule)
+        .filter(BondSchedule.asset_id == asset.id)
+        .order_by(BondSchedule.period)
+        .all()
+    )
+
+    # 10 yearly periods and an empty one starting at maturity
+    assert len(rows) == 11, f"Expected 11 periods, got {len(rows)}"
+    assert rows[0].start_date == datetime(2015, 5, 10, 12, 0)
+    assert rows[0].days == 366
+    assert (rows[0].inflation_year, rows[0].inflation_month) == (None, None)
+    assert (rows[1].inflation_year, rows[1].inflation_month) == (2016, 5)
+    assert rows[-1].start_date == rows[-1].end_date == datetime(2025, 5, 10, 12, 0)
+
+    transient = Asset(
+        isin=asset.isin,
+        name=asset.name,
+        date=asset.date,
+        amount=asset.amount,
+        transaction_price=asset.transaction_price,
+        currency=asset.currency,
+        currency_transaction=asset.currency_transaction,
+        type_=asset.type_,
+        coupon_rate=asset.coupon_rate,
+        inflation_first_year=asset.inflation_first_year,
+    )
+    for date in ["2015-06-01", "2019-05-10", "2022-01-31", "2025-05-10"]:
+        assert calculate_value_of_bond(
+            asset, db=db_session, date=date
+        ) == calculate_value_of_bond(transient, db=db_session, date=date)
+
+
+def test_calc_value_of_bonds_process_pool(db_session, caplog):
+    assets = [
+        Asset(
+            isin=bond_data["isin"],
+            name=bond_data["name"],
+            date=datetime(2016, 7, 1, 8, 0) + timedelta(days=41 * i),
+            amount=bond_data["amount"],
+            transaction_price=bond_data["transaction_price"],
+            currency=bond_data["currency"],
+            currency_transaction=bond_data["currency_transaction"],
+            type_=bond_data["type_"],
+            coupon_rate=bond_data["coupon_rate"],
+            inflation_first_year=bond_data["inflation_first_year"],
+        )
+        for i, bond_data in enumerate(list(BONDS_TO_CALCULATE.values()) * 4)
+    ]
+
+    serial = calculate_value_of_bonds(assets, db=db_session, date="2023-03-01")
+    with caplog.at_level(logging.WARNING, logger=bond_pricing_service.__name__):
+        parallel = calculate_value_of_bonds(
+            assets, db=db_session, date="2023-03-01", workers=2, chunk_size=5
+        )
+
+    assert parallel == serial
+    # valued by the workers, not by the in-process fallback
+    assert not caplog.records
+
+
+class BrokenPool:
+    def submit(self, *args, **kwargs):
+        raise BrokenProcessPool("A child process terminated abruptly")
+
+    def shutdown(self, wait=True, cancel_futures=False):
+        pass
+
+
+def test_calc_value_of_bonds_broken_pool_replaced(db_session, monkeypatch, caplog):
+    assets = [
+        Asset(
+            isin=bond_data["isin"],
+            name=bond_data["name"],
+            date=datetime(2017, 3, 1, 8, 0) + timedelta(days=37 * i),
+            amount=bond_data["amount"],
+            transaction_price=bond_data["transaction_price"],
+            currency=bond_data["currency"],
+            currency_transaction=bond_data["currency_transaction"],
+            type_=bond_data["type_"],
+            coupon_rate=bond_data["coupon_rate"],
+            inflation_first_year=bond_data["inflation_first_year"],
+        )
+        for i, bond_data in enumerate(list(BONDS_TO_CALCULATE.values()) * 3)
+    ]
+    serial = calculate_value_of_bonds(assets, db=db_session, date="2023-03-01")
+    bond_value_cache.clear()
+    monkeypatch.setattr(bond_pricing_service, "_pool", BrokenPool())
+
+    with caplog.at_level(logging.WARNING, logger=bond_pricing_service.__name__):
+        values = calculate_value_of_bonds(
+            assets, db=db_session, date="2023-03-01", workers=2, chunk_size=4
+        )
+
+    assert values == serial
+    assert "pool failed" in caplog.text
+    assert bond_pricing_service._pool is None
+
+
+def test_prefetch_bond_inflation_includes_fallback_window(db_session, monkeypatch):
+    asset = Asset(
+        isin="EDO0134",
+        name="Prefetch EDO",
+        date=datetime(2024, 1, 10),
+        amount=1,
+        transaction_price=100,
+        currency="PLN",
+        currency_transaction="PLN",
+        type_="BOND",
+        coupon_rate=0.015,
+        inflation_first_year=0.068,
+    )
+    asked = []
+    monkeypatch.setattr(
+        bond_pricing_service,
+        "prefetch_inflation",
+        lambda db, keys: asked.extend(int(key) for key in keys),
+    )
+
+    bond_pricing_service._prefetch_bond_inflation(
+        [asset], db_session, datetime(2025, 3, 1)
+    )
+
+    # the only started period begins in January 2025
+    last = 2025 * 12
+    assert set(asked) == set(range(last - 11, last + 1))
+
+
+def test_calc_value_of_bonds_worker_error_raised(db_session):
+    assets = [
+        Asset(
+            isin="XYZ0124",
+            name="Unsupported bond",
+            date=datetime(2020, 1, 10) + timedelta(days=i),
+            amount=1,
+            transaction_price=100,
+            currency="PLN",
+            currency_transaction="PLN",
+            type_="BOND",
+            coupon_rate=0.05,
+        )
+        for i in range(4)
+    ]
+    with pytest.raises(HTTPException) as error:
+        calculate_value_of_bonds(
+            assets, db=db_session, date="2023-03-01", workers=2, chunk_size=2
+        )
+    assert error.value.status_code == 400
+
+
+def test_calc_bonds_value(client):
+    response = client.get(
+        "/assets/calc_bonds_value", params={"date_to_calculate": "2024-01-01"}
+    )
+
+    assert response.status_code == 200, (
+        f"Status: {response.status_code}, Respons: {response.text}"
+    )
+    data = response.json()
+    assert data["total"] == pytest.approx(sum(a["value"] for a in data["assets"]))
+
+
+def test_bond_scenarios_match_history(db_session):
+    assets = [
+        Asset(
+            isin=f"{bond_type}123456",
+            name=f"Test {bond_type} Bond",
+            date=datetime(2015, 4, 20),
+            amount=1,
+            transaction_price=100,
+            currency="PLN",
+            currency_transaction="PLN",
+            type_="BOND",
+            coupon_rate=0.02,
+            inflation_first_year=0.04,
+        )
+        for bond_type in ("COI", "EDO", "ROS", "ROD", "TOS")
+    ]
+    first_month = 2016 * 12
+    history = inflation_index.snapshot(db_session).lookup(
+        np.arange(first_month, 2025 * 12)
+    )
+
+    values = calculate_bond_scenarios(
+        assets,
+        db=db_session,
+        paths=np.tile(history, (3, 1)),
+        first_month=first_month,
+        date="2024-12-01",
+    )
+
+    expected = calculate_value_of_bonds(assets, db=db_session, date="2024-12-01")
+    assert values.shape == (3, len(assets))
+    assert (values == np.array(expected)).all(), f"{values} != {expected}"
+
+
+def test_calc_bonds_scenarios(client, db_session, monkeypatch):
+    # no GUS calls: months after the table are simulated
+    monkeypatch.setattr(inflation_service, "get_inflation_for_year", lambda year: {})
+    monkeypatch.setattr(
+        inflation_service, "get_inflation_for_month", lambda month, year: None
+    )
+    bond = Asset(
+        isin="EDO0134",
+        name="Scenario EDO",
+        date=datetime(2024, 1, 10),
+        amount=10,
+        transaction_price=1000,
+        currency="PLN",
+        currency_transaction="PLN",
+        type_="BOND",
+        coupon_rate=0.07,
+        inflation_first_year=0.0725,
+    )
+    # a stray row far after the published months must not move the paths start
+    stray = Inflation(year=2097, month=7, value=0.5)
+    db_session.add_all([bond, stray])
+    db_session.commit()
+    inflation_index.invalidate()
+    try:
+        response = client.post(
+            "/assets/calc_bonds_scenarios",
+            params={"paths": 200, "seed": 1, "percentiles": "5,50,95", "id": bond.id},
+        )
+
+        assert response.status_code == 200, (
+            f"Status: {response.status_code}, Respons: {response.text}"
+        )
+        data = response.json()
+        assert data["paths"] == 200
+        month, year = map(int, data["paths_start"].split("."))
+        today = datetime.now()
+        assert (year, month) <= (today.year, today.month + 1)
+        assert [row["id"] for row in data["assets"]] == [bond.id]
+        for row in [data["total"]] + data["assets"]:
+            bands = row["percentiles"]
+            assert bands["5"] <= bands["50"] <= bands["95"], f"Unordered bands: {row}"
+    finally:
+        db_session.delete(bond)
+        db_session.delete(stray)
+        db_session.commit()
+        inflation_index.invalidate()
+
+
+def test_last_published_month_contiguous(db_session):
+    last = inflation_service.last_published_month(db_session)
+    year, month = divmod(last, 12)
+    assert inflation_index.get(db_session, month + 1, year) is not None
+    today = datetime.now()
+    assert last <= today.year * 12 + today.month - 1
+
+    stray = Inflation(year=2097, month=8, value=0.5)
+    db_session.add(stray)
+    db_session.commit()
+    inflation_index.invalidate()
+    try:
+        assert inflation_service.last_published_month(db_session) == last
+    finally:
+        db_session.delete(stray)
+        db_session.commit()
+        inflation_index.invalidate()
+
+
+def test_calc_value_of_bond_ror_reference_rate(db_session):
+    asset = Asset(
+        isin="ROR0124",
+        name="Test ROR Bond",
+        date=datetime(2024, 1, 10),
+        amount=1,
+        transaction_price=100,
+        currency="PLN",
+        currency_transaction="PLN",
+        type_="BOND",
+        coupon_rate=0.001,
+        inflation_first_year=0.06,
+    )
+
+    value = calculate_value_of_bond(asset, db=db_session, date="2024-04-10")
+
+    # first month fixed, next two at reference rate + margin, taxed every month
+    february = reference_rate_index.get(db_session, 2, 2024) + 0.001
+    march = reference_rate_index.get(db_session, 3, 2024) + 0.001
+    interest = 0.06 * 31 + february * 29 + march * 31
+    assert value == pytest.approx(100 + 100 * interest / 365.25 * (1 - 0.19))
+
+
+def test_calc_portfolio_value(client, db_session):
+    bond = Asset(
+        isin="EDO0133",
+        name="Portfolio EDO",
+        date=datetime(2023, 1, 10),
+        amount=10,
+        transaction_price=1000,
+        currency="PLN",
+        currency_transaction="PLN",
+        type_="BOND",
+        coupon_rate=0.07,
+        inflation_first_year=0.0725,
+    )
+    deposit = Asset(
+        isin="DEPOSIT01",
+        name="Portfolio deposit",
+        date=datetime(2023, 2, 1),
+        amount=1,
+        transaction_price=500,
+        currency="PLN",
+        currency_transaction="PLN",
+        type_="DEPOSIT",
+    )
+    unknown_equity = Asset(
+        isin="ZZ0000000001",
+        name="Portfolio unknown equity",
+        date=datetime(2023, 3, 1),
+        amount=1,
+        transaction_price=100,
+        currency="USD",
+        currency_transaction="PLN",
+        type_="EQUITIES",
+    )
+    later = Asset(
+        isin="DEPOSIT02",
+        name="Portfolio later deposit",
+        date=datetime(2024, 6, 1),
+        amount=1,
+        transaction_price=100,
+        currency="PLN",
+        currency_transaction="PLN",
+        type_="DEPOSIT",
+    )
+    assets = [bond, deposit, unknown_equity, later]
+    db_session.add_all(assets)
+    db_session.commit()
+
+    try:
+        response = client.get(
+            "/assets/calc_portfolio_value", params={"date_to_calculate": "2024-01-01"}
+        )
+        assert response.status_code == 200, (
+            f"Status: {response.status_code}, Respons: {response.text}"
+        )
+        data = response.json()
+        rows = {row["id"]: row for row in data["assets"]}
+
+        assert later.id not in rows, "Asset bought after the date should be skipped"
+        assert rows[bond.id]["value"] == pytest.approx(
+            calculate_value_of_bond(bond, db_session, "2024-01-01")
+        )
+        assert rows[deposit.id]["value"] == 500
+        assert rows[unknown_equity.id]["value"] is None
+        assert "no symbol" in rows[unknown_equity.id]["error"]
+
+        valued = [row for row in data["assets"] if row["value"] is not None]
+        assert data["error_count"] == len(data["assets"]) - len(valued)
+        assert data["totals"]["by_currency"]["PLN"] == pytest.approx(
+            sum(row["value"] for row in valued if row["currency"] == "PLN")
+        )
+        assert data["totals"]["by_type"]["DEPOSIT"]["PLN"] == pytest.approx(
+            sum(
+                row["value"]
+                for row in valued
+                if row["type"] == "DEPOSIT" and row["currency"] == "PLN"
+            )
+        )
+    finally:
+        for asset in assets:
+            db_session.delete(asset)
+        db_session.commit()
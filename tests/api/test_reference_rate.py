@@ -1,4 +1,5 @@
 from models import Reference_Rate
+from services.reference_rate_service import reference_rate_index
 
 
 def test_reference_rate_list(client):
@@ -77,3 +78,28 @@ def test_add_reference_rate_duplicate(client, db_session):
     assert response.status_code == 400, (
         f"Expected 400 for duplicate entry, got {response.status_code}. Response: {response.text}"
     )
+
+
+def test_reference_rate_index_refreshed_on_add_and_delete(client, db_session):
+    response = client.post(
+        "/reference_rate/add", params={"month": 6, "year": 2097, "value": 0.11}
+    )
+    assert response.status_code == 200, (
+        f"Expected 200, got {response.status_code}. Response: {response.text}"
+    )
+    assert reference_rate_index.get(db_session, 6, 2097) == 0.11, (
+        "Reference rate index not refreshed after add"
+    )
+    # the rate holds until the next change
+    assert reference_rate_index.get(db_session, 9, 2097) == 0.11
+
+    record = db_session.query(Reference_Rate).filter_by(month=6, year=2097).first()
+    response = client.delete(
+        "/reference_rate/delete", params={"reference_rate_id": record.id}
+    )
+    assert response.status_code == 200, (
+        f"Expected 200, got {response.status_code}. Response: {response.text}"
+    )
+    assert reference_rate_index.get(db_session, 6, 2097) != 0.11, (
+        "Reference rate index not refreshed after delete"
+    )
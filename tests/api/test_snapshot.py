@@ -0,0 +1,156 @@
+import json
+import os
+from datetime import datetime
+
+import pytest
+from db import Base, SessionLocal
+from models import Equity, Forex, Inflation, Reference_Rate
+from services import bootstrap_service
+from services.forex_index import forex_index
+from services.snapshot_service import export_snapshot, import_snapshot
+from sqlalchemy import create_engine
+from sqlalchemy.pool import StaticPool
+
+
+def _memory_session():
+    engine = create_engine("sqlite://", poolclass=StaticPool)
+    Base.metadata.create_all(bind=engine)
+    return SessionLocal(bind=engine)
+
+
+def _seed(db):
+    db.add_all(
+        [
+            Inflation(year=2024, month=1, value=0.037),
+            Reference_Rate(year=2024, month=1, value=0.0575),
+            Equity(symbol="AAA", isin="XS0000000001", name="A", currency="USD"),
+            Equity(symbol="BBB", name="B"),
+            Forex(
+                first_currency="USD",
+                second_currency="PLN",
+                value=4.0,
+                date=datetime(2024, 1, 2),
+            ),
+            Forex(
+                first_currency="USD",
+                second_currency="PLN",
+                value=None,
+                date=datetime(2024, 1, 3),
+            ),
+        ]
+    )
+    db.commit()
+
+
+def test_snapshot_round_trip(tmp_path):
+    source = _memory_session()
+    target = _memory_session()
+    try:
+        _seed(source)
+        manifest = export_snapshot(source, str(tmp_path))
+        assert manifest["version"] == 1
+        assert manifest["tables"]["forex"] == {"file": "forex.parquet", "rows": 2}
+        assert os.path.exists(tmp_path / "equities.parquet")
+
+        assert import_snapshot(target, str(tmp_path)) == {
+            "inflation": 1,
+            "reference_rate": 1,
+            "equities": 2,
+            "forex": 2,
+        }
+        equities = target.query(Equity).order_by(Equity.symbol).all()
+        assert [(e.symbol, e.isin, e.currency) for e in equities] == [
+            ("AAA", "XS0000000001", "USD"),
+            ("BBB", None, None),
+        ]
+        rates = target.query(Forex).order_by(Forex.date).all()
+        assert [(r.date, r.value) for r in rates] == [
+            (datetime(2024, 1, 2), 4.0),
+            (datetime(2024, 1, 3), None),
+        ]
+        assert target.query(Inflation.value).scalar() == 0.037
+
+        # tables with rows are not seeded again
+        assert set(import_snapshot(target, str(tmp_path)).values()) == {0}
+        assert target.query(Forex).count() == 2
+    finally:
+        source.close()
+        target.close()
+        forex_index.invalidate()
+
+
+def test_snapshot_version_checked(tmp_path):
+    db = _memory_session()
+    try:
+        export_snapshot(db, str(tmp_path))
+        manifest = json.loads((tmp_path / "manifest.json").read_text())
+        manifest["version"] = 99
+        (tmp_path / "manifest.json").write_text(json.dumps(manifest))
+
+        with pytest.raises(ValueError, match="Unsupported snapshot version 99"):
+            import_snapshot(db, str(tmp_path))
+    finally:
+        db.close()
+
+
+def test_bootstrap_seeds_from_snapshot(tmp_path, monkeypatch):
+    source = _memory_session()
+    target = _memory_session()
+    try:
+        _seed(source)
+        export_snapshot(source, str(tmp_path))
+
+        monkeypatch.setattr(bootstrap_service, "SNAPSHOT_PATH", str(tmp_path))
+        monkeypatch.setattr(bootstrap_service, "SessionLocal", lambda: target)
+        monkeypatch.setattr(
+            bootstrap_service, "_state", bootstrap_service.initial_state()
+        )
+        monkeypatch.setattr(
+            bootstrap_service,
+            "DATASETS",
+            {
+                name: (model, lambda db: None)
+                for name, (model, _) in bootstrap_service.DATASETS.items()
+            },
+        )
+
+        bootstrap_service.load_datasets()
+
+        state = bootstrap_service.readiness(target)
+        assert state["ready"] is True
+        assert state["datasets"]["equities"]["snapshot_rows"] == 2
+    finally:
+        source.close()
+        target.close()
+        forex_index.invalidate()
+
+
+def test_bootstrap_loads_despite_broken_snapshot(tmp_path, monkeypatch):
+    db = _memory_session()
+    loaded = []
+
+    def load(db):
+        loaded.append(True)
+        db.add(Inflation(year=2024, month=1, value=0.037))
+        db.commit()
+
+    try:
+        # no manifest in the snapshot directory
+        monkeypatch.setattr(bootstrap_service, "SNAPSHOT_PATH", str(tmp_path))
+        monkeypatch.setattr(bootstrap_service, "SessionLocal", lambda: db)
+        monkeypatch.setattr(
+            bootstrap_service, "_state", bootstrap_service.initial_state()
+        )
+        monkeypatch.setattr(
+            bootstrap_service, "DATASETS", {"inflation": (Inflation, load)}
+        )
+
+        bootstrap_service.load_datasets()
+
+        state = bootstrap_service.readiness(db)
+        assert loaded == [True]
+        assert state["datasets"]["inflation"]["status"] == "ready"
+        assert state["datasets"]["inflation"]["loaded"] is True
+        assert "manifest.json" in state["datasets"]["inflation"]["snapshot_error"]
+    finally:
+        db.close()